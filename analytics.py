@@ -0,0 +1,192 @@
+#----------------------------------------------------------------------------#
+# Analytics.
+#----------------------------------------------------------------------------#
+
+# Rollup tables are kept current by ORM listeners on Show; dashboards only
+# ever read the rollups.
+
+from extensions import db
+from models import Venue, Artist, Show, ShowArchive, ShowCountByCity, ShowCountByGenre, ShowCountByMonth
+from helpers import on_patch
+import shards
+
+def upsert_insert(connection):
+  # the dialect's insert() with on_conflict_do_update(), if it has one
+  if connection.dialect.name == 'postgresql':
+    from sqlalchemy.dialects.postgresql import insert
+  elif connection.dialect.name == 'sqlite':
+    from sqlalchemy.dialects.sqlite import insert
+  else:
+    return None
+  return insert
+
+def bump_rollup(connection, model, delta, **key):
+  # add <delta> to one rollup row, creating it on first use. The first two
+  # shows of a new key can be counted at once, so rows are created with an
+  # upsert rather than an INSERT after an UPDATE that found nothing.
+  table = model.__table__
+  insert = upsert_insert(connection)
+  if delta > 0 and insert is not None:
+    connection.execute(
+      insert(table).values(count=delta, **key)
+        .on_conflict_do_update(index_elements=list(key), set_={'count': table.c.count + delta})
+    )
+    return
+  criteria = [table.c[column] == value for column, value in key.items()]
+  updated = connection.execute(
+    table.update().where(*criteria).values(count=table.c.count + delta)
+  ).rowcount
+  if not updated and delta > 0:
+    connection.execute(table.insert().values(count=delta, **key))
+
+def split_genres(genres):
+  return [genre for genre in (genres or '').split(', ') if genre]
+
+def rollup_keys(connection, venue_id, artist_id, start_time):
+  # the city, genres and month a show is counted under
+  venue = connection.execute(
+    db.select(Venue.city, Venue.state).where(Venue.id == venue_id)
+  ).first()
+  genres_query = db.select(Artist.genres).where(Artist.id == artist_id)
+  if shards.enabled():
+    # the show is flushed to a shard; artists live on the main database
+    with db.engine.connect() as main:
+      genres = main.execute(genres_query).scalar()
+  else:
+    genres = connection.execute(genres_query).scalar()
+  cities = [(venue.city, venue.state)] if venue is not None else []
+  genres = split_genres(genres)
+  month = start_time.date().replace(day=1)
+  return cities, genres, month
+
+def update_rollups(connection, show, delta):
+  cities, genres, month = rollup_keys(connection, show.venue_id, show.artist_id, show.start_time)
+  for city, state in cities:
+    bump_rollup(connection, ShowCountByCity, delta, city=city, state=state)
+  for genre in genres:
+    bump_rollup(connection, ShowCountByGenre, delta, genre=genre)
+  bump_rollup(connection, ShowCountByMonth, delta, month=month)
+
+def delete_archived_shows(**criteria):
+  # archived shows go with their venue or artist. They are counted like
+  # current shows, so they are uncounted first; call before the venue or
+  # artist itself is deleted, on the shard the archive rows live on.
+  connection = db.session.connection(bind_arguments={'mapper': ShowArchive})
+  for show in ShowArchive.query.filter_by(**criteria):
+    update_rollups(connection, show, -1)
+  ShowArchive.query.filter_by(**criteria).delete(synchronize_session=False)
+
+@db.event.listens_for(Show, 'after_insert')
+def count_created_show(mapper, connection, show):
+  update_rollups(connection, show, 1)
+
+@db.event.listens_for(Show, 'after_delete')
+def count_deleted_show(mapper, connection, show):
+  update_rollups(connection, show, -1)
+
+def count_shows(connection, **key):
+  # current and archived shows with the given venue_id or artist_id
+  count = 0
+  for table in (Show.__table__, ShowArchive.__table__):
+    criteria = [table.c[column] == value for column, value in key.items()]
+    count += connection.execute(db.select(db.func.count()).select_from(table).where(*criteria)).scalar()
+  return count
+
+@on_patch
+def move_rollups(model, record, changes):
+  # shows are counted under their venue's city and their artist's genres;
+  # when those are edited, the counts move along
+  if model is Venue and ('city' in changes or 'state' in changes):
+    old = (record.city, record.state)
+    new = (changes.get('city', record.city), changes.get('state', record.state))
+    # on the venue's shard, where its shows are
+    connection = db.session.connection(bind_arguments={'mapper': Show})
+    count = count_shows(connection, venue_id=record.id)
+    if count and old != new:
+      bump_rollup(connection, ShowCountByCity, -count, city=old[0], state=old[1])
+      bump_rollup(connection, ShowCountByCity, count, city=new[0], state=new[1])
+  elif model is Artist and 'genres' in changes:
+    old = set(split_genres(record.genres))
+    new = set(split_genres(changes['genres']))
+    def move():
+      connection = db.session.connection(bind_arguments={'mapper': Show})
+      count = count_shows(connection, artist_id=record.id)
+      if count:
+        for genre in old - new:
+          bump_rollup(connection, ShowCountByGenre, -count, genre=genre)
+        for genre in new - old:
+          bump_rollup(connection, ShowCountByGenre, count, genre=genre)
+    # the artist's shows may be on every shard
+    shards.fan_out(move)
+
+def rebuild_rollups(connection, artist_genres=None):
+  # recount every rollup from Show and ShowArchive in one transaction. On a
+  # shard, artist_genres ({artist id: genres}) comes from the main database.
+  by_city = dict()
+  by_genre = dict()
+  by_month = dict()
+  for table in (Show.__table__, ShowArchive.__table__):
+    if artist_genres is None:
+      query = db.select(Venue.city, Venue.state, Artist.genres, table.c.start_time) \
+        .select_from(table) \
+        .outerjoin(Venue.__table__, Venue.id == table.c.venue_id) \
+        .outerjoin(Artist.__table__, Artist.id == table.c.artist_id)
+    else:
+      query = db.select(Venue.city, Venue.state, table.c.artist_id, table.c.start_time) \
+        .select_from(table) \
+        .outerjoin(Venue.__table__, Venue.id == table.c.venue_id)
+    rows = connection.execute(query.execution_options(yield_per=1000))
+    for city, state, genres, start_time in rows:
+      if artist_genres is not None:
+        genres = artist_genres.get(genres)
+      if city is not None:
+        by_city[(city, state)] = by_city.get((city, state), 0) + 1
+      for genre in (genres or '').split(', '):
+        if genre:
+          by_genre[genre] = by_genre.get(genre, 0) + 1
+      month = start_time.date().replace(day=1)
+      by_month[month] = by_month.get(month, 0) + 1
+
+  for model in (ShowCountByCity, ShowCountByGenre, ShowCountByMonth):
+    connection.execute(model.__table__.delete())
+  if by_city:
+    connection.execute(ShowCountByCity.__table__.insert(), [
+      {'city': city, 'state': state, 'count': count} for (city, state), count in by_city.items()
+    ])
+  if by_genre:
+    connection.execute(ShowCountByGenre.__table__.insert(), [
+      {'genre': genre, 'count': count} for genre, count in by_genre.items()
+    ])
+  if by_month:
+    connection.execute(ShowCountByMonth.__table__.insert(), [
+      {'month': month, 'count': count} for month, count in by_month.items()
+    ])
+
+def rollup_counts(model, *key):
+  # {key: count} summed over every shard
+  counts = dict()
+  columns = [getattr(model, column) for column in key]
+  for rows in shards.fan_out(lambda: db.session.query(*columns, model.count).filter(model.count > 0).all()):
+    for row in rows:
+      counts[row[:-1]] = counts.get(row[:-1], 0) + row[-1]
+  return counts
+
+def analytics_data():
+  # dashboards read only the rollup tables, never Show itself
+  data = dict()
+  by_city = rollup_counts(ShowCountByCity, 'city', 'state')
+  data['by_city'] = [
+    {'city': city, 'state': state, 'count': count}
+    for (city, state), count in sorted(by_city.items(), key=lambda item: (-item[1], item[0][0]))
+  ]
+  by_genre = rollup_counts(ShowCountByGenre, 'genre')
+  data['by_genre'] = [
+    {'genre': genre, 'count': count}
+    for (genre,), count in sorted(by_genre.items(), key=lambda item: (-item[1], item[0][0]))
+  ]
+  by_month = rollup_counts(ShowCountByMonth, 'month')
+  data['by_month'] = [
+    {'month': month.strftime('%Y-%m'), 'count': count}
+    for (month,), count in sorted(by_month.items())
+  ]
+  return data
@@ -0,0 +1,55 @@
+"""Measure worker cold start in fresh interpreters.
+
+Reports the median time to import the app module, to run create_app() and
+to serve the first request, and lists heavy modules that were imported
+eagerly (they should only load when a request or command needs them).
+
+  python bench_startup.py [-n 10] [--database-uri sqlite://]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ('numpy', 'scipy', 'babel.dates', 'dateutil.parser')
+
+SNIPPET = '''
+import json, sys, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+application = app.create_app({'SQLALCHEMY_DATABASE_URI': %(uri)r})
+t2 = time.perf_counter()
+application.test_client().get('/')
+t3 = time.perf_counter()
+print(json.dumps({
+  'import': t1 - t0,
+  'create_app': t2 - t1,
+  'first_request': t3 - t2,
+  'heavy': [name for name in %(heavy)r if name in sys.modules],
+}))
+'''
+
+
+def run_once(uri):
+  code = SNIPPET % {'uri': uri, 'heavy': HEAVY_MODULES}
+  output = subprocess.check_output([sys.executable, '-c', code])
+  return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('-n', type=int, default=10, help='number of cold starts')
+  parser.add_argument('--database-uri', default='sqlite://')
+  args = parser.parse_args()
+
+  runs = [run_once(args.database_uri) for _ in range(args.n)]
+  for phase in ('import', 'create_app', 'first_request'):
+    print('%-14s %7.1f ms' % (phase, statistics.median(run[phase] for run in runs) * 1000))
+  heavy = sorted(set(name for run in runs for name in run['heavy']))
+  print('eager heavy imports: %s' % (', '.join(heavy) or 'none'))
+
+
+if __name__ == '__main__':
+  main()
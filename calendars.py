@@ -0,0 +1,227 @@
+#----------------------------------------------------------------------------#
+# iCalendar feeds of upcoming shows.
+#
+# /venues/<id>/calendar.ics and /artists/<id>/calendar.ics are polled by
+# calendar clients every few minutes, so each feed is rendered once and kept
+# with its ETag until something it was built from changes: one of its shows,
+# the venue or artist itself, or a venue or artist named in one of its
+# events. A new show invalidates the feeds of its venue and artist. Feeds are
+# also rebuilt after CALENDAR_CACHE_TTL seconds, which bounds how long edits
+# made by other worker processes go unseen and drops shows that have started.
+# Each app has its own cache; feed_cache is the one of the current app.
+#----------------------------------------------------------------------------#
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import current_app, request, url_for, Response, abort
+from werkzeug.local import LocalProxy
+
+from extensions import db
+from models import Venue, Artist, Show, upcoming_shows
+from entities import entity_cache
+from changes import on_change, on_flush
+import shards
+
+PRODID = '-//Fyyur//Upcoming shows//EN'
+# shows have no end time; events get a nominal length so clients show a block
+SHOW_HOURS = 2
+
+
+class FeedCache(object):
+
+  def __init__(self, max_feeds=2000, ttl=3600):
+    self.max_feeds = max_feeds
+    self.ttl = ttl
+    self.feeds = OrderedDict()
+    # (model name, id) -> keys of the feeds built from that row
+    self.dependents = dict()
+    self.lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+
+  def get(self, key):
+    with self.lock:
+      feed = self.feeds.get(key)
+      if feed is not None and time.monotonic() - feed['built'] <= self.ttl:
+        self.feeds.move_to_end(key)
+        self.hits += 1
+        return feed
+      self.misses += 1
+      return None
+
+  def put(self, key, feed, depends_on):
+    with self.lock:
+      self.discard(key)
+      feed['depends_on'] = depends_on
+      self.feeds[key] = feed
+      for dependency in depends_on:
+        self.dependents.setdefault(dependency, set()).add(key)
+      while len(self.feeds) > self.max_feeds:
+        self.discard(next(iter(self.feeds)))
+
+  def discard(self, key):
+    # the caller holds the lock
+    feed = self.feeds.pop(key, None)
+    if feed is None:
+      return
+    for dependency in feed['depends_on']:
+      keys = self.dependents.get(dependency)
+      if keys is not None:
+        keys.discard(key)
+        if not keys:
+          del self.dependents[dependency]
+
+  def invalidate(self, dependency):
+    with self.lock:
+      for key in list(self.dependents.get(dependency, ())):
+        self.discard(key)
+
+  def clear(self):
+    with self.lock:
+      self.feeds.clear()
+      self.dependents.clear()
+
+  def metrics(self):
+    return {
+      'fyyur_calendar_feed_hits_total': self.hits,
+      'fyyur_calendar_feed_misses_total': self.misses,
+      'fyyur_calendar_feeds': len(self.feeds),
+    }
+
+feed_cache = LocalProxy(lambda: current_app.extensions['feed_cache'])
+
+@on_change
+def invalidate_feeds(changes):
+  new_shows = []
+  for entity, id, action in changes:
+    feed_cache.invalidate((entity, id))
+    if entity == 'Show' and action != 'deleted':
+      new_shows.append(id)
+  if new_shows:
+    owners = shards.gather(lambda: db.session.query(Show.venue_id, Show.artist_id).filter(Show.id.in_(new_shows)).all())
+    for venue_id, artist_id in owners:
+      feed_cache.invalidate(('Venue', venue_id))
+      feed_cache.invalidate(('Artist', artist_id))
+
+@on_flush
+def flush_feeds():
+  feed_cache.clear()
+
+#  Rendering
+#  ----------------------------------------------------------------
+
+def escape(value):
+  return (value or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+def fold(line):
+  # content lines are limited to 75 octets; continuation lines start with a space
+  data = line.encode('utf-8')
+  if len(data) <= 75:
+    return line
+  parts = []
+  while data:
+    limit = 75 if not parts else 74
+    cut = min(limit, len(data))
+    # never split a multi-byte character
+    while cut < len(data) and (data[cut] & 0xC0) == 0x80:
+      cut -= 1
+    parts.append(data[:cut].decode('utf-8'))
+    data = data[cut:]
+  return '\r\n '.join(parts)
+
+def ics_time(value):
+  # start times are stored without a zone, so they are written as floating
+  # local times
+  return value.strftime('%Y%m%dT%H%M%S')
+
+def render_calendar(name, events):
+  stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+  lines = [
+    'BEGIN:VCALENDAR',
+    'VERSION:2.0',
+    'PRODID:' + PRODID,
+    'CALSCALE:GREGORIAN',
+    'X-WR-CALNAME:' + escape(name),
+  ]
+  for event in events:
+    lines.extend([
+      'BEGIN:VEVENT',
+      'UID:show-%d@fyyur' % event['id'],
+      'DTSTAMP:' + stamp,
+      'DTSTART:' + ics_time(event['start_time']),
+      'DURATION:PT%dH' % SHOW_HOURS,
+      'SUMMARY:' + escape(event['summary']),
+      'LOCATION:' + escape(event['location']),
+      'URL:' + event['url'],
+      'END:VEVENT',
+    ])
+  lines.append('END:VCALENDAR')
+  return '\r\n'.join(fold(line) for line in lines) + '\r\n'
+
+def feed_etag(body):
+  # DTSTAMP is the time the feed was rendered; leave it out so a rebuilt feed
+  # with the same events keeps its ETag and clients still get a 304
+  lines = [line for line in body.split(b'\r\n') if not line.startswith(b'DTSTAMP:')]
+  return hashlib.sha1(b'\r\n'.join(lines)).hexdigest()
+
+def build_feed(model, id):
+  # (ics text, rows it depends on), or None when there is no such venue/artist
+  owner = entity_cache.get(model, id)
+  if owner is None:
+    return None
+  if model is Venue:
+    with shards.for_venue(id):
+      shows = upcoming_shows(venue_id=id).all()
+  else:
+    shows = sorted(shards.gather(lambda: upcoming_shows(artist_id=id).all()), key=lambda show: show.start_time)
+  venues = entity_cache.get_many(Venue, [show.venue_id for show in shows])
+  artists = entity_cache.get_many(Artist, [show.artist_id for show in shows])
+
+  depends_on = set([(model.__name__, id)])
+  events = []
+  for show in shows:
+    venue = venues.get(show.venue_id)
+    artist = artists.get(show.artist_id)
+    if venue is None or artist is None:
+      continue
+    depends_on.update([('Show', show.id), ('Venue', venue['id']), ('Artist', artist['id'])])
+    events.append({
+      'id': show.id,
+      'start_time': show.start_time,
+      'summary': '%s at %s' % (artist['name'], venue['name']),
+      'location': ', '.join(part for part in (venue['name'], venue['address'], venue['city'], venue['state']) if part),
+      'url': url_for('artists.show_artist', artist_id=artist['id'], _external=True) if model is Venue
+        else url_for('venues.show_venue', venue_id=venue['id'], _external=True),
+    })
+  return render_calendar('%s on Fyyur' % owner['name'], events), depends_on
+
+def calendar_response(model, id):
+  key = (model.__name__, id)
+  feed = feed_cache.get(key)
+  if feed is None:
+    built = build_feed(model, id)
+    if built is None:
+      abort(404)
+    body, depends_on = built
+    body = body.encode('utf-8')
+    feed = {
+      'body': body,
+      'etag': feed_etag(body),
+      'built': time.monotonic(),
+      'last_modified': datetime.utcnow(),
+    }
+    feed_cache.put(key, feed, depends_on)
+
+  response = Response(feed['body'], mimetype='text/calendar')
+  response.set_etag(feed['etag'])
+  response.last_modified = feed['last_modified']
+  response.cache_control.public = True
+  response.cache_control.max_age = current_app.config.get('CALENDAR_MAX_AGE', 300)
+  return response.make_conditional(request)
+
+def init_app(app):
+  app.extensions['feed_cache'] = FeedCache(app.config.get('CALENDAR_CACHE_SIZE', 2000), app.config.get('CALENDAR_CACHE_TTL', 3600))
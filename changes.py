@@ -0,0 +1,140 @@
+#----------------------------------------------------------------------------#
+# Change tracking.
+#----------------------------------------------------------------------------#
+
+from flask import current_app
+
+from extensions import db
+from models import ChangeLog
+
+# In-process derived state (indexes, caches) subscribes with @on_change and
+# is told about every Venue/Artist/Show row a request created, updated or
+# deleted, once that request's transaction has committed.
+#
+# The same changes are written to ChangeLog inside the writing transaction,
+# for the /api/changes feed. On PostgreSQL each row carries the writing
+# transaction id; the feed is ordered by (txid, id) and only returns rows of
+# transactions older than every transaction still running, so a row that
+# commits late can never land behind a cursor a client already holds.
+#
+# Changes committed by other worker processes arrive over the invalidation
+# bus (invalidation.py) and go to the same listeners. When a process may have
+# missed some, the @on_flush callbacks drop everything derived instead.
+TRACKED_MODELS = ('Venue', 'Artist', 'Show')
+change_listeners = []
+flush_listeners = []
+# called with the changes committed in this process, after the listeners
+change_publishers = []
+
+def on_change(func):
+  # func(changes) receives a list of (model name, id, action) tuples
+  change_listeners.append(func)
+  return func
+
+def on_flush(func):
+  # func() forgets all cached state
+  flush_listeners.append(func)
+  return func
+
+def log_changes(connection, changes, shows=None):
+  # shows: {show id: (venue id, artist id)} of the Show changes
+  if not changes:
+    return
+  shows = shows or {}
+  txid = db.func.txid_current() if connection.dialect.name == 'postgresql' else 0
+  rows = []
+  for entity, id, action in changes:
+    venue_id, artist_id = shows.get(id, (None, None)) if entity == 'Show' else (None, None)
+    rows.append({'entity': entity, 'entity_id': id, 'action': action, 'venue_id': venue_id, 'artist_id': artist_id})
+  connection.execute(ChangeLog.__table__.insert().values(txid=txid), rows)
+
+def record_change(entity, id, action):
+  # for writes that bypass the ORM unit of work, e.g. patch_record()
+  db.session.info.setdefault('pending_changes', []).append((entity, id, action))
+  log_changes(db.session.connection(), [(entity, id, action)])
+
+@db.event.listens_for(db.session, 'after_flush')
+def track_flushed_changes(session, flush_context):
+  flushed = []
+  shows = dict()
+  for action, objects in (('created', session.new), ('updated', session.dirty), ('deleted', session.deleted)):
+    for obj in objects:
+      entity = type(obj).__name__
+      if entity in TRACKED_MODELS and (action != 'updated' or session.is_modified(obj)):
+        flushed.append((entity, obj.id, action))
+        if entity == 'Show':
+          shows[obj.id] = (obj.venue_id, obj.artist_id)
+  session.info.setdefault('pending_changes', []).extend(flushed)
+  log_changes(session.connection(), flushed, shows)
+
+@db.event.listens_for(db.session, 'after_commit')
+def track_committed_changes(session):
+  session.info.setdefault('committed_changes', []).extend(session.info.pop('pending_changes', []))
+
+@db.event.listens_for(db.session, 'after_rollback')
+def forget_rolled_back_changes(session):
+  session.info.pop('pending_changes', None)
+
+def encode_cursor(txid, id):
+  return '%d-%d' % (txid, id)
+
+def decode_cursor(cursor):
+  # raises ValueError for a malformed cursor
+  txid, id = cursor.split('-')
+  return int(txid), int(id)
+
+def read_changes(since=None, limit=500, entity=None):
+  # ([ChangeLog], cursor for the next page) after cursor `since`, of one
+  # entity or all
+  query = ChangeLog.query
+  if entity:
+    query = query.filter(ChangeLog.entity == entity)
+  if since:
+    txid, id = decode_cursor(since)
+    query = query.filter(db.or_(
+      ChangeLog.txid > txid,
+      db.and_(ChangeLog.txid == txid, ChangeLog.id > id)
+    ))
+  if db.session.get_bind().dialect.name == 'postgresql':
+    query = query.filter(ChangeLog.txid < db.func.txid_snapshot_xmin(db.func.txid_current_snapshot()))
+  rows = query.order_by(ChangeLog.txid, ChangeLog.id).limit(limit).all()
+  if rows:
+    since = encode_cursor(rows[-1].txid, rows[-1].id)
+  return rows, since
+
+def latest_cursor():
+  # the cursor of the newest readable change, to follow the feed from now on
+  query = ChangeLog.query
+  if db.session.get_bind().dialect.name == 'postgresql':
+    query = query.filter(ChangeLog.txid < db.func.txid_snapshot_xmin(db.func.txid_current_snapshot()))
+  row = query.order_by(ChangeLog.txid.desc(), ChangeLog.id.desc()).first()
+  return encode_cursor(row.txid, row.id) if row else None
+
+def notify_listeners(changes, listeners=None):
+  for listener in (change_listeners if listeners is None else listeners):
+    try:
+      listener(changes)
+    except Exception:
+      current_app.logger.exception('change listener %s failed', listener.__name__)
+
+def flush_all():
+  for listener in flush_listeners:
+    try:
+      listener()
+    except Exception:
+      current_app.logger.exception('flush listener %s failed', listener.__name__)
+
+def dispatch_changes():
+  # hand committed changes to the listeners; the session is usable again here
+  changes = db.session.info.pop('committed_changes', None)
+  if not changes:
+    return
+  notify_listeners(changes)
+  notify_listeners(changes, change_publishers)
+
+def dispatch_request_changes(response):
+  dispatch_changes()
+  return response
+
+def init_app(app):
+  app.after_request(dispatch_request_changes)
@@ -0,0 +1,233 @@
+#----------------------------------------------------------------------------#
+# Command line.
+#----------------------------------------------------------------------------#
+
+# Maintenance commands, registered on the app's `flask` CLI by init_app().
+# Heavy modules are imported inside the commands that need them.
+
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup, with_appcontext
+
+from extensions import db, jobs
+from jobs import Worker
+import shards
+
+#  Analytics
+#  ----------------------------------------------------------------
+
+analytics_cli = AppGroup('analytics', help='Maintain the analytics rollups.')
+
+@analytics_cli.command('rebuild')
+def analytics_rebuild():
+  # full recount, e.g. after a bulk import that bypassed the ORM
+  from analytics import rebuild_rollups
+  if not shards.enabled():
+    with db.engine.begin() as conn:
+      rebuild_rollups(conn)
+  else:
+    from models import Artist
+    artist_genres = dict(db.session.query(Artist.id, Artist.genres))
+    for name, engine in shards.engines():
+      with engine.begin() as conn:
+        rebuild_rollups(conn, artist_genres)
+  click.echo('analytics rollups rebuilt')
+
+#  Recommendations
+#  ----------------------------------------------------------------
+
+artists_cli = AppGroup('artists', help='Artist batch commands.')
+
+@artists_cli.command('similar')
+@click.option('--k', default=10, help='Neighbours stored per artist.')
+@click.option('--block-size', default=256, help='Artists scored per matrix block.')
+@click.option('--genre-weight', default=0.5, help='Weight of genre similarity.')
+@click.option('--venue-weight', default=0.5, help='Weight of venue co-occurrence.')
+def artists_similar(k, block_size, genre_weight, venue_weight):
+  # rebuild the whole similar-artist table
+  from similarity import load_artist_vectors, store_similar_artists
+  vectors = load_artist_vectors()
+  results = vectors.top_k(k=k, genre_weight=genre_weight, venue_weight=venue_weight, block_size=block_size)
+  count = store_similar_artists(results)
+  click.echo('similar artists computed for %d artists' % count)
+
+#  Background jobs
+#  ----------------------------------------------------------------
+
+jobs_cli = AppGroup('jobs', help='Run and inspect background jobs.')
+
+@jobs_cli.command('work')
+@click.option('--threads', default=4, help='Number of jobs run concurrently.')
+@click.option('--poll-interval', default=1.0, help='Seconds to wait when the queue is empty.')
+def jobs_work(threads, poll_interval):
+  # long-running worker process
+  Worker(jobs, threads=threads, poll_interval=poll_interval).serve()
+
+@jobs_cli.command('run-pending')
+def jobs_run_pending():
+  # run every due job in this process and exit
+  click.echo('%d jobs run' % jobs.run_pending())
+
+#  Export
+#  ----------------------------------------------------------------
+
+@click.command('export')
+@click.argument('name', type=click.Choice(['venues', 'artists', 'shows']))
+@click.option('--format', 'format', type=click.Choice(['csv', 'ndjson']), default='csv')
+@click.option('--output', type=click.File('w', encoding='utf-8'), default='-', help='File to write, stdout by default.')
+@click.option('--batch-size', default=1000, help='Rows fetched per round trip.')
+@with_appcontext
+def export(name, format, output, batch_size):
+  # the same stream as /export/<name>, without the request limits
+  from exports import export_chunks
+  for chunk in export_chunks(name, format, batch_size):
+    output.write(chunk)
+
+#  Links
+#  ----------------------------------------------------------------
+
+links_cli = AppGroup('links', help='Check the website, Facebook and image links of venues and artists.')
+
+@links_cli.command('check')
+@click.option('--max-age', default=168.0, help='Hours before a checked link is checked again.')
+@click.option('--concurrency', default=50, help='Requests in flight at once.')
+@click.option('--per-host', default=4, help='Requests in flight per host.')
+@click.option('--timeout', default=10.0, help='Seconds before a request counts as failed.')
+def links_check(max_age, concurrency, per_host, timeout):
+  # re-check links not checked within max_age hours; safe to interrupt
+  from links import check_links
+  checked, dead = check_links(timedelta(hours=max_age), concurrency, per_host, timeout)
+  click.echo('%d links checked, %d dead' % (checked, dead))
+
+@links_cli.command('dead')
+def links_dead():
+  # tab-separated: entity, id, field, status or error, url
+  from links import dead_links
+  for check in dead_links():
+    click.echo('\t'.join([check.entity, str(check.entity_id), check.field,
+      str(check.status) if check.status is not None else check.error or '', check.url]))
+
+#  Migrations
+#  ----------------------------------------------------------------
+
+migrations_cli = AppGroup('migrations', help='Check migrations before deploying them.')
+
+@migrations_cli.command('preflight')
+@click.option('--since', default=None, help='Check the revisions after this one instead of after the database\'s current revision ("base" for all).')
+def migrations_preflight(since):
+  # list statements of pending revisions that would lock a table for long;
+  # exits non-zero when there are any, so a deploy can stop before upgrading
+  from flask import current_app
+  from alembic.runtime.migration import MigrationContext
+  from online_migrations import preflight
+  if since is None:
+    with db.engine.connect() as conn:
+      since = MigrationContext.configure(conn).get_current_revision()
+  elif since == 'base':
+    since = None
+  config = current_app.extensions['migrate'].migrate.get_config()
+  flagged = 0
+  for revision, problems, error in preflight(config, since):
+    click.echo('%s %s' % (revision.revision, revision.doc))
+    if error:
+      flagged += 1
+      click.echo('  cannot be rendered offline, review by hand: %s' % error)
+    for statement, reason in problems:
+      flagged += 1
+      click.echo('  %s' % (statement if len(statement) <= 100 else statement[:97] + '...'))
+      click.echo('    %s' % reason)
+  if flagged:
+    raise click.ClickException('%d statements need attention' % flagged)
+  click.echo('no long table locks in pending revisions')
+
+#  Snapshots
+#  ----------------------------------------------------------------
+
+snapshot_cli = AppGroup('snapshot', help='Build read-only SQLite snapshots for mirrors (SNAPSHOT_PATH).')
+
+@snapshot_cli.command('export')
+@click.argument('path', type=click.Path(dir_okay=False))
+def snapshot_export(path):
+  # build the snapshot beside path and move it into place when complete;
+  # mirrors reading path pick it up within SNAPSHOT_CHECK_INTERVAL
+  from snapshots import export_snapshot
+  counts = export_snapshot(path)
+  click.echo('snapshot written to %s: %s' % (path, ', '.join('%d %s' % (count, name) for name, count in counts.items())))
+
+#  Pre-rendered pages
+#  ----------------------------------------------------------------
+
+pages_cli = AppGroup('pages', help='Pre-render list, venue and artist pages (STATIC_PAGES_DIR).')
+
+@pages_cli.command('build')
+@click.option('--stale', is_flag=True, help='Only pages that are missing or older than STATIC_PAGES_MAX_AGE.')
+def pages_build(stale):
+  from extensions import static_pages
+  if not static_pages.enabled:
+    raise click.ClickException('STATIC_PAGES_DIR is not set')
+  rendered, failed = static_pages.build(stale_only=stale)
+  click.echo('%d pages rendered to %s, %d failed' % (rendered, static_pages.directory, failed))
+
+#  Shards
+#  ----------------------------------------------------------------
+
+shards_cli = AppGroup('shards', help='Manage region shards (SHARDS in config.py).')
+
+@shards_cli.command('init')
+def shards_init():
+  # create the venue and show tables on every shard; safe to rerun
+  if not shards.enabled():
+    raise click.ClickException('SHARDS is not configured')
+  click.echo('shards ready: %s' % ', '.join(shards.init_shards()))
+
+#  Change log
+#  ----------------------------------------------------------------
+
+changes_cli = AppGroup('changes', help='Maintain the change log behind /api/changes.')
+
+@changes_cli.command('prune')
+@click.option('--days', default=30, help='Days of changes kept for clients to catch up.')
+def changes_prune(days):
+  # clients further behind than this have to resync from scratch
+  from models import ChangeLog
+  cutoff = datetime.utcnow() - timedelta(days=days)
+  with db.engine.begin() as conn:
+    deleted = conn.execute(ChangeLog.__table__.delete().where(ChangeLog.changed_at < cutoff)).rowcount
+  click.echo('%d changes pruned' % deleted)
+
+#  Shows
+#  ----------------------------------------------------------------
+
+shows_cli = AppGroup('shows', help='Maintain the partitioned Show table.')
+
+@shows_cli.command('maintain')
+@click.option('--ahead', default=3, help='Months of future partitions to keep ready.')
+@click.option('--retain', default=12, help='Months of past shows kept in Show before archiving.')
+def shows_maintain(ahead, retain):
+  # create upcoming monthly partitions and archive months past retention
+  import partitions
+  this_month = partitions.month_start(datetime.today())
+  cutoff = partitions.add_months(this_month, -retain)
+  created = []
+  moved = 0
+  databases = [engine for name, engine in shards.engines()] if shards.enabled() else [db.engine]
+  for engine in databases:
+    with engine.begin() as conn:
+      if partitions.is_partitioned(conn):
+        created += partitions.create_partitions(conn, this_month, partitions.add_months(this_month, ahead))
+      moved += partitions.archive_before(conn, cutoff)
+  click.echo('%d partitions created, %d shows archived' % (len(created), moved))
+
+def init_app(app):
+  app.cli.add_command(analytics_cli)
+  app.cli.add_command(artists_cli)
+  app.cli.add_command(changes_cli)
+  app.cli.add_command(export)
+  app.cli.add_command(jobs_cli)
+  app.cli.add_command(links_cli)
+  app.cli.add_command(migrations_cli)
+  app.cli.add_command(pages_cli)
+  app.cli.add_command(shards_cli)
+  app.cli.add_command(snapshot_cli)
+  app.cli.add_command(shows_cli)
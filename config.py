@@ -1,10 +1,157 @@
 import os
-SECRET_KEY = os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
-# Enable debug mode.
-DEBUG = True
+# Configuration profiles, selected with create_app('dev' | 'test' | 'prod')
+# or the FYYUR_CONFIG environment variable.
 
-# Connect to the database
-SQLALCHEMY_DATABASE_URI = 'postgresql://eleanor:@localhost:5432/fyyurapp'
+class Config(object):
+    SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(32)
+
+    # Connect to the database
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql://eleanor:@localhost:5432/fyyurapp')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Compiled Jinja bytecode is cached here across restarts and workers.
+    TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR', os.path.join(basedir, '.jinja_cache'))
+
+    # List pages are streamed as they render, see stream_page() in
+    # helpers.py, in chunks of this many template fragments.
+    STREAM_BUFFER_ITEMS = 200
+
+    # Logging (outside debug mode), written by a background thread, see logs.py.
+    # The files are shared by all workers and rotated externally (logrotate).
+    LOG_DIR = os.environ.get('LOG_DIR', basedir)
+    ERROR_LOG = 'error.log'
+    ACCESS_LOG = os.environ.get('ACCESS_LOG')
+    LOG_QUEUE_SIZE = 10000
+    LOG_QUEUE_BLOCK_SECONDS = 0.05
+
+    # Search is rate limited per client and shed under load, see ratelimit.py.
+    # Set RATELIMIT_STORE to a shared store class to limit across workers.
+    # Clients are told apart by request.remote_addr; behind proxies, set
+    # PROXY_HOPS to the number of them that append to X-Forwarded-For, and
+    # only the addresses they added are trusted.
+    RATELIMIT_ENABLED = True
+    RATELIMIT_STORE = os.environ.get('RATELIMIT_STORE')
+    PROXY_HOPS = int(os.environ.get('PROXY_HOPS', 0))
+    RATELIMITS = {
+        'search': {'rate': 1.0, 'burst': 10, 'max_active': 8, 'max_waiting': 16, 'wait_timeout': 2.0},
+        'export': {'rate': 0.1, 'burst': 3, 'max_active': 2, 'max_waiting': 0, 'wait_timeout': 0},
+    }
+
+    # Statement timeouts in milliseconds (PostgreSQL): 'read' for GET
+    # requests, 'write' for the rest, or a budget named with
+    # @dbguard.timeout(). Repeated database failures open a circuit breaker
+    # that serves the last good copy of read pages, see dbguard.py.
+    STATEMENT_TIMEOUTS = {
+        'read': 5000,
+        'write': 15000,
+        'search': 2000,
+        'export': 30000,
+    }
+    BREAKER_FAILURES = 5
+    BREAKER_RESET_SECONDS = 30
+    BREAKER_CACHE_PAGES = 200
+
+    # Migrations give up after waiting this many milliseconds for a table
+    # lock (PostgreSQL), see online_migrations.py.
+    MIGRATION_LOCK_TIMEOUT = 5000
+
+    # Venue and Artist records cached per worker, see entities.py.
+    ENTITY_CACHE_SIZE = 10000
+    ENTITY_CACHE_TTL = 60
+
+    # iCalendar feeds are kept until their shows change, see calendars.py;
+    # clients may reuse a feed for CALENDAR_MAX_AGE seconds.
+    CALENDAR_CACHE_SIZE = 2000
+    CALENDAR_CACHE_TTL = 3600
+    CALENDAR_MAX_AGE = 300
+
+    # Committed changes are sent to the caches of the other worker
+    # processes, see invalidation.py: 'postgres' (LISTEN/NOTIFY), 'memory'
+    # or None when there is only one process.
+    INVALIDATION_BUS = None
+    INVALIDATION_CHANNEL = 'fyyur_invalidate'
+
+    # Pre-rendered list, venue and artist pages, see prerender.py: kept as
+    # HTML files under STATIC_PAGES_DIR (None: off) and served while younger
+    # than STATIC_PAGES_MAX_AGE seconds. `flask pages build` renders them all.
+    STATIC_PAGES_DIR = os.environ.get('STATIC_PAGES_DIR')
+    STATIC_PAGES_MAX_AGE = 3600
+
+    # Request profiling, see profiling.py: requests sent with the header
+    # `X-Fyyur-Profile: <PROFILE_TOKEN>`, and a PROFILE_SAMPLE_RATE fraction
+    # of all others, are profiled; the latest PROFILE_BUFFER_SIZE are shown at
+    # /admin/profiles (basic auth, PROFILE_TOKEN as password). Set
+    # PROFILE_STORE = 'profiling.DirectoryStore' to share them between the
+    # workers through PROFILE_DIR.
+    PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+    PROFILE_SAMPLE_RATE = 0.0
+    PROFILE_SAMPLE_INTERVAL = 0.005
+    PROFILE_BUFFER_SIZE = 50
+    PROFILE_STORE = None
+    PROFILE_DIR = None
+
+    # Server-sent show events at /api/shows/events, see events.py. Each
+    # worker keeps the latest EVENTS_BUFFER_SIZE events and holds up to
+    # EVENTS_MAX_STREAMS open streams.
+    EVENTS_BUFFER_SIZE = 1000
+    EVENTS_POLL_INTERVAL = 2
+    EVENTS_HEARTBEAT = 15
+    EVENTS_MAX_STREAM_SECONDS = 3600
+    EVENTS_MAX_STREAMS = 1000
+
+    # Read-only mirror mode, see snapshots.py: serve every page from the
+    # SQLite snapshot at SNAPSHOT_PATH (made by `flask snapshot export`),
+    # switching to a newer file within SNAPSHOT_CHECK_INTERVAL seconds, and
+    # redirect changes to SNAPSHOT_ORIGIN, e.g. 'https://fyyur.example.com'.
+    SNAPSHOT_PATH = os.environ.get('SNAPSHOT_PATH')
+    SNAPSHOT_ORIGIN = os.environ.get('SNAPSHOT_ORIGIN')
+    SNAPSHOT_CHECK_INTERVAL = 5
+    SNAPSHOT_MMAP_SIZE = 256 * 1024 * 1024
+
+    # Optional sharding by region, see shards.py. Venues and their shows go
+    # to the shard of the venue's state, everything else stays on
+    # SQLALCHEMY_DATABASE_URI. Run `flask shards init` after changing this.
+    #   SHARDS = {'west': 'postgresql://.../fyyur_west', 'east': 'postgresql://.../fyyur_east'}
+    #   SHARD_REGIONS = {'CA': 'west', 'WA': 'west', 'NY': 'east'}
+    #   DEFAULT_SHARD = 'east'
+    SHARDS = {}
+    SHARD_REGIONS = {}
+    DEFAULT_SHARD = None
+
+class DevelopmentConfig(Config):
+    # Enable debug mode.
+    DEBUG = True
+
+class TestingConfig(Config):
+    TESTING = True
+    TEMPLATE_CACHE_DIR = None
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite://')
+    WTF_CSRF_ENABLED = False
+    RATELIMIT_ENABLED = False
+
+class ProductionConfig(Config):
+    DEBUG = False
+    # Every worker must sign sessions with the same key, so it has to come
+    # from the environment rather than os.urandom().
+    SECRET_KEY = os.environ.get('SECRET_KEY')
+    # Per worker process: pool_size connections plus max_overflow in bursts.
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 5)),
+        'pool_pre_ping': True,
+        'pool_recycle': 1800,
+    }
+    ACCESS_LOG = os.environ.get('ACCESS_LOG', 'access.log')
+    # Compile every template in the master before forking, see wsgi.py.
+    PRELOAD_TEMPLATES = True
+    # Workers keep each other's caches current.
+    INVALIDATION_BUS = os.environ.get('INVALIDATION_BUS', 'postgres')
+
+profiles = {
+    'dev': DevelopmentConfig,
+    'test': TestingConfig,
+    'prod': ProductionConfig,
+}
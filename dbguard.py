@@ -0,0 +1,217 @@
+#----------------------------------------------------------------------------#
+# Statement timeouts and a database circuit breaker.
+#
+# Every request transaction on PostgreSQL starts with SET LOCAL
+# statement_timeout: STATEMENT_TIMEOUTS['read'] for GET/HEAD requests and
+# ['write'] otherwise, or the named budget of a view decorated with
+#
+#   @dbguard.timeout('search')
+#
+# Timeouts, lost connections and pool exhaustion count as database failures.
+# After BREAKER_FAILURES of them in a row the breaker opens: for
+# BREAKER_RESET_SECONDS requests fail fast with 503, except GET requests for
+# a page that was rendered successfully before, which get that copy. Then one
+# request is let through as a probe; if it succeeds the breaker closes again.
+#
+# The state is per process, as are the cached pages (the last
+# BREAKER_CACHE_PAGES non-streamed pages).
+#----------------------------------------------------------------------------#
+
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request, Response
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+STATES = (CLOSED, OPEN, HALF_OPEN)
+# allow() for the one request that tests a half-open breaker
+PROBE = 'probe'
+
+
+class CircuitBreaker(object):
+
+  def __init__(self, failures=5, reset_seconds=30):
+    self.max_failures = failures
+    self.reset_seconds = reset_seconds
+    self.lock = threading.Lock()
+    self.state = CLOSED
+    self.failures = 0
+    self.opened_at = 0
+    self.probing = False
+    self.opened = 0
+
+  def allow(self):
+    # True when a request may use the database, PROBE when it is let
+    # through as the probe of a half-open breaker
+    with self.lock:
+      if self.state == CLOSED:
+        return True
+      if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+        self.state = HALF_OPEN
+      if self.state == HALF_OPEN and not self.probing:
+        self.probing = True
+        return PROBE
+      return False
+
+  def retry_after(self):
+    return max(1, int(self.reset_seconds - (time.monotonic() - self.opened_at)))
+
+  def success(self):
+    with self.lock:
+      self.failures = 0
+      self.probing = False
+      self.state = CLOSED
+
+  def release_probe(self):
+    with self.lock:
+      self.probing = False
+
+  def failure(self):
+    with self.lock:
+      self.failures += 1
+      self.probing = False
+      if self.state == HALF_OPEN or self.failures >= self.max_failures:
+        if self.state != OPEN:
+          self.opened += 1
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+
+
+class DatabaseGuard(object):
+
+  def __init__(self):
+    self.breaker = CircuitBreaker()
+    self.pages = OrderedDict()
+    self.pages_lock = threading.Lock()
+    self.max_pages = 200
+    self.stale_served = 0
+    self.rejected = 0
+
+  def init_app(self, app, db):
+    config = app.config
+    self.breaker = CircuitBreaker(config.get('BREAKER_FAILURES', 5), config.get('BREAKER_RESET_SECONDS', 30))
+    self.max_pages = config.get('BREAKER_CACHE_PAGES', 200)
+    self.pages = OrderedDict()
+    if not event.contains(db.session, 'after_begin', set_statement_timeout):
+      event.listen(db.session, 'after_begin', set_statement_timeout)
+    if not event.contains(Engine, 'handle_error', count_database_error):
+      event.listen(Engine, 'handle_error', count_database_error)
+    app.before_request(self.before_request)
+    app.after_request(self.after_request)
+    app.register_error_handler(OperationalError, self.database_error)
+    app.register_error_handler(PoolTimeoutError, self.database_error)
+
+  def timeout(self, name):
+    # run the view under STATEMENT_TIMEOUTS[name]
+    def decorator(view):
+      @wraps(view)
+      def timed(*args, **kwargs):
+        g.statement_timeout = name
+        return view(*args, **kwargs)
+      return timed
+    return decorator
+
+  def exempt(self, view):
+    # for views that never touch the database, e.g. /metrics
+    view.dbguard_exempt = True
+    return view
+
+  def guarded(self):
+    if request.endpoint is None or request.endpoint == 'static':
+      return False
+    view = current_app.view_functions.get(request.endpoint)
+    return not getattr(view, 'dbguard_exempt', False)
+
+  def before_request(self):
+    if not self.guarded():
+      return None
+    allowed = self.breaker.allow()
+    # only the probe itself may hand the probe back
+    g.breaker_probe = allowed == PROBE
+    if allowed:
+      return None
+    return self.fallback()
+
+  def after_request(self, response):
+    if not self.guarded():
+      return response
+    if g.get('database_error'):
+      self.breaker.failure()
+    elif g.get('database_used'):
+      self.breaker.success()
+      # pages of requests with a session may carry flashed messages; reading
+      # flask.session here would add Vary: Cookie to every response
+      if request.method == 'GET' and response.status_code == 200 and not response.is_streamed \
+          and current_app.config['SESSION_COOKIE_NAME'] not in request.cookies:
+        self.remember(response)
+    elif g.get('breaker_probe'):
+      # the probe did not reach the database; let the next request try
+      self.breaker.release_probe()
+    return response
+
+  def database_error(self, error):
+    g.database_error = True
+    current_app.logger.error('database unavailable: %s', error)
+    return self.fallback()
+
+  def remember(self, response):
+    key = request.full_path
+    with self.pages_lock:
+      self.pages.pop(key, None)
+      self.pages[key] = (response.get_data(), response.mimetype)
+      while len(self.pages) > self.max_pages:
+        self.pages.popitem(last=False)
+
+  def fallback(self):
+    # the last good copy of a GET page, otherwise a fast 503
+    page = None
+    if request.method == 'GET':
+      with self.pages_lock:
+        page = self.pages.get(request.full_path)
+    if page is not None:
+      self.stale_served += 1
+      body, mimetype = page
+      response = Response(body, mimetype=mimetype)
+      response.headers['Cache-Control'] = 'no-store'
+      response.headers['X-Fyyur-Stale'] = '1'
+      return response
+    self.rejected += 1
+    response = Response('The database is unavailable, try again shortly.\n', status=503, mimetype='text/plain')
+    response.headers['Retry-After'] = str(self.breaker.retry_after())
+    return response
+
+  def metrics(self):
+    breaker = self.breaker
+    data = {
+      'fyyur_db_breaker_failures': breaker.failures,
+      'fyyur_db_breaker_opened_total': breaker.opened,
+      'fyyur_db_breaker_stale_pages_served_total': self.stale_served,
+      'fyyur_db_breaker_rejected_total': self.rejected,
+      'fyyur_db_breaker_cached_pages': len(self.pages),
+    }
+    for state in STATES:
+      data['fyyur_db_breaker_state{state="%s"}' % state] = int(breaker.state == state)
+    return data
+
+
+def set_statement_timeout(db_session, transaction, connection):
+  if not has_request_context():
+    return
+  g.database_used = True
+  if connection.dialect.name != 'postgresql':
+    return
+  timeouts = current_app.config.get('STATEMENT_TIMEOUTS', {})
+  name = g.get('statement_timeout') or ('read' if request.method in ('GET', 'HEAD') else 'write')
+  milliseconds = timeouts.get(name)
+  if milliseconds:
+    connection.execute(text('SET LOCAL statement_timeout = %d' % int(milliseconds)))
+
+def count_database_error(context):
+  # also sees errors that a view catches and turns into a flash message
+  if has_request_context() and (context.is_disconnect or isinstance(context.sqlalchemy_exception, OperationalError)):
+    g.database_error = True
@@ -0,0 +1,144 @@
+#----------------------------------------------------------------------------#
+# Entity cache.
+#
+# Venue and Artist rows as compact tuples of their column values, keyed by
+# (model name, id) and handed out as fresh dicts:
+#
+#   venue = entity_cache.get(Venue, venue_id)
+#   artists = entity_cache.get_many(Artist, artist_ids)
+#
+# Misses are loaded with one IN query per batch. Committed writes reported
+# by changes.py reload (or drop) the affected records straight away, so this
+# process never serves a record older than its own writes; writes made by
+# other processes are picked up when an entry is older than
+# ENTITY_CACHE_TTL seconds. The least recently used entries are evicted
+# beyond ENTITY_CACHE_SIZE. Each app has its own cache; entity_cache is the
+# one of the current app.
+#----------------------------------------------------------------------------#
+
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from werkzeug.local import LocalProxy
+
+from extensions import db
+from models import Venue, Artist
+from changes import on_change, on_flush
+import shards
+
+CACHED_MODELS = dict((model.__name__, model) for model in (Venue, Artist))
+LOAD_BATCH_SIZE = 500
+
+
+class EntityCache(object):
+
+  def __init__(self, max_entries=10000, ttl=60):
+    self.max_entries = max_entries
+    self.ttl = ttl
+    self.entries = OrderedDict()
+    self.lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    # bumped by every evict(), so a load that raced with a write is not cached
+    self.generation = 0
+
+  def columns(self, model):
+    return [column.name for column in model.__table__.columns]
+
+  def lookup(self, key, now):
+    # the cached values for key, or None; the caller holds the lock
+    entry = self.entries.get(key)
+    if entry is None or (self.ttl and now - entry[0] > self.ttl):
+      return None
+    self.entries.move_to_end(key)
+    return entry[1]
+
+  def store(self, model, rows, generation=None):
+    now = time.monotonic()
+    with self.lock:
+      if generation is not None and generation != self.generation:
+        return
+      for row in rows:
+        self.entries[(model.__name__, row[0])] = (now, tuple(row))
+        self.entries.move_to_end((model.__name__, row[0]))
+      while len(self.entries) > self.max_entries:
+        self.entries.popitem(last=False)
+        self.evictions += 1
+
+  def load(self, model, ids, generation=None):
+    # fetch records from the database; id must be the first column
+    columns = [getattr(model, name) for name in self.columns(model)]
+    rows = []
+    groups = shards.group_by_shard(ids) if model is Venue else {None: list(ids)}
+    for shard, ids in groups.items():
+      with shards.using(shard) if shard else shards.nowhere():
+        for start in range(0, len(ids), LOAD_BATCH_SIZE):
+          rows.extend(db.session.query(*columns).filter(model.id.in_(ids[start:start + LOAD_BATCH_SIZE])))
+    self.store(model, rows, generation)
+    return rows
+
+  def get_many(self, model, ids):
+    # {id: record dict} for the ids that exist
+    names = self.columns(model)
+    found = dict()
+    missing = []
+    now = time.monotonic()
+    with self.lock:
+      for id in set(ids):
+        values = self.lookup((model.__name__, id), now)
+        if values is None:
+          missing.append(id)
+        else:
+          found[id] = values
+      self.hits += len(found)
+      self.misses += len(missing)
+      generation = self.generation
+    if missing:
+      for row in self.load(model, missing, generation):
+        found[row[0]] = tuple(row)
+    return dict((id, dict(zip(names, values))) for id, values in found.items())
+
+  def get(self, model, id):
+    return self.get_many(model, [id]).get(id)
+
+  def evict(self, model, id):
+    with self.lock:
+      self.generation += 1
+      self.entries.pop((model.__name__, id), None)
+
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
+
+  def metrics(self):
+    return {
+      'fyyur_entity_cache_hits_total': self.hits,
+      'fyyur_entity_cache_misses_total': self.misses,
+      'fyyur_entity_cache_evictions_total': self.evictions,
+      'fyyur_entity_cache_entries': len(self.entries),
+    }
+
+entity_cache = LocalProxy(lambda: current_app.extensions['entity_cache'])
+
+@on_change
+def write_through(changes):
+  reload = dict()
+  for entity, id, action in changes:
+    model = CACHED_MODELS.get(entity)
+    if model is None:
+      continue
+    entity_cache.evict(model, id)
+    if action != 'deleted':
+      reload.setdefault(model, set()).add(id)
+  for model, ids in reload.items():
+    entity_cache.load(model, ids)
+
+@on_flush
+def flush_entities():
+  entity_cache.clear()
+
+def init_app(app):
+  app.extensions['entity_cache'] = EntityCache(app.config.get('ENTITY_CACHE_SIZE', 10000), app.config.get('ENTITY_CACHE_TTL', 60))
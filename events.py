@@ -0,0 +1,252 @@
+#----------------------------------------------------------------------------#
+# Show event stream.
+#
+# /api/shows/events is a server-sent event stream of created, updated and
+# deleted shows, in commit order:
+#
+#   id: 1234-567
+#   event: created
+#   data: {"id": 9, "venue_id": 1, "artist_id": 4, "start_time": ..., ...}
+#
+# `?venue_id=` and `?artist_id=` (repeatable) keep the events of those venues
+# or artists. The id of each event is a /api/changes cursor: a client that
+# reconnects with it as Last-Event-ID (browsers do so themselves) or
+# `?since=` first receives everything it missed.
+#
+# Each worker process runs one poller thread that reads new Show changes
+# from ChangeLog into a buffer of the latest EVENTS_BUFFER_SIZE events,
+# whenever a show change is committed by this worker or reported by the
+# invalidation bus, and every EVENTS_POLL_INTERVAL seconds regardless. Open
+# streams wait on the buffer without touching the database; one that falls
+# further behind than the buffer reaches catches up from ChangeLog again.
+#
+# An open stream costs a thread in gthread workers. To hold thousands, serve
+# /api/shows/events from gunicorn with GUNICORN_WORKER_CLASS=gevent, where
+# it costs a greenlet. Streams end after EVENTS_MAX_STREAM_SECONDS and the
+# client reconnects where it left off.
+#----------------------------------------------------------------------------#
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_right
+
+from flask import Response
+
+# ChangeLog rows read per query
+READ_BATCH_SIZE = 500
+
+
+def cursor_key(cursor):
+  from changes import decode_cursor
+  return decode_cursor(cursor) if cursor else (-1, -1)
+
+def matches(event, venue_ids, artist_ids):
+  if not venue_ids and not artist_ids:
+    return True
+  return event['venue_id'] in venue_ids or event['artist_id'] in artist_ids
+
+def format_event(cursor, event):
+  return 'id: %s\nevent: %s\ndata: %s\n\n' % (cursor, event['action'], json.dumps(event))
+
+def change_events(rows):
+  # [(cursor, event)] of Show ChangeLog rows, with the show's details while
+  # it still exists
+  from extensions import db
+  from models import Venue, Artist, Show
+  from changes import encode_cursor
+  from entities import entity_cache
+  import shards
+  shows = dict()
+  groups = dict()
+  for row in rows:
+    if row.action != 'deleted' and row.venue_id is not None:
+      groups.setdefault(row.venue_id, []).append(row.entity_id)
+  for venue_id, ids in groups.items():
+    with shards.for_venue(venue_id):
+      shows.update((show.id, show) for show in Show.query.filter(Show.id.in_(ids)))
+  venues = entity_cache.get_many(Venue, [show.venue_id for show in shows.values()])
+  artists = entity_cache.get_many(Artist, [show.artist_id for show in shows.values()])
+  events = []
+  for row in rows:
+    event = {
+      'id': row.entity_id,
+      'action': row.action,
+      'venue_id': row.venue_id,
+      'artist_id': row.artist_id,
+      'changed_at': row.changed_at.isoformat() + 'Z',
+    }
+    show = shows.get(row.entity_id)
+    if show is not None and show.venue_id in venues and show.artist_id in artists:
+      event['start_time'] = str(show.start_time)
+      event['venue_name'] = venues[show.venue_id]['name']
+      event['artist_name'] = artists[show.artist_id]['name']
+      event['artist_image_link'] = artists[show.artist_id]['image_link']
+    events.append((encode_cursor(row.txid, row.id), event))
+  return events
+
+def read_show_events(since, limit=READ_BATCH_SIZE):
+  # ([(cursor, event)], next cursor) after `since`
+  from changes import read_changes
+  rows, cursor = read_changes(since, limit, entity='Show')
+  return change_events(rows), cursor
+
+
+class ShowEventStream(object):
+
+  def __init__(self):
+    self.app = None
+    self.condition = threading.Condition()
+    # [(cursor key, cursor, event)], oldest first
+    self.events = []
+    # events up to this key are not in the buffer: older than the poller,
+    # or dropped from it
+    self.floor = None
+    self.cursor = None
+    self.wake = threading.Event()
+    self.pid = None
+    self.start_lock = threading.Lock()
+    self.streams = 0
+    self.sent = 0
+    self.rejected = 0
+
+  def init_app(self, app):
+    from changes import change_listeners
+    self.app = app
+    self.buffer_size = app.config.get('EVENTS_BUFFER_SIZE', 1000)
+    self.poll_interval = app.config.get('EVENTS_POLL_INTERVAL', 2)
+    self.heartbeat = app.config.get('EVENTS_HEARTBEAT', 15)
+    self.max_seconds = app.config.get('EVENTS_MAX_STREAM_SECONDS', 3600)
+    self.max_streams = app.config.get('EVENTS_MAX_STREAMS', 1000)
+    if self.show_changed not in change_listeners:
+      change_listeners.append(self.show_changed)
+
+  def show_changed(self, changes):
+    if any(entity == 'Show' for entity, id, action in changes):
+      self.wake.set()
+
+  #  Polling
+  #  ----------------------------------------------------------------
+
+  def ensure_started(self):
+    # once per process: the poller does not survive gunicorn's fork
+    if self.pid == os.getpid():
+      return
+    with self.start_lock:
+      if self.pid == os.getpid():
+        return
+      from changes import latest_cursor
+      self.cursor = latest_cursor()
+      self.events = []
+      self.floor = cursor_key(self.cursor)
+      threading.Thread(target=self.poll_forever, name='show-events', daemon=True).start()
+      self.pid = os.getpid()
+
+  def poll_forever(self):
+    from extensions import db
+    while True:
+      self.wake.wait(self.poll_interval)
+      self.wake.clear()
+      with self.app.app_context():
+        try:
+          self.poll()
+        except Exception:
+          self.app.logger.exception('reading show events failed')
+        finally:
+          db.session.remove()
+
+  def poll(self):
+    while True:
+      events, cursor = read_show_events(self.cursor)
+      if not events:
+        return
+      with self.condition:
+        self.events.extend((cursor_key(c), c, event) for c, event in events)
+        if len(self.events) > self.buffer_size:
+          drop = len(self.events) - self.buffer_size
+          self.floor = self.events[drop - 1][0]
+          del self.events[:drop]
+        self.cursor = cursor
+        self.condition.notify_all()
+      if len(events) < READ_BATCH_SIZE:
+        return
+
+  #  Streaming
+  #  ----------------------------------------------------------------
+
+  def catch_up(self, since, venue_ids, artist_ids):
+    # [(cursor, event)] after since, up to the newest read by the poller,
+    # and the cursor they end at
+    from extensions import db
+    until = cursor_key(self.cursor)
+    caught_up = []
+    with self.app.app_context():
+      try:
+        while cursor_key(since) < until:
+          events, cursor = read_show_events(since)
+          if not events:
+            break
+          caught_up.extend((c, event) for c, event in events if matches(event, venue_ids, artist_ids))
+          since = cursor
+      finally:
+        db.session.remove()
+    return caught_up, since
+
+  def stream(self, since, venue_ids, artist_ids):
+    # the body of one event stream response
+    self.ensure_started()
+    if self.streams >= self.max_streams:
+      self.rejected += 1
+      response = Response('Too many open event streams, try again shortly.\n', status=503, mimetype='text/plain')
+      response.headers['Retry-After'] = str(self.heartbeat)
+      return response
+    if since is None:
+      since = self.cursor
+    else:
+      # raises ValueError for a malformed cursor
+      cursor_key(since)
+    response = Response(self.generate(since, set(venue_ids), set(artist_ids)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # tell nginx not to buffer the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+  def generate(self, since, venue_ids, artist_ids):
+    with self.condition:
+      self.streams += 1
+    try:
+      # clients reconnect after a second when the stream ends
+      yield 'retry: 1000\n\n'
+      deadline = time.monotonic() + self.max_seconds
+      while time.monotonic() < deadline:
+        with self.condition:
+          behind = cursor_key(since) < self.floor
+          if not behind:
+            start = bisect_right(self.events, cursor_key(since), key=lambda item: item[0])
+            if start == len(self.events):
+              self.condition.wait(self.heartbeat)
+              start = bisect_right(self.events, cursor_key(since), key=lambda item: item[0])
+            pending = [(cursor, event) for key, cursor, event in self.events[start:]]
+        if behind:
+          # the buffer does not reach back to since
+          pending, since = self.catch_up(since, venue_ids, artist_ids)
+        elif pending:
+          since = pending[-1][0]
+        chunks = [format_event(cursor, event) for cursor, event in pending if matches(event, venue_ids, artist_ids)]
+        if chunks:
+          self.sent += len(chunks)
+          yield ''.join(chunks)
+        elif not pending:
+          # keeps proxies from closing an idle stream, and finds gone clients
+          yield ': keepalive\n\n'
+    finally:
+      with self.condition:
+        self.streams -= 1
+
+  def metrics(self):
+    return {
+      'fyyur_show_event_streams': self.streams,
+      'fyyur_show_events_sent_total': self.sent,
+      'fyyur_show_event_streams_rejected_total': self.rejected,
+    }
@@ -0,0 +1,101 @@
+#----------------------------------------------------------------------------#
+# Bulk export.
+#
+# Every venue, artist or show as CSV or NDJSON (one JSON object per line),
+# produced as a stream of text chunks:
+#
+#   for chunk in export_chunks('shows', 'csv'):
+#     out.write(chunk)
+#
+# Rows are read through a server-side cursor (yield_per) EXPORT_BATCH_SIZE at
+# a time as plain column tuples, never ORM objects, and each batch is written
+# out before the next one is fetched, so memory use does not grow with the
+# table. Shows carry their venue and artist names: the venue is joined on
+# the same shard, artist names are looked up once per batch. Past shows
+# moved to ShowArchive follow the current ones, marked `archived`.
+#
+# Served by /export/<name> (views/export.py) and `flask export <name>`.
+#----------------------------------------------------------------------------#
+
+import csv
+import io
+import json
+
+from extensions import db
+from models import Venue, Artist, Show, ShowArchive
+import shards
+
+EXPORT_BATCH_SIZE = 1000
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+VENUE_COLUMNS = ('id', 'name', 'city', 'state', 'address', 'phone', 'genres', 'website',
+  'image_link', 'facebook_link', 'seeking_talent', 'seeking_description')
+ARTIST_COLUMNS = ('id', 'name', 'city', 'state', 'phone', 'genres', 'website',
+  'image_link', 'facebook_link', 'seeking_venue', 'seeking_description')
+SHOW_COLUMNS = ('id', 'start_time', 'venue_id', 'venue_name', 'artist_id', 'artist_name', 'archived')
+
+
+def stream_batches(statement, sharded, batch_size):
+  # lists of row tuples from statement, batch_size at a time, one shard after
+  # the other for sharded tables
+  for shard in (shards.names() if sharded and shards.enabled() else [None]):
+    with shards.using(shard) if shard else shards.nowhere():
+      # executing binds the cursor to this shard's connection
+      result = db.session.execute(statement.execution_options(yield_per=batch_size))
+    for partition in result.partitions():
+      yield partition
+
+def column_rows(model, columns, batch_size):
+  statement = db.select(*[getattr(model, name) for name in columns]).order_by(model.id)
+  return stream_batches(statement, model is Venue, batch_size)
+
+def show_rows(batch_size):
+  for model, archived in ((Show, False), (ShowArchive, True)):
+    statement = db.select(model.id, model.start_time, model.venue_id, Venue.name, model.artist_id) \
+      .outerjoin(Venue, Venue.id == model.venue_id) \
+      .order_by(model.id)
+    for batch in stream_batches(statement, True, batch_size):
+      artist_ids = set(row[4] for row in batch)
+      names = dict(db.session.execute(
+        db.select(Artist.id, Artist.name).where(Artist.id.in_(artist_ids))
+      ).all())
+      yield [tuple(row) + (names.get(row[4]), archived) for row in batch]
+
+EXPORTS = {
+  'venues': (VENUE_COLUMNS, lambda batch_size: column_rows(Venue, VENUE_COLUMNS, batch_size)),
+  'artists': (ARTIST_COLUMNS, lambda batch_size: column_rows(Artist, ARTIST_COLUMNS, batch_size)),
+  'shows': (SHOW_COLUMNS, show_rows),
+}
+
+#  Writers
+#  ----------------------------------------------------------------
+
+def json_value(value):
+  return value.isoformat() if hasattr(value, 'isoformat') else value
+
+def csv_chunks(columns, batches):
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  writer.writerow(columns)
+  for batch in batches:
+    writer.writerows(batch)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+  # header only when there are no rows
+  if buffer.tell():
+    yield buffer.getvalue()
+
+def ndjson_chunks(columns, batches):
+  for batch in batches:
+    yield ''.join(
+      json.dumps(dict((column, json_value(value)) for column, value in zip(columns, row))) + '\n'
+      for row in batch
+    )
+
+def export_chunks(name, format, batch_size=EXPORT_BATCH_SIZE):
+  # text chunks of export `name` ('venues', 'artists' or 'shows') in `format`
+  # ('csv' or 'ndjson'), about one per batch
+  columns, rows = EXPORTS[name]
+  write = csv_chunks if format == 'csv' else ndjson_chunks
+  return write(columns, rows(batch_size))
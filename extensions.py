@@ -0,0 +1,34 @@
+#----------------------------------------------------------------------------#
+# Extensions.
+#----------------------------------------------------------------------------#
+
+# Created unbound so modules can import them without an application;
+# create_app() in app.py binds them with init_app().
+
+from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
+from flask_moment import Moment
+from jobs import JobQueue
+from logs import QueueLogging
+from ratelimit import RateLimiter
+from dbguard import DatabaseGuard
+from shards import RoutingSession
+from snapshots import Snapshot
+from invalidation import InvalidationBus
+from prerender import StaticPages
+from profiling import RequestProfiler
+from events import ShowEventStream
+
+# db.session routes sharded tables when SHARDS is configured
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+migrate = Migrate()
+moment = Moment()
+jobs = JobQueue()
+logs = QueueLogging()
+limiter = RateLimiter()
+dbguard = DatabaseGuard()
+snapshot = Snapshot()
+bus = InvalidationBus()
+static_pages = StaticPages()
+profiler = RequestProfiler()
+event_stream = ShowEventStream()
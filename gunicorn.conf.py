@@ -0,0 +1,51 @@
+# Gunicorn settings for `gunicorn -c gunicorn.conf.py wsgi:application`.
+# Every value can be tuned from the environment.
+#
+# Graceful operations on the master process:
+#   kill -HUP <master>   re-read this file and replace workers one by one
+#   kill -USR2 <master>  start a new master with new code, then -QUIT the old
+#   kill -TERM <master>  stop accepting, finish in-flight requests, exit
+
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:%s' % os.environ.get('PORT', '5000'))
+
+# pre-forked workers, each with a few threads for requests waiting on I/O
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread' if threads > 1 else 'sync')
+
+# gevent: one greenlet per connection, for many long-lived event streams
+# (/api/shows/events); each worker holds up to worker_connections
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+# load the app in the master so workers share its memory copy-on-write;
+# not with gevent, which must patch the standard library before the app is
+# imported
+preload_app = os.environ.get('GUNICORN_PRELOAD', '0' if worker_class == 'gevent' else '1') == '1'
+
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+# recycle workers now and then to bound slow leaks; jitter avoids restarting
+# them all at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 5000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 500))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = os.environ.get('GUNICORN_ERROR_LOG', '-')
+
+
+def post_fork(server, worker):
+  # a pooled connection inherited from the master would be shared by every
+  # worker; drop them (without closing the master's sockets) so each worker
+  # opens its own on first use
+  if not server.cfg.preload_app:
+    return
+  from extensions import db
+  from wsgi import application
+  with application.app_context():
+    for engine in db.engines.values():
+      engine.dispose(close=False)
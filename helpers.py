@@ -0,0 +1,115 @@
+#----------------------------------------------------------------------------#
+# Form and update helpers.
+#----------------------------------------------------------------------------#
+
+from flask import request, abort, current_app, Response, stream_with_context
+from sqlalchemy.orm.attributes import set_committed_value
+
+from extensions import db
+from changes import record_change
+
+VENUE_FIELDS = ('name', 'city', 'state', 'address', 'phone', 'genres', 'website',
+  'image_link', 'facebook_link', 'seeking_talent', 'seeking_description')
+ARTIST_FIELDS = ('name', 'city', 'state', 'phone', 'genres', 'website',
+  'image_link', 'facebook_link', 'seeking_venue', 'seeking_description')
+BOOLEAN_FIELDS = ('seeking_talent', 'seeking_venue')
+
+class EditConflict(Exception):
+  # raised when a record was changed by someone else after the form was
+  # rendered; carries the version the record has now
+  def __init__(self, version):
+    Exception.__init__(self, version)
+    self.version = version
+
+# called inside the writing transaction whenever patch_record() changed a row
+patch_listeners = []
+
+def on_patch(func):
+  # func(model, record, changes): record still holds the old values, changes
+  # maps each changed column to its new value
+  patch_listeners.append(func)
+  return func
+
+def submitted_values(fields, partial=False):
+  # collect the submitted values for the given columns. A full form submits
+  # every field (an unchecked checkbox is simply absent); a partial (PATCH)
+  # submission only carries the fields the client wants to change.
+  values = dict()
+  for field in fields:
+    if partial and field not in request.form:
+      continue
+    if field == 'genres':
+      values[field] = ', '.join(request.form.getlist('genres'))
+    elif field in BOOLEAN_FIELDS and not partial:
+      values[field] = field in request.form
+    elif field in BOOLEAN_FIELDS:
+      values[field] = request.form[field].lower() not in ('n', 'no', 'false', '0', '')
+    else:
+      value = request.form[field]
+      values[field] = '' if value == 'None' else value
+  return values
+
+def patch_record(model, record_id, version, values):
+  # diff the submitted values against the stored row and write only the
+  # changed columns in a single UPDATE guarded by the version the form was
+  # rendered with. Returns the record, brought up to date, and the list of
+  # changed columns.
+  record = model.query.get(record_id)
+  if record is None:
+    abort(404)
+  if record.version != version:
+    raise EditConflict(record.version)
+
+  changes = dict()
+  for field, value in values.items():
+    if getattr(record, field) != value:
+      changes[field] = value
+  if not changes:
+    return record, []
+
+  table = model.__table__
+  result = db.session.execute(
+    table.update()
+      .where(table.c.id == record_id)
+      .where(table.c.version == version)
+      .values(version=table.c.version + 1, **changes)
+  )
+  if result.rowcount != 1:
+    # changed or deleted since it was loaded
+    current = db.session.execute(db.select(table.c.version).where(table.c.id == record_id)).scalar()
+    if current is None:
+      abort(404)
+    raise EditConflict(current)
+  for listener in patch_listeners:
+    listener(model, record, changes)
+  record_change(model.__name__, record_id, 'updated')
+  for field, value in changes.items():
+    set_committed_value(record, field, value)
+  set_committed_value(record, 'version', version + 1)
+  return record, sorted(changes)
+
+def form_version():
+  # the record version the submitted form was rendered with
+  version = request.form.get('version', type=int)
+  if version is None:
+    abort(400)
+  return version
+
+#----------------------------------------------------------------------------#
+# Rendering.
+#----------------------------------------------------------------------------#
+
+# rows fetched per round trip when a list page iterates its query
+STREAM_BATCH_SIZE = 500
+
+def stream_page(template_name, **context):
+  # render a template incrementally so the first bytes go out before the
+  # whole list is loaded; list-valued context may be generators. Output is
+  # sent in chunks of STREAM_BUFFER_ITEMS template fragments.
+  app = current_app._get_current_object()
+  template = app.jinja_env.get_template(template_name)
+  app.update_template_context(context)
+  stream = template.stream(context)
+  stream.enable_buffering(app.config.get('STREAM_BUFFER_ITEMS', 200))
+  return Response(stream_with_context(stream), mimetype='text/html')
+
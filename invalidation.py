@@ -0,0 +1,240 @@
+#----------------------------------------------------------------------------#
+# Invalidation bus.
+#
+# Caches and indexes built from Venue, Artist and Show rows (entities.py,
+# calendars.py, matching.py) live in each worker process and follow writes
+# through the @on_change listeners of changes.py, which only hear about
+# writes made by their own process. The bus carries every process's
+# committed changes to all the others:
+#
+#   - after a request's changes are dispatched locally they are published
+#     as JSON messages {publisher, sequence number, changes};
+#   - a subscriber thread in every worker receives the messages of the other
+#     publishers and hands their changes to the same listeners.
+#
+# Sequence numbers count up by one per publisher. A subscriber that sees one
+# skipped, or loses its connection, cannot tell what it missed and calls the
+# @on_flush callbacks instead, which drop everything. Delivery is best
+# effort: the cache TTLs still bound staleness if a publish itself fails.
+#
+# INVALIDATION_BUS selects the transport: 'postgres' (LISTEN/NOTIFY on
+# INVALIDATION_CHANNEL of the main database), 'memory' (apps within one
+# process, for tests) or None to turn the bus off.
+#----------------------------------------------------------------------------#
+
+import json
+import os
+import select
+import socket
+import threading
+import time
+import uuid
+
+import sqlalchemy as sa
+from flask import current_app
+
+# changes per message; NOTIFY payloads must stay under 8000 bytes
+MESSAGE_CHANGES = 150
+
+
+class MemoryTransport(object):
+  # delivers synchronously to every AppBus of the same channel in this
+  # process
+  channels = dict()
+
+  def __init__(self, bus, channel):
+    self.bus = bus
+    self.channel = channel
+
+  def start(self):
+    subscribers = MemoryTransport.channels.setdefault(self.channel, [])
+    if self.bus not in subscribers:
+      subscribers.append(self.bus)
+
+  def send(self, payload):
+    for bus in list(MemoryTransport.channels.get(self.channel, ())):
+      bus.receive(payload)
+
+
+class PostgresTransport(object):
+  # NOTIFY on the app's connection pool, LISTEN on a dedicated connection in
+  # a daemon thread
+
+  def __init__(self, bus, channel, db):
+    self.bus = bus
+    self.channel = channel
+    self.db = db
+    self.wait = 5.0
+    self.thread = None
+
+  def start(self):
+    self.thread = threading.Thread(target=self.listen, name='invalidation-bus', daemon=True)
+    self.thread.start()
+
+  def send(self, payload):
+    with self.db.engine.connect() as conn:
+      conn.execute(sa.text('SELECT pg_notify(:channel, :payload)'), {'channel': self.channel, 'payload': payload})
+      conn.commit()
+
+  def listen(self):
+    connected_before = False
+    while True:
+      try:
+        with self.bus.app.app_context():
+          engine = sa.create_engine(self.db.engine.url, poolclass=sa.pool.NullPool)
+        connection = engine.raw_connection()
+        try:
+          driver = connection.driver_connection
+          if type(driver).__module__.startswith('psycopg2'):
+            receive = self.listen_psycopg2(driver)
+          else:
+            receive = self.listen_psycopg(driver)
+          if connected_before:
+            # anything published while disconnected is lost
+            self.bus.flush('reconnected')
+          connected_before = True
+          while True:
+            for payload in receive():
+              self.bus.receive(payload)
+        finally:
+          connection.invalidate()
+          engine.dispose()
+      except Exception:
+        self.bus.app.logger.exception('invalidation bus listener failed, reconnecting')
+        time.sleep(self.wait)
+
+  def listen_psycopg(self, driver):
+    # notifies(timeout=) needs psycopg 3.2
+    driver.autocommit = True
+    driver.execute('LISTEN "%s"' % self.channel)
+    def receive():
+      return [notify.payload for notify in driver.notifies(timeout=self.wait)]
+    return receive
+
+  def listen_psycopg2(self, driver):
+    driver.autocommit = True
+    driver.cursor().execute('LISTEN "%s"' % self.channel)
+    def receive():
+      select.select([driver], [], [], self.wait)
+      driver.poll()
+      payloads = [notify.payload for notify in driver.notifies]
+      del driver.notifies[:]
+      return payloads
+    return receive
+
+
+class AppBus(object):
+  # the bus of one app: its publisher id, transport and counters
+
+  def __init__(self, app):
+    self.app = app
+    self.transport = None
+    self.lock = threading.Lock()
+    self.send_lock = threading.Lock()
+    self.pid = None
+    self.publisher = None
+    self.sequence = 0
+    # publisher -> last sequence number received
+    self.sequences = dict()
+    self.published = 0
+    self.received = 0
+    self.flushes = 0
+
+  def ensure_started(self):
+    # once per process: threads and ids do not survive gunicorn's fork
+    if self.pid == os.getpid():
+      return
+    with self.lock:
+      if self.pid == os.getpid():
+        return
+      self.pid = os.getpid()
+      self.publisher = '%s-%d-%s' % (socket.gethostname(), self.pid, uuid.uuid4().hex[:8])
+      self.sequence = 0
+      self.sequences = dict()
+      self.transport.start()
+
+  def publish(self, changes):
+    self.ensure_started()
+    for start in range(0, len(changes), MESSAGE_CHANGES):
+      # numbered and sent in one go, so messages leave in sequence order; a
+      # failed send leaves a gap and the other workers flush
+      with self.send_lock:
+        self.sequence += 1
+        payload = json.dumps({
+          'publisher': self.publisher,
+          'sequence': self.sequence,
+          'changes': [list(change) for change in changes[start:start + MESSAGE_CHANGES]],
+        })
+        try:
+          self.transport.send(payload)
+          self.published += 1
+        except Exception:
+          self.app.logger.exception('publishing invalidations failed')
+
+  def receive(self, payload):
+    message = json.loads(payload)
+    publisher = message['publisher']
+    if publisher == self.publisher:
+      return
+    with self.lock:
+      last = self.sequences.get(publisher)
+      self.sequences[publisher] = message['sequence']
+    self.received += 1
+    if last is not None and message['sequence'] != last + 1:
+      self.flush('missed %d messages from %s' % (message['sequence'] - last - 1, publisher))
+      return
+    from changes import notify_listeners
+    with self.app.app_context():
+      notify_listeners([tuple(change) for change in message['changes']])
+
+  def flush(self, reason):
+    from changes import flush_all
+    self.flushes += 1
+    with self.app.app_context():
+      current_app.logger.warning('flushing caches: %s', reason)
+      flush_all()
+
+  def metrics(self):
+    return {
+      'fyyur_invalidation_published_total': self.published,
+      'fyyur_invalidation_received_total': self.received,
+      'fyyur_invalidation_flushes_total': self.flushes,
+    }
+
+
+class InvalidationBus(object):
+  # each app gets its own AppBus, so apps sharing a process (tests) are
+  # separate publishers and subscribers
+
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app, db=None):
+    from changes import change_publishers
+    # a read-only mirror has no writes to share
+    kind = None if app.config.get('SNAPSHOT_PATH') else app.config.get('INVALIDATION_BUS')
+    channel = app.config.get('INVALIDATION_CHANNEL', 'fyyur_invalidate')
+    if kind not in ('postgres', 'memory'):
+      return
+    app_bus = app.extensions['invalidation_bus'] = AppBus(app)
+    if kind == 'postgres':
+      app_bus.transport = PostgresTransport(app_bus, channel, db)
+    else:
+      app_bus.transport = MemoryTransport(app_bus, channel)
+    if self.publish not in change_publishers:
+      change_publishers.append(self.publish)
+    app.before_request(app_bus.ensure_started)
+
+  def current(self):
+    # the AppBus of the current app, or None when its bus is off
+    return current_app.extensions.get('invalidation_bus')
+
+  def publish(self, changes):
+    app_bus = self.current()
+    if app_bus is not None:
+      app_bus.publish(changes)
+
+  def metrics(self):
+    app_bus = self.current()
+    return app_bus.metrics() if app_bus is not None else {}
@@ -0,0 +1,205 @@
+#----------------------------------------------------------------------------#
+# Background jobs.
+#
+# Handlers in app.py enqueue jobs inside the same transaction as the write
+# they belong to, so a job row becomes visible to workers exactly when that
+# write commits (and disappears with it on rollback). Workers claim due rows
+# from the Job table, run every handler registered for the job name and
+# either delete the row or reschedule it with exponential backoff.
+#----------------------------------------------------------------------------#
+
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue(object):
+
+  def __init__(self, app=None, db=None, model=None):
+    self.handlers = dict()
+    if app is not None:
+      self.init_app(app, db, model)
+
+  def init_app(self, app, db, model):
+    self.app = app
+    self.db = db
+    self.model = model
+    app.config.setdefault('JOBS_MAX_ATTEMPTS', 5)
+    app.config.setdefault('JOBS_BACKOFF_SECONDS', 10)
+    app.config.setdefault('JOBS_VISIBILITY_TIMEOUT', 600)
+
+  def handler(self, name):
+    # register a function to run for every job called <name>. Handlers may run
+    # more than once for the same job (retries), so they must be idempotent.
+    def register(func):
+      self.handlers.setdefault(name, []).append(func)
+      return func
+    return register
+
+  def enqueue(self, name, delay=0, **payload):
+    # add a job to the caller's session; it is committed with the caller's
+    # transaction. Jobs nobody listens for are not stored at all.
+    if not self.handlers.get(name):
+      return None
+    job = self.model(
+      name=name,
+      payload=json.dumps(payload),
+      run_at=datetime.utcnow() + timedelta(seconds=delay)
+    )
+    self.db.session.add(job)
+    return job
+
+  def claim(self, limit):
+    # mark up to <limit> due jobs as running and return their ids. On
+    # Postgres concurrent workers skip each other's rows instead of waiting.
+    Job = self.model
+    session = self.db.session
+    now = datetime.utcnow()
+    try:
+      jobs = Job.query \
+        .filter(Job.status == 'queued', Job.run_at <= now) \
+        .order_by(Job.run_at) \
+        .limit(limit) \
+        .with_for_update(skip_locked=True) \
+        .all()
+      for job in jobs:
+        job.status = 'running'
+        job.locked_at = now
+      ids = [job.id for job in jobs]
+      session.commit()
+    except:
+      session.rollback()
+      raise
+    finally:
+      session.close()
+    return ids
+
+  def requeue_stale(self):
+    # jobs left running by a worker that died are put back on the queue
+    Job = self.model
+    session = self.db.session
+    cutoff = datetime.utcnow() - timedelta(seconds=self.app.config['JOBS_VISIBILITY_TIMEOUT'])
+    try:
+      count = Job.query \
+        .filter(Job.status == 'running', Job.locked_at < cutoff) \
+        .update({'status': 'queued', 'locked_at': None}, synchronize_session=False)
+      session.commit()
+    except:
+      session.rollback()
+      raise
+    finally:
+      session.close()
+    return count
+
+  def run(self, job_id):
+    # run one claimed job; returns True when it succeeded
+    Job = self.model
+    session = self.db.session
+    job = Job.query.get(job_id)
+    if job is None:
+      session.close()
+      return True
+    name = job.name
+    payload = json.loads(job.payload or '{}')
+    session.close()
+
+    try:
+      for func in self.handlers.get(name, []):
+        func(**payload)
+        session.commit()
+    except Exception as exc:
+      session.rollback()
+      logger.exception('job %s (%s) failed', job_id, name)
+      self.reschedule(job_id, '%s: %s' % (type(exc).__name__, exc))
+      return False
+    finally:
+      session.close()
+
+    try:
+      Job.query.filter_by(id=job_id).delete(synchronize_session=False)
+      session.commit()
+    finally:
+      session.close()
+    return True
+
+  def reschedule(self, job_id, error):
+    Job = self.model
+    session = self.db.session
+    try:
+      job = Job.query.get(job_id)
+      job.attempts += 1
+      job.last_error = error
+      job.locked_at = None
+      if job.attempts >= self.app.config['JOBS_MAX_ATTEMPTS']:
+        job.status = 'failed'
+      else:
+        backoff = self.app.config['JOBS_BACKOFF_SECONDS'] * 2 ** (job.attempts - 1)
+        job.status = 'queued'
+        job.run_at = datetime.utcnow() + timedelta(seconds=backoff)
+      session.commit()
+    finally:
+      session.close()
+
+  def run_pending(self, limit=None):
+    # local runner: run every due job synchronously in the calling thread.
+    # Intended for tests and one-off maintenance; returns the number run.
+    count = 0
+    with self.app.app_context():
+      while limit is None or count < limit:
+        ids = self.claim(1)
+        if not ids:
+          break
+        self.run(ids[0])
+        count += 1
+    return count
+
+
+class Worker(object):
+  # polls the queue and runs claimed jobs on a thread pool
+
+  def __init__(self, queue, threads=4, poll_interval=1.0):
+    self.queue = queue
+    self.threads = threads
+    self.poll_interval = poll_interval
+    self.stopping = threading.Event()
+    self.slots = threading.Semaphore(threads)
+
+  def stop(self):
+    self.stopping.set()
+
+  def _run(self, job_id):
+    try:
+      with self.queue.app.app_context():
+        self.queue.run(job_id)
+    finally:
+      self.slots.release()
+
+  def serve(self):
+    app = self.queue.app
+    with app.app_context():
+      self.queue.requeue_stale()
+    logger.info('job worker started with %d threads', self.threads)
+    with ThreadPoolExecutor(max_workers=self.threads) as pool:
+      while not self.stopping.is_set():
+        self.slots.acquire()
+        self.slots.release()
+        free = 0
+        while free < self.threads and self.slots.acquire(blocking=False):
+          free += 1
+        try:
+          with app.app_context():
+            ids = self.queue.claim(free)
+        except Exception:
+          logger.exception('could not claim jobs')
+          ids = []
+        for _ in range(free - len(ids)):
+          self.slots.release()
+        for job_id in ids:
+          pool.submit(self._run, job_id)
+        if not ids:
+          self.stopping.wait(self.poll_interval)
+    logger.info('job worker stopped')
@@ -0,0 +1,180 @@
+#----------------------------------------------------------------------------#
+# Link checker.
+#
+# `flask links check` requests every website, facebook_link and image_link
+# of venues and artists whose last check (LinkCheck) is older than max_age or
+# was for a different URL, and stores the outcome. Requests run concurrently
+# on one asyncio loop: at most `concurrency` at once and `per_host` per host,
+# each bounded by `timeout` seconds. A URL shared by several records is
+# fetched once. Links are checked with HEAD (GET for servers that refuse
+# it), following redirects, and carry If-None-Match / If-Modified-Since from
+# the previous check; a 304 keeps the previous status. Results are written
+# as the fetches complete and committed every WRITE_BATCH_SIZE rows, so an
+# interrupted run keeps what it has checked and the next run carries on.
+#
+# aiohttp is only needed by this command and imported when it runs.
+#----------------------------------------------------------------------------#
+
+import asyncio
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+from extensions import db
+from models import Venue, Artist, LinkCheck
+import shards
+
+LINK_FIELDS = ('website', 'facebook_link', 'image_link')
+USER_AGENT = 'Fyyur link checker'
+# rows written per commit
+WRITE_BATCH_SIZE = 500
+
+
+def is_dead(status):
+  return status is None or status >= 400
+
+def current_links():
+  # {(entity, id, field): url} for every non-empty link
+  columns = [getattr(Venue, field) for field in LINK_FIELDS]
+  rows = [('Venue', row) for row in shards.gather(lambda: db.session.query(Venue.id, *columns).all())]
+  columns = [getattr(Artist, field) for field in LINK_FIELDS]
+  rows += [('Artist', row) for row in db.session.query(Artist.id, *columns)]
+  links = dict()
+  for entity, row in rows:
+    for field, url in zip(LINK_FIELDS, row[1:]):
+      url = (url or '').strip()
+      if url and url != 'None':
+        links[(entity, row[0], field)] = url
+  return links
+
+#  Fetching
+#  ----------------------------------------------------------------
+
+async def fetch_status(session, url, validators, timeout):
+  # (status, error, etag, last_modified) for one URL
+  import aiohttp
+  headers = dict()
+  etag, last_modified = validators
+  if etag:
+    headers['If-None-Match'] = etag
+  if last_modified:
+    headers['If-Modified-Since'] = last_modified
+  client_timeout = aiohttp.ClientTimeout(total=timeout)
+  try:
+    async with session.head(url, headers=headers, allow_redirects=True, timeout=client_timeout) as response:
+      status = response.status
+      found = (response.headers.get('ETag'), response.headers.get('Last-Modified'))
+    if status in (403, 405, 501):
+      # some servers only answer GET; the body is never read
+      async with session.get(url, headers=headers, allow_redirects=True, timeout=client_timeout) as response:
+        status = response.status
+        found = (response.headers.get('ETag'), response.headers.get('Last-Modified'))
+  except asyncio.TimeoutError:
+    return None, 'timeout', None, None
+  except (aiohttp.ClientError, ValueError) as e:
+    return None, (str(e) or type(e).__name__)[:200], None, None
+  return status, None, found[0], found[1]
+
+async def fetch_all(urls, concurrency, per_host, timeout, on_result=None):
+  # {url: (status, error, etag, last_modified)}; urls maps each URL to the
+  # (etag, last_modified) of its previous check. on_result(url, result) is
+  # called as each fetch completes.
+  import aiohttp
+  slots = asyncio.Semaphore(concurrency)
+  host_slots = dict()
+  results = dict()
+
+  async def check(session, url):
+    host = urlsplit(url).hostname or ''
+    host_slot = host_slots.setdefault(host, asyncio.Semaphore(per_host))
+    # the host slot first, so a busy host does not hold slots others could use
+    async with host_slot:
+      async with slots:
+        results[url] = await fetch_status(session, url, urls[url], timeout)
+    if on_result is not None:
+      on_result(url, results[url])
+
+  connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=per_host)
+  async with aiohttp.ClientSession(connector=connector, headers={'User-Agent': USER_AGENT}) as session:
+    await asyncio.gather(*[check(session, url) for url in urls])
+  return results
+
+#  Checking
+#  ----------------------------------------------------------------
+
+def check_links(max_age=timedelta(days=7), concurrency=50, per_host=4, timeout=10.0):
+  # check the stale links and store the results; returns (links checked,
+  # dead links among them)
+  now = datetime.utcnow()
+  links = current_links()
+  checks = dict(((check.entity, check.entity_id, check.field), check) for check in LinkCheck.query)
+
+  # links that were removed, or whose record is gone
+  for key, check in list(checks.items()):
+    if key not in links:
+      db.session.delete(check)
+      del checks[key]
+  db.session.commit()
+
+  # the previous check of each link, read before commits expire the rows
+  previous = dict((key, (check.url, check.status, check.etag, check.last_modified)) for key, check in checks.items())
+  stale = dict()
+  for key, url in links.items():
+    check = checks.get(key)
+    if check is None or check.url != url or check.checked_at < now - max_age:
+      stale[key] = url
+
+  urls = dict()
+  keys = dict()
+  for key, url in stale.items():
+    keys.setdefault(url, []).append(key)
+    if previous.get(key, (None,))[0] == url:
+      urls[url] = previous[key][2:]
+    else:
+      urls.setdefault(url, (None, None))
+
+  checked = dead = 0
+  def store(url, result):
+    # the checks of every link to url; committed every WRITE_BATCH_SIZE rows
+    nonlocal checked, dead
+    status, error, etag, last_modified = result
+    for key in keys[url]:
+      check = checks.get(key)
+      if check is None:
+        check = checks[key] = LinkCheck(entity=key[0], entity_id=key[1], field=key[2])
+        db.session.add(check)
+      old_url, old_status, old_etag, old_last_modified = previous.get(key, (None, None, None, None))
+      if status == 304:
+        # unchanged since the last check of this URL
+        check.status = old_status if old_url == url and old_status is not None else 200
+        check.etag = etag or old_etag
+        check.last_modified = last_modified or old_last_modified
+      else:
+        check.status = status
+        check.etag = etag
+        check.last_modified = last_modified
+      check.url = url
+      check.error = error
+      check.checked_at = datetime.utcnow()
+      checked += 1
+      if is_dead(check.status):
+        dead += 1
+      if checked % WRITE_BATCH_SIZE == 0:
+        db.session.commit()
+
+  fetchable = dict()
+  for url, validators in urls.items():
+    if urlsplit(url).scheme in ('http', 'https'):
+      fetchable[url] = validators
+    else:
+      store(url, (None, 'not an http(s) URL', None, None))
+  if fetchable:
+    asyncio.run(fetch_all(fetchable, concurrency, per_host, timeout, store))
+  db.session.commit()
+  return checked, dead
+
+def dead_links():
+  # LinkChecks of links that failed their last check
+  return LinkCheck.query \
+    .filter(db.or_(LinkCheck.status.is_(None), LinkCheck.status >= 400)) \
+    .order_by(LinkCheck.entity, LinkCheck.entity_id, LinkCheck.field) \
+    .all()
@@ -0,0 +1,174 @@
+#----------------------------------------------------------------------------#
+# Logging.
+#
+# Request threads never touch a file: records go onto a bounded in-memory
+# queue and a background QueueListener writes them to files. When the queue
+# is full, DEBUG records are dropped immediately and anything more important
+# waits at most LOG_QUEUE_BLOCK_SECONDS before being dropped too, so a
+# stalled disk cannot stall requests. Dropped records are counted.
+#
+# The queue and listener thread are per process; after a fork (gunicorn
+# workers) they are recreated on first use. All workers append to the same
+# files, so none of them rotates: rotate externally (logrotate) by moving
+# the file away, and each worker reopens it on its next record.
+#----------------------------------------------------------------------------#
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from logging import Formatter
+from logging.handlers import QueueHandler, QueueListener, WatchedFileHandler
+
+from flask import g, request
+
+ACCESS_LOGGER = 'fyyur.access'
+
+
+class JsonFormatter(Formatter):
+  # one JSON object per line: the standard fields plus any `extra` fields
+
+  RESERVED = set(logging.makeLogRecord({}).__dict__) | {'message', 'asctime'}
+
+  def format(self, record):
+    data = {
+      'time': datetime.utcfromtimestamp(record.created).isoformat() + 'Z',
+      'level': record.levelname,
+      'logger': record.name,
+      'message': record.getMessage(),
+    }
+    for key, value in record.__dict__.items():
+      if key not in self.RESERVED:
+        data[key] = value
+    return json.dumps(data, default=str)
+
+
+class BoundedQueueHandler(QueueHandler):
+
+  def __init__(self, logs):
+    QueueHandler.__init__(self, None)
+    self.logs = logs
+
+  def enqueue(self, record):
+    log_queue = self.logs.process_queue()
+    try:
+      log_queue.put_nowait(record)
+      return
+    except queue.Full:
+      pass
+    if record.levelno > logging.DEBUG and self.logs.block_seconds > 0:
+      try:
+        log_queue.put(record, timeout=self.logs.block_seconds)
+        return
+      except queue.Full:
+        pass
+    self.logs.dropped += 1
+
+
+class QueueLogging(object):
+
+  def __init__(self):
+    self.handlers = []
+    self.queue = None
+    self.listener = None
+    self.pid = None
+    self.lock = threading.Lock()
+    self.dropped = 0
+    self.block_seconds = 0
+    self.size = 10000
+    self.exit_registered = False
+
+  def process_queue(self):
+    # the queue of this process, (re)starting the listener after a fork
+    if self.pid != os.getpid():
+      with self.lock:
+        if self.pid != os.getpid():
+          self.queue = queue.Queue(self.size)
+          self.listener = QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+          self.listener.start()
+          self.pid = os.getpid()
+    return self.queue
+
+  def stop(self):
+    # flush what is queued; used at interpreter exit
+    if self.listener is not None and self.pid == os.getpid():
+      self.listener.stop()
+      self.pid = None
+
+  def init_app(self, app):
+    # the files of the latest app replace those of an earlier one
+    self.stop()
+    for handler in self.handlers:
+      handler.close()
+    self.handlers = []
+    config = app.config
+    self.size = config.get('LOG_QUEUE_SIZE', 10000)
+    self.block_seconds = config.get('LOG_QUEUE_BLOCK_SECONDS', 0.05)
+    log_dir = config.get('LOG_DIR', '.')
+
+    if config.get('ERROR_LOG'):
+      error_handler = WatchedFileHandler(os.path.join(log_dir, config['ERROR_LOG']))
+      error_handler.setFormatter(
+        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+      )
+      error_handler.setLevel(logging.INFO)
+      error_handler.addFilter(lambda record: record.name != ACCESS_LOGGER)
+      self.handlers.append(error_handler)
+
+    if config.get('ACCESS_LOG'):
+      access_handler = WatchedFileHandler(os.path.join(log_dir, config['ACCESS_LOG']))
+      access_handler.setFormatter(JsonFormatter())
+      access_handler.addFilter(logging.Filter(ACCESS_LOGGER))
+      self.handlers.append(access_handler)
+
+      access_logger = logging.getLogger(ACCESS_LOGGER)
+      access_logger.setLevel(logging.INFO)
+      access_logger.propagate = False
+      self.attach(access_logger)
+      app.before_request(start_timer)
+      app.after_request(log_request)
+
+    if self.handlers:
+      app.logger.setLevel(logging.INFO)
+      self.attach(app.logger)
+
+    if not self.exit_registered:
+      import atexit
+      atexit.register(self.stop)
+      self.exit_registered = True
+
+  def attach(self, logger):
+    # loggers are shared by every app created in this process; each gets
+    # one queue handler
+    if not any(isinstance(handler, BoundedQueueHandler) for handler in logger.handlers):
+      logger.addHandler(BoundedQueueHandler(self))
+
+
+def start_timer():
+  g.request_started = time.perf_counter()
+
+
+def log_request(response):
+  # logged when the response is closed, so streamed pages report their
+  # full duration
+  started = getattr(g, 'request_started', None)
+  method, path, remote_addr = request.method, request.full_path.rstrip('?'), request.remote_addr
+  user_agent = request.user_agent.string
+  endpoint = request.endpoint
+
+  def log():
+    logging.getLogger(ACCESS_LOGGER).info('request', extra={
+      'method': method,
+      'path': path,
+      'endpoint': endpoint,
+      'status': response.status_code,
+      'bytes': response.calculate_content_length(),
+      'duration_ms': round((time.perf_counter() - started) * 1000, 2) if started else None,
+      'remote_addr': remote_addr,
+      'user_agent': user_agent,
+    })
+  response.call_on_close(log)
+  return response
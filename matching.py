@@ -0,0 +1,175 @@
+#----------------------------------------------------------------------------#
+# Matchmaking between venues seeking talent and artists seeking venues.
+#
+# The index keeps one compact record per seeking venue and artist plus
+# inverted postings by state, (state, city) and genre, so a lookup only
+# scores the candidates that share at least a state or a genre with the
+# subject instead of scanning every row. It lives in process memory: it is
+# built lazily from the database on first use and re-indexes profiles as
+# committed edits are reported by changes.py. Each app has its own index;
+# match_index is the one of the current app.
+#----------------------------------------------------------------------------#
+
+import heapq
+import threading
+from collections import namedtuple
+
+from flask import current_app
+from werkzeug.local import LocalProxy
+
+from extensions import db
+from models import Venue, Artist
+from changes import on_change, on_flush
+import shards
+
+Profile = namedtuple('Profile', ['id', 'name', 'city', 'state', 'genres'])
+
+CITY_SCORE = 4
+STATE_SCORE = 2
+GENRE_SCORE = 3
+
+SIDES = ('venue', 'artist')
+
+
+def normalize(value):
+  return (value or '').strip().lower()
+
+
+class Side(object):
+  # the profiles and postings of one side of the market
+
+  def __init__(self):
+    self.profiles = dict()
+    self.by_state = dict()
+    self.by_city = dict()
+    self.by_genre = dict()
+
+  def postings(self, profile):
+    yield self.by_state, normalize(profile.state)
+    yield self.by_city, (normalize(profile.state), normalize(profile.city))
+    for genre in profile.genres:
+      yield self.by_genre, genre
+
+  def add(self, profile):
+    self.remove(profile.id)
+    self.profiles[profile.id] = profile
+    for postings, key in self.postings(profile):
+      postings.setdefault(key, set()).add(profile.id)
+
+  def remove(self, profile_id):
+    profile = self.profiles.pop(profile_id, None)
+    if profile is None:
+      return
+    for postings, key in self.postings(profile):
+      ids = postings.get(key)
+      if ids is not None:
+        ids.discard(profile_id)
+        if not ids:
+          del postings[key]
+
+
+class MatchIndex(object):
+
+  def __init__(self, loader=None):
+    # loader(side) returns an iterable of (id, name, city, state, genres)
+    # tuples for every seeking venue or artist
+    self.loader = loader
+    self.lock = threading.RLock()
+    self.sides = None
+
+  def profile(self, id, name, city, state, genres):
+    if isinstance(genres, str):
+      genres = genres.split(', ')
+    return Profile(id, name, city, state, frozenset(normalize(g) for g in genres if g))
+
+  def ensure_loaded(self):
+    if self.sides is not None:
+      return
+    with self.lock:
+      if self.sides is not None:
+        return
+      sides = dict((side, Side()) for side in SIDES)
+      for side in SIDES:
+        for row in self.loader(side):
+          sides[side].add(self.profile(*row))
+      self.sides = sides
+
+  def clear(self):
+    # forget everything; the next lookup rebuilds from the database
+    with self.lock:
+      self.sides = None
+
+  def update(self, side, id, row=None):
+    # index or re-index one profile; row is None when it is no longer seeking
+    # (or was deleted)
+    with self.lock:
+      if self.sides is None:
+        return
+      if row is None:
+        self.sides[side].remove(id)
+      else:
+        self.sides[side].add(self.profile(*row))
+
+  def matches(self, side, id, limit=10):
+    # best candidates on the other side for profile <id>, as
+    # [(score, Profile)], highest score first. Empty when <id> is not seeking.
+    self.ensure_loaded()
+    with self.lock:
+      subject = self.sides[side].profiles.get(id)
+      if subject is None:
+        return []
+      other = self.sides['artist' if side == 'venue' else 'venue']
+
+      state = normalize(subject.state)
+      city = (state, normalize(subject.city))
+      scores = dict()
+      for candidate in other.by_state.get(state, ()):
+        scores[candidate] = STATE_SCORE
+      for candidate in other.by_city.get(city, ()):
+        scores[candidate] = scores.get(candidate, 0) + CITY_SCORE
+      for genre in subject.genres:
+        for candidate in other.by_genre.get(genre, ()):
+          scores[candidate] = scores.get(candidate, 0) + GENRE_SCORE
+
+      best = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+      return [(score, other.profiles[candidate]) for candidate, score in best]
+
+
+def seeking_profiles(side, **criteria):
+  # (id, name, city, state, genres) of the venues seeking talent or the
+  # artists seeking a venue
+  if side == 'venue':
+    model, seeking = Venue, Venue.seeking_talent
+  else:
+    model, seeking = Artist, Artist.seeking_venue
+  return db.session.query(model.id, model.name, model.city, model.state, model.genres) \
+    .filter(seeking == True) \
+    .filter_by(**criteria)
+
+def load_profiles(side):
+  if side == 'venue':
+    return shards.gather(lambda: seeking_profiles(side).all())
+  return seeking_profiles(side).yield_per(5000)
+
+match_index = LocalProxy(lambda: current_app.extensions['match_index'])
+
+@on_change
+def update_match_index(changes):
+  for entity, id, action in changes:
+    if entity in ('Venue', 'Artist'):
+      side = entity.lower()
+      with shards.for_venue(id) if side == 'venue' else shards.nowhere():
+        match_index.update(side, id, seeking_profiles(side, id=id).first())
+
+@on_flush
+def flush_match_index():
+  match_index.clear()
+
+def match_data(side, id, limit=10):
+  return [
+    {'id': profile.id, 'name': profile.name, 'city': profile.city, 'state': profile.state, 'score': score}
+    for score, profile in match_index.matches(side, id, limit)
+  ]
+
+def init_app(app):
+  app.extensions['match_index'] = MatchIndex(load_profiles)
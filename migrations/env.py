@@ -5,6 +5,7 @@ from logging.config import fileConfig
 
 from sqlalchemy import engine_from_config
 from sqlalchemy import pool
+from sqlalchemy import text
 
 from alembic import context
 
@@ -47,7 +48,8 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=target_metadata, literal_binds=True
+        url=url, target_metadata=target_metadata, literal_binds=True,
+        transaction_per_migration=True
     )
 
     with context.begin_transaction():
@@ -79,10 +81,21 @@ def run_migrations_online():
     )
 
     with connectable.connect() as connection:
+        # give up on a lock after MIGRATION_LOCK_TIMEOUT ms rather than queue
+        # every query on the table behind the migration; rerun to retry
+        lock_timeout = current_app.config.get('MIGRATION_LOCK_TIMEOUT')
+        if lock_timeout and connection.dialect.name == 'postgresql':
+            connection.execute(text('SET lock_timeout = %d' % lock_timeout))
+            connection.commit()
+
+        # one transaction per revision, so online_migrations helpers can
+        # commit outside of it (autocommit_block) and a failed revision
+        # leaves the ones before it applied
         context.configure(
             connection=connection,
             target_metadata=target_metadata,
             process_revision_directives=process_revision_directives,
+            transaction_per_migration=True,
             **current_app.extensions['migrate'].configure_args
         )
 
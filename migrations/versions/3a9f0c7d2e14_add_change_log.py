@@ -0,0 +1,37 @@
+"""Add ChangeLog table
+
+Revision ID: 3a9f0c7d2e14
+Revises: e81f4c6a2d95
+Create Date: 2026-10-19 19:02:37.118406
+
+Changes made before this revision are not in the log; mirrors start with a
+full crawl and then follow /api/changes.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3a9f0c7d2e14'
+down_revision = 'e81f4c6a2d95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ChangeLog',
+    sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), nullable=False),
+    sa.Column('txid', sa.BigInteger(), nullable=False),
+    sa.Column('entity', sa.String(length=20), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('action', sa.String(length=10), nullable=False),
+    sa.Column('changed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_ChangeLog_txid_id', 'ChangeLog', ['txid', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_ChangeLog_txid_id', table_name='ChangeLog')
+    op.drop_table('ChangeLog')
@@ -0,0 +1,37 @@
+"""Add LinkCheck table
+
+Revision ID: 5d8b2e6f4c19
+Revises: 7c2d5e8f1a63
+Create Date: 2026-10-19 21:03:47.812540
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d8b2e6f4c19'
+down_revision = '7c2d5e8f1a63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('LinkCheck',
+    sa.Column('entity', sa.String(length=20), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('field', sa.String(length=40), nullable=False),
+    sa.Column('url', sa.String(length=500), nullable=False),
+    sa.Column('status', sa.Integer(), nullable=True),
+    sa.Column('error', sa.String(length=200), nullable=True),
+    sa.Column('etag', sa.String(length=200), nullable=True),
+    sa.Column('last_modified', sa.String(length=100), nullable=True),
+    sa.Column('checked_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('entity', 'entity_id', 'field')
+    )
+    op.create_index(op.f('ix_LinkCheck_checked_at'), 'LinkCheck', ['checked_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_LinkCheck_checked_at'), table_name='LinkCheck')
+    op.drop_table('LinkCheck')
@@ -0,0 +1,31 @@
+"""Add ShardDirectory table
+
+Revision ID: 7c2d5e8f1a63
+Revises: 3a9f0c7d2e14
+Create Date: 2026-10-19 19:41:05.530217
+
+Only used when SHARDS is configured; run `flask shards init` afterwards.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2d5e8f1a63'
+down_revision = '3a9f0c7d2e14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ShardDirectory',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('entity', sa.String(length=20), nullable=False),
+    sa.Column('shard', sa.String(length=40), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('ShardDirectory')
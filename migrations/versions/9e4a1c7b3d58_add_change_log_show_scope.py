@@ -0,0 +1,27 @@
+"""Add venue and artist of show changes to ChangeLog
+
+Revision ID: 9e4a1c7b3d58
+Revises: 5d8b2e6f4c19
+Create Date: 2026-10-19 23:12:05.406117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e4a1c7b3d58'
+down_revision = '5d8b2e6f4c19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # nullable without a default: no table rewrite on PostgreSQL
+    op.add_column('ChangeLog', sa.Column('venue_id', sa.Integer(), nullable=True))
+    op.add_column('ChangeLog', sa.Column('artist_id', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('ChangeLog', 'artist_id')
+    op.drop_column('ChangeLog', 'venue_id')
@@ -0,0 +1,120 @@
+"""Partition Show by start_time and add ShowArchive
+
+Revision ID: 9e4d2b7c1f38
+Revises: 6b3e1f2a9c47
+Create Date: 2026-10-19 13:41:09.672310
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e4d2b7c1f38'
+down_revision = '6b3e1f2a9c47'
+branch_labels = None
+depends_on = None
+
+# months of future partitions created up front
+AHEAD = 3
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def upgrade():
+    op.create_table('ShowArchive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=True),
+    sa.Column('venue_id', sa.Integer(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_ShowArchive_artist_id'), 'ShowArchive', ['artist_id'], unique=False)
+    op.create_index(op.f('ix_ShowArchive_venue_id'), 'ShowArchive', ['venue_id'], unique=False)
+
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        # Postgres cannot partition an existing table in place: rebuild it as a
+        # partitioned table reusing the id sequence, then copy the rows over.
+        op.execute('ALTER TABLE "Show" RENAME TO "Show_legacy"')
+        op.execute('ALTER TABLE "Show_legacy" RENAME CONSTRAINT "Show_pkey" TO "Show_legacy_pkey"')
+        op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY NONE')
+        op.execute('''
+            CREATE TABLE "Show" (
+                id integer NOT NULL DEFAULT nextval('"Show_id_seq"'),
+                start_time timestamp without time zone NOT NULL,
+                artist_id integer REFERENCES "Artist" (id),
+                venue_id integer REFERENCES "Venue" (id),
+                PRIMARY KEY (id, start_time)
+            ) PARTITION BY RANGE (start_time)
+        ''')
+        op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
+        op.execute('CREATE TABLE "Show_default" PARTITION OF "Show" DEFAULT')
+
+        lowest, highest = bind.execute(sa.text(
+            'SELECT min(start_time), max(start_time) FROM "Show_legacy"'
+        )).first()
+        today = datetime.today()
+        month = datetime((lowest or today).year, (lowest or today).month, 1)
+        last = add_months(datetime(today.year, today.month, 1), AHEAD)
+        if highest is not None and highest > last:
+            last = datetime(highest.year, highest.month, 1)
+        while month <= last:
+            op.execute(
+                'CREATE TABLE "Show_p%04d_%02d" PARTITION OF "Show" FOR VALUES FROM (\'%s\') TO (\'%s\')'
+                % (month.year, month.month, month.isoformat(), add_months(month, 1).isoformat())
+            )
+            month = add_months(month, 1)
+
+        op.execute(
+            'INSERT INTO "Show" (id, start_time, artist_id, venue_id) '
+            'SELECT id, start_time, artist_id, venue_id FROM "Show_legacy"'
+        )
+        op.execute('DROP TABLE "Show_legacy"')
+    else:
+        with op.batch_alter_table('Show') as batch_op:
+            batch_op.alter_column('start_time', existing_type=sa.DateTime(), nullable=False)
+
+    op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Show_artist_id_start_time', table_name='Show')
+    op.drop_index('ix_Show_venue_id_start_time', table_name='Show')
+
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        op.execute('ALTER TABLE "Show" RENAME TO "Show_partitioned"')
+        op.execute('ALTER TABLE "Show_partitioned" RENAME CONSTRAINT "Show_pkey" TO "Show_partitioned_pkey"')
+        op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY NONE')
+        op.execute('''
+            CREATE TABLE "Show" (
+                id integer NOT NULL DEFAULT nextval('"Show_id_seq"') PRIMARY KEY,
+                start_time timestamp without time zone,
+                artist_id integer REFERENCES "Artist" (id),
+                venue_id integer REFERENCES "Venue" (id)
+            )
+        ''')
+        op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
+        op.execute(
+            'INSERT INTO "Show" (id, start_time, artist_id, venue_id) '
+            'SELECT id, start_time, artist_id, venue_id FROM "Show_partitioned"'
+        )
+        op.execute('DROP TABLE "Show_partitioned" CASCADE')
+    else:
+        with op.batch_alter_table('Show') as batch_op:
+            batch_op.alter_column('start_time', existing_type=sa.DateTime(), nullable=True)
+
+    op.execute(
+        'INSERT INTO "Show" (id, start_time, artist_id, venue_id) '
+        'SELECT id, start_time, artist_id, venue_id FROM "ShowArchive"'
+    )
+    op.drop_index(op.f('ix_ShowArchive_venue_id'), table_name='ShowArchive')
+    op.drop_index(op.f('ix_ShowArchive_artist_id'), table_name='ShowArchive')
+    op.drop_table('ShowArchive')
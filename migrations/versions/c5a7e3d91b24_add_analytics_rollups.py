@@ -0,0 +1,43 @@
+"""Add analytics rollup tables
+
+Revision ID: c5a7e3d91b24
+Revises: 9e4d2b7c1f38
+Create Date: 2026-10-19 15:20:53.209847
+
+Run `flask analytics rebuild` once after upgrading to count existing shows.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5a7e3d91b24'
+down_revision = '9e4d2b7c1f38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ShowCountByCity',
+    sa.Column('city', sa.String(length=120), nullable=False),
+    sa.Column('state', sa.String(length=120), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('city', 'state')
+    )
+    op.create_table('ShowCountByGenre',
+    sa.Column('genre', sa.String(length=120), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('genre')
+    )
+    op.create_table('ShowCountByMonth',
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('month')
+    )
+
+
+def downgrade():
+    op.drop_table('ShowCountByMonth')
+    op.drop_table('ShowCountByGenre')
+    op.drop_table('ShowCountByCity')
@@ -0,0 +1,33 @@
+"""Add ArtistSimilarity table
+
+Revision ID: e81f4c6a2d95
+Revises: c5a7e3d91b24
+Create Date: 2026-10-19 16:48:12.774031
+
+Run `flask artists similar` once after upgrading to fill the table.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e81f4c6a2d95'
+down_revision = 'c5a7e3d91b24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ArtistSimilarity',
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('similar_artist_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('artist_id', 'similar_artist_id')
+    )
+    op.create_index(op.f('ix_ArtistSimilarity_similar_artist_id'), 'ArtistSimilarity', ['similar_artist_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_ArtistSimilarity_similar_artist_id'), table_name='ArtistSimilarity')
+    op.drop_table('ArtistSimilarity')
@@ -0,0 +1,213 @@
+#----------------------------------------------------------------------------#
+# Models.
+#----------------------------------------------------------------------------#
+
+from datetime import datetime
+
+from extensions import db
+
+class Venue(db.Model):
+    __tablename__ = 'Venue'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String)
+    city = db.Column(db.String(120))
+    state = db.Column(db.String(120))
+    address = db.Column(db.String(120))
+    phone = db.Column(db.String(120))
+    genres = db.Column(db.String(120))
+    website = db.Column(db.String(120))
+    image_link = db.Column(db.String(500))
+    facebook_link = db.Column(db.String(120))
+    seeking_talent = db.Column(db.Boolean, default=False)
+    seeking_description = db.Column(db.String)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    shows = db.relationship("Show", backref="Venue", cascade="all, delete-orphan")
+
+class Artist(db.Model):
+    __tablename__ = 'Artist'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String)
+    city = db.Column(db.String(120))
+    state = db.Column(db.String(120))
+    phone = db.Column(db.String(120))
+    genres = db.Column(db.String(120))
+    image_link = db.Column(db.String(500))
+    website = db.Column(db.String(120))
+    facebook_link = db.Column(db.String(120))
+    seeking_venue = db.Column(db.Boolean, default=False)
+    seeking_description = db.Column(db.String)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    shows = db.relationship("Show", backref="Artist", cascade="all, delete-orphan")
+
+class Show(db.Model):
+    # on PostgreSQL this table is range-partitioned by month of start_time,
+    # see partitions.py
+    __tablename__ = 'Show'
+
+    id = db.Column(db.Integer, primary_key=True)
+    start_time = db.Column(db.DateTime, nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey("Artist.id"))
+    venue_id = db.Column(db.Integer, db.ForeignKey("Venue.id"))
+
+    __table_args__ = (
+      db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+      db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+    )
+
+class ShowArchive(db.Model):
+    # past shows moved out of Show by `flask shows maintain`
+    __tablename__ = 'ShowArchive'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    artist_id = db.Column(db.Integer, index=True)
+    venue_id = db.Column(db.Integer, index=True)
+
+class ShowCountByCity(db.Model):
+    # analytics rollup, maintained by the Show insert/delete listeners
+    __tablename__ = 'ShowCountByCity'
+
+    city = db.Column(db.String(120), primary_key=True)
+    state = db.Column(db.String(120), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class ShowCountByGenre(db.Model):
+    # analytics rollup; a show counts once for each of its artist's genres
+    __tablename__ = 'ShowCountByGenre'
+
+    genre = db.Column(db.String(120), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class ShowCountByMonth(db.Model):
+    # analytics rollup keyed by the first day of the month of start_time
+    __tablename__ = 'ShowCountByMonth'
+
+    month = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class ArtistSimilarity(db.Model):
+    # precomputed top-k similar artists, see similarity.py
+    __tablename__ = 'ArtistSimilarity'
+
+    artist_id = db.Column(db.Integer, primary_key=True)
+    similar_artist_id = db.Column(db.Integer, primary_key=True, index=True)
+    score = db.Column(db.Float, nullable=False)
+
+class Job(db.Model):
+    __tablename__ = 'Job'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False)
+    payload = db.Column(db.Text)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_Job_status_run_at', 'status', 'run_at'),)
+
+class ChangeLog(db.Model):
+    # one row per created/updated/deleted Venue, Artist or Show, written in
+    # the same transaction as the change; read by /api/changes
+    __tablename__ = 'ChangeLog'
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    # writing transaction on PostgreSQL (0 elsewhere), see changes.py
+    txid = db.Column(db.BigInteger, nullable=False, default=0)
+    entity = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(10), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # of Show changes, so the show event stream can filter deletes too
+    venue_id = db.Column(db.Integer)
+    artist_id = db.Column(db.Integer)
+
+    __table_args__ = (db.Index('ix_ChangeLog_txid_id', 'txid', 'id'),)
+
+class ShardDirectory(db.Model):
+    # hands out Venue and Show ids when SHARDS is set and records the shard
+    # each one was created on, see shards.py
+    __tablename__ = 'ShardDirectory'
+
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(20), nullable=False)
+    shard = db.Column(db.String(40), nullable=False)
+
+class LinkCheck(db.Model):
+    # last check of a website/facebook_link/image_link of a Venue or Artist,
+    # written by `flask links check`, see links.py
+    __tablename__ = 'LinkCheck'
+
+    entity = db.Column(db.String(20), primary_key=True)
+    entity_id = db.Column(db.Integer, primary_key=True)
+    field = db.Column(db.String(40), primary_key=True)
+    url = db.Column(db.String(500), nullable=False)
+    # HTTP status of the final response, None when no response came back
+    status = db.Column(db.Integer)
+    error = db.Column(db.String(200))
+    # validators for the next conditional request
+    etag = db.Column(db.String(200))
+    last_modified = db.Column(db.String(100))
+    checked_at = db.Column(db.DateTime, nullable=False, index=True)
+
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+def upcoming_shows(**criteria):
+  # only touches the current and future partitions of Show
+  return Show.query.filter_by(**criteria) \
+    .filter(Show.start_time >= datetime.today()) \
+    .order_by(Show.start_time)
+
+def past_shows(**criteria):
+  # past shows still in Show, most recent first, followed by archived ones
+  recent = Show.query.filter_by(**criteria) \
+    .filter(Show.start_time < datetime.today()) \
+    .order_by(Show.start_time.desc()) \
+    .all()
+  archived = ShowArchive.query.filter_by(**criteria) \
+    .order_by(ShowArchive.start_time.desc()) \
+    .all()
+  return recent + archived
+
+def list_rows(model, columns=('id', 'name'), search_term=None, count_upcoming=False):
+  # only the named columns of Venue/Artist as lightweight Row tuples (row.id,
+  # row.name, ...) instead of full instances, for lists and search results.
+  # count_upcoming adds row.num_upcoming_shows from one grouped subquery
+  # rather than a COUNT per row.
+  query = db.session.query(*[getattr(model, column) for column in columns])
+  if search_term is not None:
+    query = query.filter(model.name.ilike('%' + search_term + '%'))
+  if count_upcoming:
+    owner = Show.venue_id if model is Venue else Show.artist_id
+    counts = db.session.query(owner.label('owner_id'), db.func.count(Show.id).label('shows')) \
+      .filter(Show.start_time >= datetime.today()) \
+      .group_by(owner) \
+      .subquery()
+    query = query.outerjoin(counts, counts.c.owner_id == model.id) \
+      .add_columns(db.func.coalesce(counts.c.shows, 0).label('num_upcoming_shows'))
+  return query.order_by(model.id)
+
+def upcoming_counts(column, ids, batch_size=1000):
+  # {venue or artist id: number of upcoming shows} for Show.<column> in ids,
+  # summed over every shard
+  import shards
+  counts = dict()
+  ids = list(ids)
+  owner = getattr(Show, column)
+  for start in range(0, len(ids), batch_size):
+    batch = ids[start:start + batch_size]
+    query = lambda: db.session.query(owner, db.func.count(Show.id)) \
+      .filter(owner.in_(batch), Show.start_time >= datetime.today()) \
+      .group_by(owner) \
+      .all()
+    for rows in shards.fan_out(query):
+      for id, count in rows:
+        counts[id] = counts.get(id, 0) + count
+  return counts
+
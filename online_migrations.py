@@ -0,0 +1,280 @@
+#----------------------------------------------------------------------------#
+# Online migrations.
+#
+# Alembic runs each revision in its own transaction (migrations/env.py) and
+# on PostgreSQL every migration statement gives up after
+# MIGRATION_LOCK_TIMEOUT milliseconds waiting for a lock, instead of queueing
+# all traffic on the table behind it. Revisions that change big, busy tables
+# (Show above all) use these helpers rather than the plain op.* calls:
+#
+#   from online_migrations import create_index_concurrently, backfill
+#
+#   create_index_concurrently('ix_Show_start_time', 'Show', ['start_time'])
+#   backfill('Venue', {'city_slug': 'lower(city)'}, where='city_slug IS NULL')
+#
+# Both commit as they go, outside the revision's transaction, so they have to
+# be safe to rerun: an interrupted index build leaves an invalid index that
+# the next run drops and builds again, and a backfill's `where` must skip the
+# rows already done. On other databases they fall back to the plain
+# operations.
+#
+# `flask migrations preflight` renders the pending revisions as SQL and lists
+# the statements that would hold long table locks, see preflight().
+#----------------------------------------------------------------------------#
+
+import io
+import logging
+import re
+import time
+
+import sqlalchemy as sa
+
+logger = logging.getLogger('alembic.online')
+
+# seconds between backfill progress lines
+REPORT_EVERY = 5.0
+
+# statements emitted by the helpers in offline mode carry this marker so
+# preflight() knows they run in batches or concurrently when run online
+ONLINE_MARKER = '/* online */ '
+
+
+def is_postgresql():
+  from alembic import op
+  return op.get_context().dialect.name == 'postgresql'
+
+def is_offline():
+  from alembic import op
+  return op.get_context().as_sql
+
+def quote(name):
+  from alembic import op
+  return op.get_context().dialect.identifier_preparer.quote(name)
+
+def is_partitioned(table_name):
+  from alembic import op
+  return bool(op.get_bind().execute(sa.text(
+    'SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:name)'
+  ), {'name': quote(table_name)}).scalar())
+
+def partitions_of(table_name):
+  from alembic import op
+  return list(op.get_bind().execute(sa.text(
+    'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+    'WHERE i.inhparent = to_regclass(:name) ORDER BY c.relname'
+  ), {'name': quote(table_name)}).scalars())
+
+def drop_invalid_index(index_name):
+  # left behind by a concurrent build that failed or was interrupted
+  from alembic import op
+  invalid = op.get_bind().execute(sa.text(
+    'SELECT 1 FROM pg_index WHERE indexrelid = to_regclass(:name) AND NOT indisvalid'
+  ), {'name': quote(index_name)}).scalar()
+  if invalid:
+    logger.info('dropping invalid index %s', index_name)
+    op.execute('DROP INDEX CONCURRENTLY IF EXISTS %s' % quote(index_name))
+
+#  Indexes
+#  ----------------------------------------------------------------
+
+def create_index_concurrently(index_name, table_name, columns, unique=False):
+  # build an index without blocking writes to the table
+  from alembic import op
+  if not is_postgresql():
+    op.create_index(index_name, table_name, columns, unique=unique)
+    return
+  create = 'CREATE %sINDEX' % ('UNIQUE ' if unique else '')
+  column_list = ', '.join(quote(column) for column in columns)
+  with op.get_context().autocommit_block():
+    if is_offline():
+      op.execute('%s%s CONCURRENTLY IF NOT EXISTS %s ON %s (%s)' % (
+        ONLINE_MARKER, create, quote(index_name), quote(table_name), column_list))
+      return
+    if not is_partitioned(table_name):
+      drop_invalid_index(index_name)
+      op.execute('%s CONCURRENTLY IF NOT EXISTS %s ON %s (%s)' % (
+        create, quote(index_name), quote(table_name), column_list))
+      return
+    # a partitioned table refuses CONCURRENTLY: create the parent index on
+    # the parent alone (instant, invalid until complete), build each
+    # partition's index concurrently and attach it
+    op.execute('%s IF NOT EXISTS %s ON ONLY %s (%s)' % (
+      create, quote(index_name), quote(table_name), column_list))
+    for partition in partitions_of(table_name):
+      child = ('%s_%s_idx' % (partition, '_'.join(columns)))[:63]
+      drop_invalid_index(child)
+      op.execute('%s CONCURRENTLY IF NOT EXISTS %s ON %s (%s)' % (
+        create, quote(child), quote(partition), column_list))
+      op.execute('ALTER INDEX %s ATTACH PARTITION %s' % (quote(index_name), quote(child)))
+
+def drop_index_concurrently(index_name, table_name):
+  from alembic import op
+  if not is_postgresql():
+    op.drop_index(index_name, table_name=table_name)
+    return
+  with op.get_context().autocommit_block():
+    if not is_offline() and is_partitioned(table_name):
+      # partitioned indexes cannot be dropped concurrently; dropping is quick
+      op.execute('DROP INDEX IF EXISTS %s' % quote(index_name))
+    else:
+      op.execute('%sDROP INDEX CONCURRENTLY IF EXISTS %s' % (
+        ONLINE_MARKER if is_offline() else '', quote(index_name)))
+
+#  Backfills
+#  ----------------------------------------------------------------
+
+def backfill(table_name, values, where=None, batch_size=1000, pause=0.1, key='id'):
+  # UPDATE table_name SET column = expression, ... [WHERE where] in batches
+  # of batch_size rows ordered by key, each committed on its own, sleeping
+  # `pause` seconds in between so replicas and other writers keep up.
+  # Returns the number of rows updated.
+  from alembic import op
+  table = quote(table_name)
+  assignments = ', '.join('%s = %s' % (quote(column), expression) for column, expression in values.items())
+  condition = '(%s)' % where if where else '1 = 1'
+
+  if is_offline():
+    # no connection to batch with; the script gets the plain UPDATE
+    op.execute('%sUPDATE %s SET %s WHERE %s' % (ONLINE_MARKER, table, assignments, condition))
+    return 0
+
+  select_batch = sa.text(
+    'SELECT %s FROM %s WHERE %s AND %s > :last ORDER BY %s LIMIT :limit'
+    % (quote(key), table, condition, quote(key), quote(key))
+  )
+  select_first = sa.text(
+    'SELECT %s FROM %s WHERE %s ORDER BY %s LIMIT :limit' % (quote(key), table, condition, quote(key))
+  )
+  update_batch = sa.text(
+    'UPDATE %s SET %s WHERE %s IN :keys AND %s' % (table, assignments, quote(key), condition)
+  ).bindparams(sa.bindparam('keys', expanding=True))
+
+  done = 0
+  last = None
+  started = reported = time.monotonic()
+  with op.get_context().autocommit_block():
+    # the block runs on its own autocommit connection
+    bind = op.get_bind()
+    total = bind.execute(sa.text('SELECT count(*) FROM %s WHERE %s' % (table, condition))).scalar()
+    logger.info('backfilling %d rows of %s', total, table_name)
+    while True:
+      if last is None:
+        keys = list(bind.execute(select_first, {'limit': batch_size}).scalars())
+      else:
+        keys = list(bind.execute(select_batch, {'last': last, 'limit': batch_size}).scalars())
+      if not keys:
+        break
+      done += bind.execute(update_batch, {'keys': keys}).rowcount
+      last = keys[-1]
+      if time.monotonic() - reported >= REPORT_EVERY:
+        reported = time.monotonic()
+        logger.info('backfill %s: %d of %d rows (%.0f%%), %.0fs', table_name, done, total,
+          100.0 * done / total if total else 100.0, reported - started)
+      if pause:
+        time.sleep(pause)
+  logger.info('backfill %s: %d rows in %.0fs', table_name, done, time.monotonic() - started)
+  return done
+
+#  Preflight
+#  ----------------------------------------------------------------
+
+# (pattern, why it hurts) for PostgreSQL statements that hold a lock blocking
+# reads or writes for as long as they run
+LOCKING_STATEMENTS = [
+  (r'^CREATE (UNIQUE )?INDEX (?!CONCURRENTLY)',
+    'blocks writes while the index builds; use create_index_concurrently()'),
+  (r'^DROP INDEX (?!CONCURRENTLY)',
+    'waits for and then blocks all queries on the table; use drop_index_concurrently()'),
+  (r'^REINDEX (?!.*CONCURRENTLY)',
+    'blocks writes while the index rebuilds; add CONCURRENTLY'),
+  (r'^ALTER TABLE .* ALTER COLUMN .* TYPE ',
+    'rewrites the table under an exclusive lock; add a new column and backfill() it'),
+  (r'^ALTER TABLE .* ALTER COLUMN .* SET NOT NULL',
+    'scans the table under an exclusive lock; validate a CHECK (... IS NOT NULL) NOT VALID constraint first'),
+  (r'^ALTER TABLE .* ADD (CONSTRAINT \S+ )?(FOREIGN KEY|CHECK)\b(?!.*NOT VALID)',
+    'checks every row under lock; add it NOT VALID, then VALIDATE CONSTRAINT in a later revision'),
+  (r'^ALTER TABLE .* ADD (CONSTRAINT \S+ )?(UNIQUE|PRIMARY KEY)\b(?!.*USING INDEX)',
+    'builds an index under an exclusive lock; build it concurrently and add the constraint USING INDEX'),
+  (r'^ALTER TABLE .* ADD (COLUMN )?.* DEFAULT .*\b(NEXTVAL|RANDOM|GEN_RANDOM_UUID|UUID_GENERATE_V4|CLOCK_TIMESTAMP)\(',
+    'a volatile default rewrites the table; add the column without it and backfill()'),
+  (r'^(?!.*\bDEFAULT\b)ALTER TABLE .* ADD (COLUMN )?.* NOT NULL',
+    'fails on a table that has rows; give the column a default'),
+  (r'^ALTER TABLE .* SET (LOGGED|UNLOGGED|TABLESPACE)\b',
+    'rewrites the table under an exclusive lock'),
+  (r'^(UPDATE|DELETE FROM) ',
+    'changes every matching row in one transaction; use backfill()'),
+  (r'^INSERT INTO .* SELECT ',
+    'copies rows in one long transaction'),
+  (r'^(LOCK TABLE|VACUUM FULL|CLUSTER)\b',
+    'holds an exclusive lock on the table'),
+]
+LOCKING_STATEMENTS = [(re.compile(pattern, re.S), reason) for pattern, reason in LOCKING_STATEMENTS]
+
+TARGET_TABLE = re.compile(
+  r'\b(?:ON(?: ONLY)?|TABLE(?: IF (?:NOT )?EXISTS)?(?: ONLY)?|UPDATE|INTO|FROM)\s+"?([\w.]+)"?', re.I
+)
+
+def split_statements(sql):
+  # the statements of an offline script, without comments and transaction
+  # control
+  statements = []
+  for chunk in sql.split(';\n'):
+    lines = [line for line in chunk.splitlines() if line.strip() and not line.lstrip().startswith('--')]
+    statement = ' '.join(' '.join(lines).split())
+    if statement and statement.upper() not in ('BEGIN', 'COMMIT'):
+      statements.append(statement)
+  return statements
+
+def check_statements(statements, new_tables):
+  # [(statement, reason)] for statements that lock an existing table for
+  # long; tables created in new_tables (which this adds to) are exempt
+  problems = []
+  for statement in statements:
+    upper = statement.upper()
+    target = TARGET_TABLE.search(statement)
+    table = target.group(1) if target else None
+    if upper.startswith('CREATE TABLE') and table:
+      new_tables.add(table)
+      continue
+    if statement.startswith(ONLINE_MARKER) or table in new_tables or table == 'alembic_version':
+      continue
+    for pattern, reason in LOCKING_STATEMENTS:
+      if pattern.search(upper):
+        problems.append((statement, reason))
+        break
+  return problems
+
+def render_revision(config, revision):
+  # the offline SQL script of one revision
+  from alembic import command
+  buffer = io.StringIO()
+  config.output_buffer = buffer
+  if revision.down_revision is None:
+    command.upgrade(config, revision.revision, sql=True)
+  else:
+    down = revision.down_revision
+    if isinstance(down, (tuple, list)):
+      down = down[0]
+    command.upgrade(config, '%s:%s' % (down, revision.revision), sql=True)
+  return buffer.getvalue()
+
+def pending_revisions(config, since):
+  # revisions after `since` (None for an empty database), oldest first
+  from alembic.script import ScriptDirectory
+  script = ScriptDirectory.from_config(config)
+  return list(reversed(list(script.iterate_revisions('heads', since or 'base'))))
+
+def preflight(config, since):
+  # [(revision, problems, error)] for every revision after `since`: problems
+  # as returned by check_statements(), error set when the revision cannot be
+  # rendered offline (it reads the database) and needs a manual review
+  results = []
+  new_tables = set()
+  for revision in pending_revisions(config, since):
+    try:
+      sql = render_revision(config, revision)
+    except Exception as e:
+      results.append((revision, [], '%s: %s' % (type(e).__name__, e)))
+      continue
+    results.append((revision, check_statements(split_statements(sql), new_tables), None))
+  return results
@@ -0,0 +1,105 @@
+#----------------------------------------------------------------------------#
+# Show partition maintenance.
+#
+# On PostgreSQL the Show table is range-partitioned by start_time with one
+# partition per calendar month (Show_pYYYY_MM) plus a default partition.
+# Upcoming-show queries filter on start_time and only touch the current and
+# future partitions. Months older than the retention window are detached and
+# their rows moved into the unpartitioned ShowArchive table, which keeps past
+# shows available to the detail pages.
+#
+# On other databases there are no partitions; archival moves rows with a
+# plain INSERT ... SELECT / DELETE so development setups behave the same.
+#----------------------------------------------------------------------------#
+
+import re
+from datetime import datetime
+
+from sqlalchemy import text
+
+PARTITION_PATTERN = re.compile(r'^Show_p(\d{4})_(\d{2})$')
+
+
+def month_start(value):
+  return datetime(value.year, value.month, 1)
+
+
+def add_months(month, count):
+  index = month.year * 12 + month.month - 1 + count
+  return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+  return 'Show_p%04d_%02d' % (month.year, month.month)
+
+
+def is_partitioned(conn):
+  if conn.dialect.name != 'postgresql':
+    return False
+  return bool(conn.execute(text(
+    "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('\"Show\"')"
+  )).scalar())
+
+
+def list_partitions(conn):
+  # monthly partitions as {month: name}; the default partition is not included
+  names = conn.execute(text(
+    "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+    "WHERE i.inhparent = to_regclass('\"Show\"')"
+  )).scalars()
+  partitions = dict()
+  for name in names:
+    match = PARTITION_PATTERN.match(name)
+    if match:
+      partitions[datetime(int(match.group(1)), int(match.group(2)), 1)] = name
+  return partitions
+
+
+def create_partitions(conn, first, last):
+  # make sure a partition exists for every month from <first> to <last>.
+  # Rows that already landed in the default partition for such a month are
+  # moved into the new partition before it is attached.
+  existing = list_partitions(conn)
+  created = []
+  month = month_start(first)
+  while month <= last:
+    if month not in existing:
+      name = partition_name(month)
+      bounds = {'lower': month, 'upper': add_months(month, 1)}
+      conn.execute(text('CREATE TABLE "%s" (LIKE "Show" INCLUDING DEFAULTS)' % name))
+      conn.execute(text(
+        'WITH moved AS (DELETE FROM "Show_default" '
+        'WHERE start_time >= :lower AND start_time < :upper RETURNING *) '
+        'INSERT INTO "%s" SELECT * FROM moved' % name
+      ), bounds)
+      conn.execute(text(
+        'ALTER TABLE "Show" ATTACH PARTITION "%s" FOR VALUES FROM (\'%s\') TO (\'%s\')'
+        % (name, bounds['lower'].isoformat(), bounds['upper'].isoformat())
+      ))
+      created.append(name)
+    month = add_months(month, 1)
+  return created
+
+
+def archive_before(conn, cutoff):
+  # move every show starting before <cutoff> into ShowArchive. Whole monthly
+  # partitions are detached and drained; stragglers (the default partition or
+  # an unpartitioned table) are moved row by row. Returns the rows moved.
+  moved = 0
+  if is_partitioned(conn):
+    for month, name in sorted(list_partitions(conn).items()):
+      if add_months(month, 1) > cutoff:
+        break
+      conn.execute(text('ALTER TABLE "Show" DETACH PARTITION "%s"' % name))
+      moved += conn.execute(text(
+        'INSERT INTO "ShowArchive" (id, start_time, artist_id, venue_id) '
+        'SELECT id, start_time, artist_id, venue_id FROM "%s"' % name
+      )).rowcount
+      conn.execute(text('DROP TABLE "%s"' % name))
+
+  moved += conn.execute(text(
+    'INSERT INTO "ShowArchive" (id, start_time, artist_id, venue_id) '
+    'SELECT id, start_time, artist_id, venue_id FROM "Show" WHERE start_time < :cutoff'
+  ), {'cutoff': cutoff}).rowcount
+  conn.execute(text('DELETE FROM "Show" WHERE start_time < :cutoff'), {'cutoff': cutoff})
+  return moved
@@ -0,0 +1,265 @@
+#----------------------------------------------------------------------------#
+# Pre-rendered pages.
+#
+# With STATIC_PAGES_DIR set, the venue, artist and show lists and every venue
+# and artist page are kept as static HTML files, /venues/1 in
+# STATIC_PAGES_DIR/venues/1/index.html:
+#
+#   - `flask pages build` renders all of them (`--stale`: only those missing
+#     or older than STATIC_PAGES_MAX_AGE);
+#   - a GET for one of them is answered from its file while the file is
+#     younger than STATIC_PAGES_MAX_AGE, before the database is touched;
+#   - otherwise the page is rendered as usual and the result written to its
+#     file, so it is served from there next time;
+#   - a committed write (from this process or, over the invalidation bus,
+#     from another) deletes the files of the pages showing the changed rows,
+#     which are then regenerated by the next request for them.
+#
+# A front web server can serve the same files to requests without a session
+# cookie, e.g. nginx with `try_files /pages$uri/index.html @fyyur`; it cannot
+# check their age, so run `flask pages build --stale` from cron every
+# STATIC_PAGES_MAX_AGE seconds.
+# The age limit also bounds what deletes do not cover: shows moving from
+# upcoming to past, and the matches and similar artists lists.
+#
+# Requests with a query string or a session cookie (which may carry flashed
+# messages) are always rendered dynamically and never stored.
+#----------------------------------------------------------------------------#
+
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from flask import current_app, g, request, send_file
+from werkzeug.security import safe_join
+
+# endpoints whose pages are pre-rendered
+PAGE_ENDPOINTS = frozenset([
+  'venues.venues', 'artists.artists', 'shows.shows',
+  'venues.show_venue', 'artists.show_artist',
+])
+# set on requests made by `flask pages build`, which must not be answered
+# from the files they are rebuilding
+BUILD_ENVIRON_KEY = 'fyyur.prerender'
+
+
+class StaticPages(object):
+
+  def __init__(self):
+    self.directory = None
+    self.max_age = 3600
+    self.lock = threading.Lock()
+    # bumped by every invalidation, so a render that raced with a write is
+    # not stored
+    self.generation = 0
+    self.served = 0
+    self.stored = 0
+    self.invalidated = 0
+
+  @property
+  def enabled(self):
+    return self.directory is not None
+
+  def init_app(self, app):
+    # call before dbguard.init_app(), so files are served while the
+    # database is unavailable
+    from changes import change_listeners, flush_listeners
+    directory = app.config.get('STATIC_PAGES_DIR')
+    self.directory = os.path.abspath(directory) if directory else None
+    self.max_age = app.config.get('STATIC_PAGES_MAX_AGE', 3600)
+    if not self.enabled:
+      return
+    os.makedirs(self.directory, exist_ok=True)
+    if self.invalidate_changes not in change_listeners:
+      change_listeners.append(self.invalidate_changes)
+    if self.clear not in flush_listeners:
+      flush_listeners.append(self.clear)
+    app.before_request(self.before_request)
+    app.after_request(self.after_request)
+
+  def file_path(self, path):
+    # the file of a page path such as '/venues/1'
+    return safe_join(self.directory, path.strip('/'), 'index.html')
+
+  def cacheable(self):
+    return request.endpoint in PAGE_ENDPOINTS and not request.query_string \
+      and current_app.config['SESSION_COOKIE_NAME'] not in request.cookies
+
+  #  Serving
+  #  ----------------------------------------------------------------
+
+  def before_request(self):
+    if request.method not in ('GET', 'HEAD') or not self.cacheable():
+      return None
+    g.static_pages_generation = self.generation
+    if request.environ.get(BUILD_ENVIRON_KEY):
+      return None
+    path = self.file_path(request.path)
+    try:
+      age = time.time() - os.stat(path).st_mtime
+    except OSError:
+      return None
+    if age >= self.max_age:
+      return None
+    self.served += 1
+    response = send_file(path, mimetype='text/html', max_age=0)
+    response.headers['X-Fyyur-Prerendered'] = '1'
+    return response
+
+  def after_request(self, response):
+    generation = g.get('static_pages_generation')
+    if generation is None or request.method != 'GET' or response.status_code != 200 \
+        or 'X-Fyyur-Prerendered' in response.headers or 'X-Fyyur-Stale' in response.headers:
+      return response
+    path = self.file_path(request.path)
+    if not response.is_streamed:
+      self.store(path, response.get_data(), generation)
+      return response
+    # written once the last chunk has been sent
+    def tee(chunks):
+      body = []
+      for chunk in chunks:
+        body.append(chunk)
+        yield chunk
+      self.store(path, b''.join(body), generation)
+    response.response = tee(response.iter_encoded())
+    return response
+
+  def store(self, path, body, generation):
+    # write path atomically, unless the page was invalidated since its
+    # render began
+    if path is None or generation != self.generation:
+      return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    building = '%s.%s.building' % (path, uuid.uuid4().hex[:8])
+    with open(building, 'wb') as f:
+      f.write(body)
+    with self.lock:
+      if generation != self.generation:
+        os.remove(building)
+        return False
+      os.replace(building, path)
+      self.stored += 1
+    return True
+
+  #  Invalidation
+  #  ----------------------------------------------------------------
+
+  def invalidate(self, paths=(), trees=()):
+    # delete the files of paths, and of every page below each of trees
+    with self.lock:
+      self.generation += 1
+      for path in paths:
+        try:
+          os.remove(self.file_path(path))
+          self.invalidated += 1
+        except OSError:
+          pass
+      for tree in trees:
+        root = safe_join(self.directory, tree.strip('/'))
+        for name in os.listdir(root) if os.path.isdir(root) else ():
+          # subdirectories hold the pages; the list page itself is kept
+          page = os.path.join(root, name)
+          if os.path.isdir(page):
+            shutil.rmtree(page, ignore_errors=True)
+            self.invalidated += 1
+
+  def invalidate_changes(self, changes):
+    paths, trees = affected_pages(changes)
+    self.invalidate(paths, trees)
+
+  def clear(self):
+    with self.lock:
+      self.generation += 1
+      for name in os.listdir(self.directory) if os.path.isdir(self.directory) else ():
+        page = os.path.join(self.directory, name)
+        if os.path.isdir(page):
+          shutil.rmtree(page, ignore_errors=True)
+        else:
+          os.remove(page)
+
+  #  Building
+  #  ----------------------------------------------------------------
+
+  def build(self, stale_only=False):
+    # render every page, or only the missing and expired ones; returns
+    # (pages rendered, pages that failed)
+    app = current_app._get_current_object()
+    client = app.test_client()
+    rendered = failed = 0
+    now = time.time()
+    for path in page_paths():
+      if stale_only:
+        try:
+          if now - os.stat(self.file_path(path)).st_mtime < self.max_age:
+            continue
+        except OSError:
+          pass
+      response = client.get(path, environ_overrides={BUILD_ENVIRON_KEY: True})
+      # reading a streamed page to the end is what stores it
+      response.get_data()
+      response.close()
+      if response.status_code == 200:
+        rendered += 1
+      else:
+        failed += 1
+        app.logger.warning('pre-rendering %s failed with %d', path, response.status_code)
+    return rendered, failed
+
+  def metrics(self):
+    if not self.enabled:
+      return {}
+    return {
+      'fyyur_static_pages_served_total': self.served,
+      'fyyur_static_pages_stored_total': self.stored,
+      'fyyur_static_pages_invalidated_total': self.invalidated,
+    }
+
+
+def page_paths():
+  # every pre-rendered page
+  from extensions import db
+  from models import Venue, Artist
+  import shards
+  yield '/venues'
+  yield '/artists'
+  yield '/shows'
+  for id in sorted(shards.gather(lambda: [id for id, in db.session.query(Venue.id)])):
+    yield '/venues/%d' % id
+  for id, in db.session.query(Artist.id).order_by(Artist.id):
+    yield '/artists/%d' % id
+
+def affected_pages(changes):
+  # (paths, trees) of the pages showing the changed rows; a tree stands for
+  # every page below it, for deletes whose shows are already gone
+  from extensions import db
+  from models import Show, ArtistSimilarity
+  import shards
+  paths = set()
+  trees = set()
+  for entity, id, action in changes:
+    if entity == 'Venue':
+      paths.update(['/venues/%d' % id, '/venues', '/shows'])
+      if action == 'deleted':
+        trees.add('/artists')
+        continue
+      with shards.for_venue(id):
+        artist_ids = [artist_id for artist_id, in db.session.query(Show.artist_id).filter(Show.venue_id == id).distinct()]
+      paths.update('/artists/%d' % artist_id for artist_id in artist_ids)
+    elif entity == 'Artist':
+      paths.update(['/artists/%d' % id, '/artists', '/shows'])
+      # artists listing this one as similar
+      similar = db.session.query(ArtistSimilarity.artist_id).filter(ArtistSimilarity.similar_artist_id == id)
+      paths.update('/artists/%d' % artist_id for artist_id, in similar)
+      if action == 'deleted':
+        trees.add('/venues')
+        continue
+      venue_ids = shards.gather(lambda: [venue_id for venue_id, in db.session.query(Show.venue_id).filter(Show.artist_id == id).distinct()])
+      paths.update('/venues/%d' % venue_id for venue_id in venue_ids)
+    elif entity == 'Show':
+      paths.update(['/venues', '/shows'])
+      for venue_id, artist_id in shards.gather(lambda: db.session.query(Show.venue_id, Show.artist_id).filter(Show.id == id).all()):
+        paths.update(['/venues/%d' % venue_id, '/artists/%d' % artist_id])
+  return paths, trees
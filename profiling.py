@@ -0,0 +1,306 @@
+#----------------------------------------------------------------------------#
+# Request profiling.
+#
+# A request is profiled when it carries `X-Fyyur-Profile: <PROFILE_TOKEN>`
+# (the response then names the profile in X-Fyyur-Profile-Id), or at random
+# for a PROFILE_SAMPLE_RATE fraction of requests. Its profile holds
+#
+#   - cProfile call counts and times per function, for sorted tables;
+#   - the thread's call stack sampled every PROFILE_SAMPLE_INTERVAL seconds,
+#     for a flame graph;
+#   - every SQL statement with its duration.
+#
+# Streamed pages are profiled until the last chunk is sent. The latest
+# PROFILE_BUFFER_SIZE profiles are kept in a store: MemoryStore keeps them per
+# process; DirectoryStore (PROFILE_STORE = 'profiling.DirectoryStore') writes
+# them to PROFILE_DIR, shared by the workers of one host. They are listed
+# at /admin/profiles, behind HTTP basic auth with PROFILE_TOKEN as the
+# password. Without PROFILE_TOKEN only sampling works and the pages are off.
+#----------------------------------------------------------------------------#
+
+import cProfile
+import hmac
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from werkzeug.utils import import_string
+
+PROFILE_HEADER = 'X-Fyyur-Profile'
+# rows kept per profile
+MAX_FUNCTIONS = 300
+MAX_QUERIES = 500
+# flame graph frames narrower than this share of the samples are left out
+MIN_FRAME_WIDTH = 0.002
+
+
+class MemoryStore(object):
+  # a ring buffer of the latest profiles of this process
+
+  def __init__(self, app):
+    self.profiles = deque(maxlen=app.config.get('PROFILE_BUFFER_SIZE', 50))
+    self.lock = threading.Lock()
+
+  def add(self, profile):
+    with self.lock:
+      self.profiles.append(profile)
+
+  def recent(self):
+    with self.lock:
+      return list(reversed(self.profiles))
+
+  def get(self, id):
+    with self.lock:
+      for profile in self.profiles:
+        if profile['id'] == id:
+          return profile
+    return None
+
+
+class DirectoryStore(object):
+  # one JSON file per profile in PROFILE_DIR; the oldest are removed beyond
+  # PROFILE_BUFFER_SIZE
+
+  def __init__(self, app):
+    self.directory = os.path.abspath(app.config.get('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles'))
+    self.size = app.config.get('PROFILE_BUFFER_SIZE', 50)
+    os.makedirs(self.directory, exist_ok=True)
+
+  def files(self):
+    # newest first; names start with the start time
+    return sorted((name for name in os.listdir(self.directory) if name.endswith('.json')), reverse=True)
+
+  def add(self, profile):
+    name = '%.6f-%s.json' % (profile['started'], profile['id'])
+    building = os.path.join(self.directory, name + '.building')
+    with open(building, 'w') as f:
+      json.dump(profile, f)
+    os.replace(building, os.path.join(self.directory, name))
+    for old in self.files()[self.size:]:
+      try:
+        os.remove(os.path.join(self.directory, old))
+      except OSError:
+        pass
+
+  def load(self, name):
+    try:
+      with open(os.path.join(self.directory, name)) as f:
+        return json.load(f)
+    except (OSError, ValueError):
+      # pruned by another worker meanwhile
+      return None
+
+  def recent(self):
+    return [profile for profile in map(self.load, self.files()) if profile is not None]
+
+  def get(self, id):
+    for name in self.files():
+      if name[:-len('.json')].endswith('-' + id):
+        return self.load(name)
+    return None
+
+
+class StackSampler(threading.Thread):
+  # counts the call stacks of one thread, as 'outer;...;inner' strings
+
+  def __init__(self, thread_id, interval):
+    super(StackSampler, self).__init__(name='profile-sampler', daemon=True)
+    self.thread_id = thread_id
+    self.interval = interval
+    self.stacks = Counter()
+    self.stopped = threading.Event()
+
+  def run(self):
+    while not self.stopped.wait(self.interval):
+      frame = sys._current_frames().get(self.thread_id)
+      stack = []
+      while frame is not None:
+        code = frame.f_code
+        stack.append('%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+        frame = frame.f_back
+      if stack:
+        self.stacks[';'.join(reversed(stack))] += 1
+
+  def stop(self):
+    self.stopped.set()
+    self.join()
+    return self.stacks
+
+
+class ActiveProfile(object):
+  # the measurements of one request in progress
+
+  def __init__(self, trigger, interval):
+    self.id = uuid.uuid4().hex[:12]
+    self.trigger = trigger
+    self.method = request.method
+    self.path = request.full_path if request.query_string else request.path
+    self.endpoint = request.endpoint
+    self.status = 500
+    # set once the response will report back when it is closed
+    self.closing = False
+    self.queries = []
+    self.started = time.time()
+    self.start = time.perf_counter()
+    self.profile = cProfile.Profile()
+    try:
+      self.profile.enable()
+    except ValueError:
+      # on Python 3.12+ only one cProfile may run at a time; this request
+      # gets stack samples and SQL only
+      self.profile = None
+    self.sampler = StackSampler(threading.get_ident(), interval)
+    self.sampler.start()
+
+  def finish(self):
+    duration = time.perf_counter() - self.start
+    if self.profile is not None:
+      self.profile.disable()
+    stacks = self.sampler.stop()
+    return {
+      'id': self.id,
+      'trigger': self.trigger,
+      'pid': os.getpid(),
+      'method': self.method,
+      'path': self.path,
+      'endpoint': self.endpoint,
+      'status': self.status,
+      'started': self.started,
+      'duration': duration * 1000,
+      'sql_duration': sum(query['duration'] for query in self.queries),
+      'queries': self.queries[:MAX_QUERIES],
+      'query_count': len(self.queries),
+      'functions': function_rows(self.profile) if self.profile is not None else [],
+      'stacks': dict(stacks),
+      'interval': self.sampler.interval,
+    }
+
+
+class RequestProfiler(object):
+
+  def __init__(self):
+    self.app = None
+    self.token = None
+    self.sample_rate = 0.0
+    self.interval = 0.005
+    self.store = None
+    self.recorded = 0
+
+  def init_app(self, app):
+    # call early, so the other before_request hooks are measured too
+    self.app = app
+    self.token = app.config.get('PROFILE_TOKEN')
+    self.sample_rate = app.config.get('PROFILE_SAMPLE_RATE', 0.0)
+    self.interval = app.config.get('PROFILE_SAMPLE_INTERVAL', 0.005)
+    store = app.config.get('PROFILE_STORE')
+    self.store = import_string(store)(app) if store else MemoryStore(app)
+    if not event.contains(Engine, 'before_cursor_execute', query_started):
+      event.listen(Engine, 'before_cursor_execute', query_started)
+      event.listen(Engine, 'after_cursor_execute', query_finished)
+    app.before_request(self.before_request)
+    app.after_request(self.after_request)
+    app.teardown_request(self.teardown_request)
+
+  def authorized(self):
+    # the token from the profile header or as the basic auth password
+    if not self.token:
+      return False
+    given = request.headers.get(PROFILE_HEADER) or (request.authorization.password if request.authorization else None)
+    return bool(given) and hmac.compare_digest(given.encode(), self.token.encode())
+
+  def before_request(self):
+    if request.endpoint is None or request.endpoint == 'static' or request.endpoint.startswith('profiles.'):
+      return None
+    if request.headers.get(PROFILE_HEADER) and self.authorized():
+      g.profile = ActiveProfile('header', self.interval)
+    elif self.sample_rate and random.random() < self.sample_rate:
+      g.profile = ActiveProfile('sample', self.interval)
+    return None
+
+  def after_request(self, response):
+    profile = g.get('profile')
+    if profile is not None:
+      profile.status = response.status_code
+      if profile.trigger == 'header':
+        response.headers['X-Fyyur-Profile-Id'] = profile.id
+      # once the server has sent the whole body, streamed or not
+      profile.closing = True
+      response.call_on_close(lambda: self.save(profile))
+    return response
+
+  def teardown_request(self, error):
+    # requests that failed before they had a response
+    profile = g.get('profile')
+    if profile is not None and not profile.closing:
+      g.pop('profile')
+      self.save(profile)
+
+  def save(self, profile):
+    try:
+      self.store.add(profile.finish())
+      self.recorded += 1
+    except Exception:
+      self.app.logger.exception('storing profile %s failed', profile.id)
+
+  def metrics(self):
+    return {'fyyur_profiles_recorded_total': self.recorded}
+
+
+def current_profile():
+  return g.get('profile') if has_request_context() else None
+
+def query_started(conn, cursor, statement, parameters, context, executemany):
+  if current_profile() is not None:
+    conn.info.setdefault('profile_query_start', []).append(time.perf_counter())
+
+def query_finished(conn, cursor, statement, parameters, context, executemany):
+  profile = current_profile()
+  if profile is not None and conn.info.get('profile_query_start'):
+    start = conn.info['profile_query_start'].pop()
+    profile.queries.append({'statement': statement, 'duration': (time.perf_counter() - start) * 1000})
+
+def function_rows(profile):
+  # [{function, calls, total, cumulative}] with times in milliseconds, the
+  # MAX_FUNCTIONS highest by cumulative time
+  rows = []
+  for (filename, line, name), (primitive, calls, total, cumulative, callers) in pstats.Stats(profile).stats.items():
+    if filename == '~':
+      # builtins are reported as '~:0(<method ...>)'
+      function = name
+    else:
+      function = '%s (%s:%d)' % (name, os.path.basename(filename), line)
+    rows.append({'function': function, 'calls': calls, 'total': total * 1000, 'cumulative': cumulative * 1000})
+  rows.sort(key=lambda row: row['cumulative'], reverse=True)
+  return rows[:MAX_FUNCTIONS]
+
+def flame_frames(stacks):
+  # [{depth, x, width, label, samples}] of an icicle graph of the sampled
+  # stacks, outermost frames on top; x and width are fractions of the total
+  root = {'samples': 0, 'children': {}}
+  for stack, count in stacks.items():
+    root['samples'] += count
+    node = root
+    for label in stack.split(';'):
+      node = node['children'].setdefault(label, {'samples': 0, 'children': {}})
+      node['samples'] += count
+  total = root['samples']
+  frames = []
+  def place(node, depth, x):
+    for label, child in sorted(node['children'].items()):
+      width = float(child['samples']) / total
+      if width >= MIN_FRAME_WIDTH:
+        frames.append({'depth': depth, 'x': x, 'width': width, 'label': label, 'samples': child['samples']})
+        place(child, depth + 1, x)
+      x += width
+  if total:
+    place(root, 0, 0.0)
+  return frames
@@ -0,0 +1,156 @@
+#----------------------------------------------------------------------------#
+# Rate limiting and load shedding.
+#
+#   @limiter.limit('search')
+#   def search_venues(): ...
+#
+# Each limit name has a per-client token bucket (`rate` tokens per second,
+# up to `burst`) and, per endpoint, a cap on concurrently running requests
+# (`max_active`) with a short wait line (`max_waiting`, `wait_timeout`).
+# Requests over the bucket get 429, requests that cannot get a slot get 503,
+# both with Retry-After and without rendering a template. A streamed response
+# holds its slot until the client has received all of it.
+#
+# Buckets live in a store with a take(key, rate, burst) method. MemoryStore
+# keeps them per process; set RATELIMIT_STORE to the import path of a shared
+# store class to enforce the rate across workers. Concurrency limits always
+# apply per process.
+#----------------------------------------------------------------------------#
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, request, Response
+from werkzeug.utils import import_string
+
+DEFAULT_LIMIT = {'rate': 1.0, 'burst': 10, 'max_active': 8, 'max_waiting': 16, 'wait_timeout': 2.0}
+
+
+class MemoryStore(object):
+  # token buckets in process memory; the least recently used clients are
+  # forgotten beyond max_keys
+
+  def __init__(self, max_keys=100000):
+    self.max_keys = max_keys
+    self.buckets = OrderedDict()
+    self.lock = threading.Lock()
+
+  def take(self, key, rate, burst):
+    # take one token; returns (allowed, seconds until a token is available)
+    now = time.monotonic()
+    with self.lock:
+      tokens, updated = self.buckets.pop(key, (burst, now))
+      tokens = min(burst, tokens + (now - updated) * rate)
+      allowed = tokens >= 1
+      if allowed:
+        tokens -= 1
+      self.buckets[key] = (tokens, now)
+      if len(self.buckets) > self.max_keys:
+        self.buckets.popitem(last=False)
+    return allowed, 0 if allowed else (1 - tokens) / rate
+
+
+class ConcurrencyLimit(object):
+
+  def __init__(self, max_active, max_waiting, wait_timeout):
+    self.slots = threading.BoundedSemaphore(max_active)
+    self.max_waiting = max_waiting
+    self.wait_timeout = wait_timeout
+    self.waiting = 0
+    self.lock = threading.Lock()
+
+  def acquire(self):
+    if self.slots.acquire(blocking=False):
+      return True
+    with self.lock:
+      if self.waiting >= self.max_waiting:
+        return False
+      self.waiting += 1
+    try:
+      return self.slots.acquire(timeout=self.wait_timeout)
+    finally:
+      with self.lock:
+        self.waiting -= 1
+
+  def release(self):
+    self.slots.release()
+
+
+class RateLimiter(object):
+
+  def __init__(self, app=None):
+    self.store = None
+    self.concurrency = dict()
+    self.lock = threading.Lock()
+    self.rejected = {'429': 0, '503': 0}
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    store = app.config.get('RATELIMIT_STORE')
+    self.store = import_string(store)() if store else MemoryStore()
+    self.concurrency = dict()
+
+  def settings(self, name):
+    settings = dict(DEFAULT_LIMIT)
+    settings.update(current_app.config.get('RATELIMITS', {}).get(name, {}))
+    return settings
+
+  def client_key(self):
+    # the proxy's view of the client when PROXY_HOPS is set, see app.py
+    return request.remote_addr
+
+  def concurrency_limit(self, endpoint, settings):
+    limit = self.concurrency.get(endpoint)
+    if limit is None:
+      with self.lock:
+        limit = self.concurrency.setdefault(endpoint, ConcurrencyLimit(
+          settings['max_active'], settings['max_waiting'], settings['wait_timeout']
+        ))
+    return limit
+
+  def reject(self, status, retry_after, message):
+    self.rejected[str(status)] += 1
+    response = Response(message + '\n', status=status, mimetype='text/plain')
+    response.headers['Retry-After'] = str(max(1, int(math.ceil(retry_after))))
+    return response
+
+  def metrics(self):
+    return dict(
+      ('fyyur_ratelimit_rejected_total{status="%s"}' % status, count)
+      for status, count in self.rejected.items()
+    )
+
+  def limit(self, name):
+    def decorator(view):
+      @wraps(view)
+      def limited(*args, **kwargs):
+        if not current_app.config.get('RATELIMIT_ENABLED', True):
+          return view(*args, **kwargs)
+        settings = self.settings(name)
+
+        allowed, retry_after = self.store.take(
+          '%s:%s' % (name, self.client_key()), settings['rate'], settings['burst']
+        )
+        if not allowed:
+          return self.reject(429, retry_after, 'Too many requests, slow down.')
+
+        slot = self.concurrency_limit(request.endpoint, settings)
+        if not slot.acquire():
+          return self.reject(503, 1, 'Too busy, try again shortly.')
+        try:
+          response = current_app.make_response(view(*args, **kwargs))
+        except:
+          slot.release()
+          raise
+        if response.is_streamed:
+          # a streamed body is still being produced; hold the slot until it is done
+          response.call_on_close(slot.release)
+        else:
+          slot.release()
+        return response
+      return limited
+    return decorator
@@ -0,0 +1,240 @@
+#----------------------------------------------------------------------------#
+# Sharding by region (optional).
+#
+# With SHARDS set, venues and everything hanging off a venue (Show,
+# ShowArchive and the show rollups) live on one of several databases picked
+# by the venue's state through SHARD_REGIONS; artists, jobs, the change log
+# and the rest stay on SQLALCHEMY_DATABASE_URI. Without SHARDS every helper
+# here is a no-op and all tables live on the one database.
+#
+# db.session routes a query or flush of a sharded table to the shard selected
+# with one of
+#
+#   with shards.for_venue(venue_id): ...     # the shard holding that venue
+#   with shards.for_state(state): ...        # where a new venue belongs
+#   with shards.using(name): ...
+#   rows = shards.fan_out(lambda: query.all())   # one result per shard
+#
+# and refuses (NoShardSelected) when none is. Venue and Show ids are handed
+# out by the global ShardDirectory table so they stay unique across shards;
+# it also records the shard of every venue. Rows that predate sharding have
+# no directory entry and are looked for on DEFAULT_SHARD.
+#
+# A write that touches a shard and the global database commits them one
+# after the other, not atomically.
+#----------------------------------------------------------------------------#
+
+import heapq
+import itertools
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import sqlalchemy as sa
+from flask import current_app, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.util import find_tables
+
+SHARDED_TABLES = frozenset([
+  'Venue', 'Show', 'ShowArchive', 'ShowCountByCity', 'ShowCountByGenre', 'ShowCountByMonth',
+])
+
+current_shard = ContextVar('current_shard', default=None)
+
+# venue id -> shard name; a venue never moves, so entries never go stale
+venue_shards = dict()
+MAX_CACHED_VENUES = 100000
+
+
+class NoShardSelected(RuntimeError):
+  pass
+
+
+def bind_key(name):
+  return 'shard_' + name
+
+def enabled():
+  return has_app_context() and bool(current_app.config.get('SHARDS'))
+
+def names():
+  return list(current_app.config.get('SHARDS') or ())
+
+def default_shard():
+  return current_app.config.get('DEFAULT_SHARD') or names()[0]
+
+
+class RoutingSession(Session):
+  # db.session: statements on sharded tables go to the current shard
+
+  def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+    if bind is None and enabled():
+      table = sharded_table(mapper, clause)
+      if table is not None:
+        shard = current_shard.get()
+        if shard is None:
+          raise NoShardSelected('%s used outside shards.using()/for_venue()/fan_out()' % table)
+        return self._db.engines[bind_key(shard)]
+    return Session.get_bind(self, mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def sharded_table(mapper, clause):
+  if mapper is not None:
+    name = sa.inspect(mapper).local_table.name
+    if name in SHARDED_TABLES:
+      return name
+  if clause is not None:
+    for table in find_tables(clause, include_crud=True):
+      if getattr(table, 'name', None) in SHARDED_TABLES:
+        return table.name
+  return None
+
+#  Routing
+#  ----------------------------------------------------------------
+
+@contextmanager
+def using(name):
+  token = current_shard.set(name)
+  try:
+    yield name
+  finally:
+    current_shard.reset(token)
+
+@contextmanager
+def nowhere():
+  # no-op stand-in when sharding is off
+  yield None
+
+def shard_for_state(state):
+  return current_app.config.get('SHARD_REGIONS', {}).get(state) or default_shard()
+
+def shard_for_venue(venue_id):
+  venue_id = int(venue_id)
+  shard = venue_shards.get(venue_id)
+  if shard is None:
+    from extensions import db
+    from models import ShardDirectory
+    with db.engine.connect() as conn:
+      shard = conn.execute(
+        sa.select(ShardDirectory.shard)
+          .where(ShardDirectory.id == venue_id, ShardDirectory.entity == 'Venue')
+      ).scalar() or default_shard()
+    if len(venue_shards) >= MAX_CACHED_VENUES:
+      venue_shards.clear()
+    venue_shards[venue_id] = shard
+  return shard
+
+def for_venue(venue_id):
+  return using(shard_for_venue(venue_id)) if enabled() else nowhere()
+
+def for_state(state):
+  return using(shard_for_state(state)) if enabled() else nowhere()
+
+def group_by_shard(venue_ids):
+  # {shard: [venue ids]}, or {None: ids} when sharding is off
+  if not enabled():
+    return {None: list(venue_ids)}
+  groups = dict()
+  for venue_id in venue_ids:
+    groups.setdefault(shard_for_venue(venue_id), []).append(venue_id)
+  return groups
+
+def fan_out(func):
+  # [func() on every shard], or [func()] when sharding is off
+  if not enabled():
+    return [func()]
+  results = []
+  for name in names():
+    with using(name):
+      results.append(func())
+  return results
+
+def gather(func):
+  # fan_out() for functions returning lists, concatenated
+  return [row for rows in fan_out(func) for row in rows]
+
+def merge_streams(make_query, key):
+  # iterate make_query() on every shard at once, merged by key; each shard's
+  # query must already be ordered by key
+  if not enabled():
+    return iter(make_query())
+  streams = []
+  for name in names():
+    with using(name):
+      # the first row executes the query, which binds it to this shard's
+      # connection for the rest of the stream
+      rows = iter(make_query())
+      first = next(rows, None)
+    if first is not None:
+      streams.append(itertools.chain([first], rows))
+  return heapq.merge(*streams, key=key)
+
+def new_id(entity, shard=None):
+  # a globally unique id for a new Venue or Show, or None to let the
+  # database assign one when sharding is off
+  if not enabled():
+    return None
+  from extensions import db
+  from models import ShardDirectory
+  shard = shard or current_shard.get()
+  with db.engine.begin() as conn:
+    id = conn.execute(
+      ShardDirectory.__table__.insert().values(entity=entity, shard=shard)
+    ).inserted_primary_key[0]
+  if entity == 'Venue':
+    venue_shards[id] = shard
+  return id
+
+#  Setup
+#  ----------------------------------------------------------------
+
+def shard_metadata():
+  # the sharded tables without foreign keys to global tables (Artist)
+  from extensions import db
+  metadata = sa.MetaData()
+  tables = []
+  for table in db.metadata.sorted_tables:
+    if table.name in SHARDED_TABLES:
+      tables.append(table.to_metadata(metadata))
+  for table in tables:
+    for constraint in list(table.foreign_key_constraints):
+      if constraint.elements[0].target_fullname.split('.')[0] not in SHARDED_TABLES:
+        table.constraints.discard(constraint)
+        for fk in constraint.elements:
+          table.foreign_keys.discard(fk)
+          fk.parent.foreign_keys.discard(fk)
+  return metadata
+
+def engines():
+  # (shard name, engine) for every shard
+  from extensions import db
+  return [(name, db.engines[bind_key(name)]) for name in names()]
+
+def init_shards():
+  # create the sharded tables on every shard and move the id directory past
+  # every id already in use. Returns the shard names.
+  from extensions import db
+  from models import ShardDirectory
+  metadata = shard_metadata()
+  highest = 0
+  for name, engine in engines() + [(None, db.engine)]:
+    if name is not None:
+      metadata.create_all(engine)
+    with engine.connect() as conn:
+      for table in ('Venue', 'Show'):
+        if sa.inspect(conn).has_table(table):
+          highest = max(highest, conn.execute(sa.text('SELECT max(id) FROM "%s"' % table)).scalar() or 0)
+  with db.engine.begin() as conn:
+    current = conn.execute(sa.select(sa.func.max(ShardDirectory.id))).scalar() or 0
+    if current < highest:
+      if conn.dialect.name == 'postgresql':
+        conn.execute(sa.text("SELECT setval(pg_get_serial_sequence('\"ShardDirectory\"', 'id'), :id)"), {'id': highest})
+      else:
+        conn.execute(ShardDirectory.__table__.insert().values(id=highest, entity='reserved', shard=''))
+  return names()
+
+def configure(app):
+  # register one SQLAlchemy bind per shard; call before db.init_app()
+  shard_uris = app.config.get('SHARDS') or {}
+  if shard_uris:
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    for name, uri in shard_uris.items():
+      binds[bind_key(name)] = uri
+    app.config['SQLALCHEMY_BINDS'] = binds
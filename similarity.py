@@ -0,0 +1,275 @@
+#----------------------------------------------------------------------------#
+# Similar artists.
+#
+# Every artist is described by two L2-normalised vectors: a dense one-hot
+# vector of genres and a sparse vector of the venues they have played
+# (log-scaled show counts). Similarity is a weighted sum of the two cosine
+# similarities. Rows are scored in blocks against the whole catalogue so
+# memory stays at block_size x n floats, and the top k of each row is picked
+# with argpartition instead of a full sort.
+#
+# The refresh jobs score only the changed artists (and those listing them as
+# neighbours) against vectors cached per process: each job reloads the rows
+# of its changed artists, and the whole catalogue is reloaded after
+# SIMILAR_ARTISTS_RELOAD_SECONDS.
+#
+# NumPy and SciPy are imported lazily: only the batch command and the refresh
+# job need them, not every web worker.
+#----------------------------------------------------------------------------#
+
+import threading
+import time
+
+from flask import current_app
+
+from extensions import db, jobs
+from models import Artist, Show, ShowArchive, ArtistSimilarity
+import shards
+
+
+class ArtistVectors(object):
+
+  def __init__(self, artist_ids, artist_genres, appearances):
+    # artist_ids: list of ids; artist_genres: {artist_id: [genre, ...]};
+    # appearances: iterable of (artist_id, venue_id, show_count)
+    import numpy as np
+
+    self.ids = np.asarray(artist_ids, dtype=np.int64)
+    self.index = dict((artist_id, row) for row, artist_id in enumerate(artist_ids))
+    self.genre_columns = dict()
+    self.venue_columns = dict()
+    self.genres = self.genre_rows(artist_genres)
+    self.venues = self.venue_rows(appearances)
+    self.venues_t = self.venues.T.tocsc()
+
+  def genre_rows(self, artist_genres):
+    # n x genres matrix with the normalised rows of the given artists
+    import numpy as np
+    rows, cols = [], []
+    for artist_id, genres in artist_genres.items():
+      row = self.index.get(artist_id)
+      if row is None:
+        continue
+      for genre in genres:
+        rows.append(row)
+        cols.append(self.genre_columns.setdefault(genre, len(self.genre_columns)))
+    genres = np.zeros((len(self.ids), max(len(self.genre_columns), 1)), dtype=np.float32)
+    genres[rows, cols] = 1.0
+    return normalize_rows(genres)
+
+  def venue_rows(self, appearances):
+    # sparse n x venues matrix with the normalised rows of the artists in
+    # appearances, which must hold all of their venues
+    import numpy as np
+    from scipy import sparse
+    rows, cols, counts = [], [], []
+    for artist_id, venue_id, count in appearances:
+      row = self.index.get(artist_id)
+      if row is None:
+        continue
+      rows.append(row)
+      cols.append(self.venue_columns.setdefault(venue_id, len(self.venue_columns)))
+      counts.append(count)
+    venues = sparse.csr_matrix(
+      (np.log1p(np.asarray(counts, dtype=np.float32)), (rows, cols)),
+      shape=(len(self.ids), max(len(self.venue_columns), 1)), dtype=np.float32
+    )
+    venues.sum_duplicates()
+    norms = np.sqrt(np.asarray(venues.multiply(venues).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(1.0 / norms).dot(venues).tocsr()
+
+  def update(self, artist_genres, appearances):
+    # replace the vectors of the artists in artist_genres, adding new ones;
+    # appearances holds all of their venues. An artist with no genres and
+    # no appearances scores zero against everyone, like a deleted one.
+    import numpy as np
+    from scipy import sparse
+    added = [artist_id for artist_id in artist_genres if artist_id not in self.index]
+    if added:
+      self.index.update((artist_id, len(self.ids) + i) for i, artist_id in enumerate(added))
+      self.ids = np.concatenate([self.ids, np.asarray(added, dtype=np.int64)])
+    rows = np.asarray([self.index[artist_id] for artist_id in artist_genres], dtype=np.int64)
+
+    genres = self.genre_rows(artist_genres)
+    old = self.genres
+    self.genres = np.zeros(genres.shape, dtype=np.float32)
+    self.genres[:old.shape[0], :old.shape[1]] = old
+    self.genres[rows] = genres[rows]
+
+    venues = self.venue_rows(appearances)
+    old = self.venues.copy()
+    old.resize(venues.shape)
+    keep = np.ones(len(self.ids), dtype=np.float32)
+    keep[rows] = 0.0
+    self.venues = (sparse.diags(keep).dot(old) + venues).tocsr()
+    self.venues_t = self.venues.T.tocsc()
+
+  def top_k(self, artist_ids=None, k=10, genre_weight=0.5, venue_weight=0.5, block_size=256):
+    # yield (artist_id, [(similar_artist_id, score), ...]) best first, for the
+    # given artists (default: all of them). Zero-score pairs are left out.
+    import numpy as np
+
+    if artist_ids is None:
+      rows = np.arange(len(self.ids))
+    else:
+      rows = np.asarray([self.index[a] for a in artist_ids if a in self.index], dtype=np.int64)
+    n = len(self.ids)
+    k = min(k, n - 1)
+    if k <= 0:
+      return
+
+    for start in range(0, len(rows), block_size):
+      block = rows[start:start + block_size]
+      # scores are kept negated so argpartition's smallest are the best
+      scores = self.genres[block].dot(self.genres.T)
+      scores *= -genre_weight
+      if venue_weight:
+        shared = self.venues[block].dot(self.venues_t).tocoo()
+        scores[shared.row, shared.col] -= venue_weight * shared.data
+      scores[np.arange(len(block)), block] = np.inf
+
+      best = np.argpartition(scores, k - 1, axis=1)[:, :k]
+      best_scores = np.take_along_axis(scores, best, axis=1)
+      order = np.argsort(best_scores, axis=1)
+      best = np.take_along_axis(best, order, axis=1)
+      best_scores = -np.take_along_axis(best_scores, order, axis=1)
+
+      for i, row in enumerate(block):
+        similar = [
+          (int(self.ids[col]), float(score))
+          for col, score in zip(best[i], best_scores[i]) if score > 0
+        ]
+        yield int(self.ids[row]), similar
+
+
+def normalize_rows(matrix):
+  import numpy as np
+  norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+  norms[norms == 0] = 1.0
+  return matrix / norms
+
+
+def load_artist_genres(artist_ids=None):
+  # {artist_id: [genre, ...]} of the given artists (default: all of them)
+  query = db.session.query(Artist.id, Artist.genres)
+  if artist_ids is not None:
+    query = query.filter(Artist.id.in_(list(artist_ids)))
+  return dict(
+    (artist_id, [genre for genre in (genres or '').split(', ') if genre])
+    for artist_id, genres in query.yield_per(5000)
+  )
+
+def load_appearances(artist_ids=None):
+  # (artist_id, venue_id, show_count) of the given artists (default: all)
+  def shard_appearances():
+    # a venue lives on one shard only, so the groups never overlap
+    appearances = []
+    for table in (Show.__table__, ShowArchive.__table__):
+      query = db.select(table.c.artist_id, table.c.venue_id, db.func.count()) \
+        .where(table.c.artist_id.isnot(None), table.c.venue_id.isnot(None)) \
+        .group_by(table.c.artist_id, table.c.venue_id)
+      if artist_ids is not None:
+        query = query.where(table.c.artist_id.in_(list(artist_ids)))
+      appearances.extend(db.session.execute(query))
+    return appearances
+  return shards.gather(shard_appearances)
+
+def load_artist_vectors():
+  # genre and venue vectors for the whole catalogue
+  artist_genres = load_artist_genres()
+  return ArtistVectors(list(artist_genres), artist_genres, load_appearances())
+
+
+class VectorCache(object):
+  # the catalogue's vectors for the refresh jobs of one app
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.vectors = None
+    self.loaded_at = 0
+
+  def current(self, changed=()):
+    # the vectors with the changed artists reloaded; the caller holds the lock
+    max_age = current_app.config.get('SIMILAR_ARTISTS_RELOAD_SECONDS', 3600)
+    if self.vectors is None or time.monotonic() - self.loaded_at > max_age:
+      self.vectors = load_artist_vectors()
+      self.loaded_at = time.monotonic()
+    elif changed:
+      artist_genres = load_artist_genres(changed)
+      for artist_id in changed:
+        # deleted
+        artist_genres.setdefault(artist_id, [])
+      self.vectors.update(artist_genres, load_appearances(changed))
+    return self.vectors
+
+  def forget(self, artist_ids):
+    with self.lock:
+      if self.vectors is not None:
+        self.vectors.update(dict((artist_id, []) for artist_id in artist_ids if artist_id in self.vectors.index), [])
+
+def vector_cache():
+  return current_app.extensions.setdefault('artist_vectors', VectorCache())
+
+def store_similar_artists(results, batch_size=1000):
+  # replace the stored neighbours of every artist in <results>, committing
+  # every <batch_size> artists. Returns the number of artists written.
+  table = ArtistSimilarity.__table__
+  count = 0
+  batch = []
+  def flush(batch):
+    db.session.execute(table.delete().where(table.c.artist_id.in_([a for a, _ in batch])))
+    rows = [
+      {'artist_id': artist_id, 'similar_artist_id': similar_id, 'score': score}
+      for artist_id, similar in batch for similar_id, score in similar
+    ]
+    if rows:
+      db.session.execute(table.insert(), rows)
+    db.session.commit()
+  for result in results:
+    batch.append(result)
+    if len(batch) >= batch_size:
+      flush(batch)
+      count += len(batch)
+      batch = []
+  if batch:
+    flush(batch)
+    count += len(batch)
+  return count
+
+def refresh_similar_artists(artist_ids):
+  # recompute the changed artists plus everyone currently listing one of
+  # them as a neighbour. The nightly batch picks up the remaining drift.
+  affected = set(artist_ids)
+  affected.update(db.session.execute(
+    db.select(ArtistSimilarity.artist_id)
+      .where(ArtistSimilarity.similar_artist_id.in_(list(artist_ids)))
+  ).scalars())
+  k = current_app.config.get('SIMILAR_ARTISTS_K', 10)
+  cache = vector_cache()
+  with cache.lock:
+    results = list(cache.current(artist_ids).top_k(sorted(affected), k=k))
+  return store_similar_artists(results)
+
+@jobs.handler('artist_changed')
+def refresh_artist_similarity(artist_id, action):
+  if action == 'deleted':
+    ArtistSimilarity.query.filter(db.or_(
+      ArtistSimilarity.artist_id == artist_id,
+      ArtistSimilarity.similar_artist_id == artist_id
+    )).delete(synchronize_session=False)
+    vector_cache().forget([artist_id])
+  else:
+    refresh_similar_artists([artist_id])
+
+@jobs.handler('show_changed')
+def refresh_show_artist_similarity(show_id, venue_id, artist_id, action):
+  refresh_similar_artists([artist_id])
+
+def similar_artists(artist_id, limit=6):
+  rows = db.session.query(Artist.id, Artist.name, Artist.image_link) \
+    .join(ArtistSimilarity, ArtistSimilarity.similar_artist_id == Artist.id) \
+    .filter(ArtistSimilarity.artist_id == artist_id) \
+    .order_by(ArtistSimilarity.score.desc()) \
+    .limit(limit)
+  return [{'id': id, 'name': name, 'image_link': image_link} for id, name, image_link in rows]
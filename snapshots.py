@@ -0,0 +1,212 @@
+#----------------------------------------------------------------------------#
+# Read-only snapshots.
+#
+# `flask snapshot export PATH` copies venues, artists and shows (plus the
+# archive, similar artists and the analytics rollups recounted from them)
+# into one compact, indexed SQLite file. The file is built next to PATH and
+# renamed over it when complete, so readers only ever see whole snapshots.
+#
+# An app started with SNAPSHOT_PATH set is a read-only mirror: every query
+# goes to that file, opened read-only and memory-mapped, and sharding is
+# off. Every SNAPSHOT_CHECK_INTERVAL seconds a request looks for a newer
+# file; when one has been renamed into place, pooled connections to the old
+# one are replaced as they are next checked out and the in-process caches
+# are dropped. Requests that would write (and the forms and feeds that need
+# the main database) are redirected to SNAPSHOT_ORIGIN with a 307, which
+# keeps the method and body, or refused with 503 when no origin is set.
+#----------------------------------------------------------------------------#
+
+import os
+import sqlite3
+import threading
+import time
+from urllib.request import pathname2url
+
+import sqlalchemy as sa
+from flask import current_app, request, redirect, Response
+from sqlalchemy import event, exc
+
+# copied as they are; rollups are recounted in the snapshot
+SNAPSHOT_TABLES = ('Venue', 'Artist', 'Show', 'ShowArchive', 'ArtistSimilarity')
+EXPORT_BATCH_SIZE = 5000
+
+# read-only requests that are not GETs
+READ_ENDPOINTS = frozenset(['venues.search_venues', 'artists.search_artists'])
+# GETs served by the main database: forms whose submissions go there anyway,
+# and the change feed and show events, which the snapshot does not carry
+ORIGIN_ENDPOINTS = frozenset([
+  'venues.create_venue_form', 'venues.edit_venue',
+  'artists.create_artist_form', 'artists.edit_artist',
+  'shows.create_shows', 'api.changes', 'api.show_events',
+])
+
+#  Export
+#  ----------------------------------------------------------------
+
+def export_snapshot(path, batch_size=EXPORT_BATCH_SIZE):
+  # write a snapshot of the database to path; returns {table: rows copied}
+  from extensions import db
+  from exports import stream_batches
+  from analytics import rebuild_rollups
+  import shards
+
+  path = os.path.abspath(path)
+  building = path + '.building'
+  if os.path.exists(building):
+    os.remove(building)
+  engine = sa.create_engine('sqlite:///' + building)
+
+  @event.listens_for(engine, 'connect')
+  def fast_writes(dbapi_connection, connection_record):
+    # a half-written file is thrown away, so there is nothing to journal
+    dbapi_connection.execute('PRAGMA journal_mode = OFF')
+    dbapi_connection.execute('PRAGMA synchronous = OFF')
+
+  counts = dict()
+  try:
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+      for name in SNAPSHOT_TABLES:
+        table = db.metadata.tables[name]
+        counts[name] = 0
+        statement = sa.select(table)
+        for batch in stream_batches(statement, name in shards.SHARDED_TABLES, batch_size):
+          conn.execute(table.insert(), [row._asdict() for row in batch])
+          counts[name] += len(batch)
+      rebuild_rollups(conn)
+      # when the snapshot was taken, read back by the mirrors
+      conn.exec_driver_sql('PRAGMA user_version = %d' % int(time.time()))
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+      conn.exec_driver_sql('ANALYZE')
+      conn.exec_driver_sql('VACUUM')
+  finally:
+    engine.dispose()
+
+  with open(building, 'rb') as f:
+    os.fsync(f.fileno())
+  os.replace(building, path)
+  return counts
+
+#  Read-only mode
+#  ----------------------------------------------------------------
+
+class Snapshot(object):
+
+  def __init__(self):
+    self.path = None
+    self.origin = None
+    self.interval = 5
+    self.mmap_size = 256 * 1024 * 1024
+    self.lock = threading.Lock()
+    # bumped when a newer file is found; connections opened under an older
+    # generation are discarded on checkout
+    self.generation = 0
+    self.file_id = None
+    self.checked = 0
+    self.taken_at = 0
+    self.swaps = 0
+
+  @property
+  def enabled(self):
+    return self.path is not None
+
+  def configure(self, app):
+    # call before db.init_app() and shards.configure()
+    path = app.config.get('SNAPSHOT_PATH')
+    self.path = os.path.abspath(path) if path else None
+    if not path:
+      return
+    if not os.path.exists(self.path):
+      raise RuntimeError('SNAPSHOT_PATH %s does not exist, create it with `flask snapshot export`' % self.path)
+    self.origin = (app.config.get('SNAPSHOT_ORIGIN') or '').rstrip('/') or None
+    self.interval = app.config.get('SNAPSHOT_CHECK_INTERVAL', 5)
+    self.mmap_size = app.config.get('SNAPSHOT_MMAP_SIZE', self.mmap_size)
+    self.file_id = self.current_file_id()
+    self.taken_at = self.read_taken_at()
+    self.checked = time.monotonic()
+
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    options['creator'] = self.connect
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + self.path
+    app.config['SQLALCHEMY_BINDS'] = {}
+    app.config['SHARDS'] = {}
+
+  def init_app(self, app, db):
+    if not self.enabled:
+      return
+    with app.app_context():
+      engine = db.engine
+    event.listen(engine, 'connect', self.tag_connection)
+    event.listen(engine, 'checkout', self.check_connection)
+    app.before_request(self.before_request)
+
+  def connect(self):
+    # immutable: the file is never changed in place, only replaced
+    uri = 'file:%s?mode=ro&immutable=1' % pathname2url(self.path)
+    connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    connection.execute('PRAGMA mmap_size = %d' % self.mmap_size)
+    connection.execute('PRAGMA query_only = 1')
+    return connection
+
+  def tag_connection(self, dbapi_connection, connection_record):
+    connection_record.info['snapshot_generation'] = self.generation
+
+  def check_connection(self, dbapi_connection, connection_record, connection_proxy):
+    if connection_record.info.get('snapshot_generation') != self.generation:
+      # the pool closes it and opens one on the current file
+      raise exc.DisconnectionError('snapshot replaced')
+
+  def current_file_id(self):
+    stat = os.stat(self.path)
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+  def read_taken_at(self):
+    connection = sqlite3.connect('file:%s?mode=ro' % pathname2url(self.path), uri=True)
+    try:
+      return connection.execute('PRAGMA user_version').fetchone()[0]
+    finally:
+      connection.close()
+
+  def refresh(self):
+    # switch to a newer snapshot file if one has been put in place
+    now = time.monotonic()
+    if now - self.checked < self.interval:
+      return False
+    with self.lock:
+      if now - self.checked < self.interval:
+        return False
+      self.checked = now
+      try:
+        file_id = self.current_file_id()
+      except OSError:
+        # mid-rename or removed; keep serving the open one
+        return False
+      if file_id == self.file_id:
+        return False
+      self.file_id = file_id
+      self.taken_at = self.read_taken_at()
+      self.generation += 1
+      self.swaps += 1
+    current_app.logger.info('serving snapshot taken at %d', self.taken_at)
+    from changes import flush_all
+    flush_all()
+    return True
+
+  def before_request(self):
+    self.refresh()
+    if request.endpoint in READ_ENDPOINTS:
+      return None
+    if request.method in ('GET', 'HEAD', 'OPTIONS') and request.endpoint not in ORIGIN_ENDPOINTS:
+      return None
+    if self.origin:
+      return redirect(self.origin + (request.full_path if request.query_string else request.path), code=307)
+    return Response('This is a read-only mirror.\n', status=503, mimetype='text/plain')
+
+  def metrics(self):
+    if not self.enabled:
+      return {}
+    return {
+      'fyyur_snapshot_taken_at_seconds': self.taken_at,
+      'fyyur_snapshot_swaps_total': self.swaps,
+    }
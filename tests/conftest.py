@@ -0,0 +1,67 @@
+import pytest
+
+from app import create_app
+from extensions import db
+
+
+@pytest.fixture
+def make_app(monkeypatch, tmp_path):
+  # apps on the 'test' profile with the given settings, run from and
+  # logging into tmp_path
+  monkeypatch.setenv('FYYUR_CONFIG', 'test')
+  monkeypatch.chdir(tmp_path)
+  def make(**overrides):
+    settings = {'LOG_DIR': str(tmp_path)}
+    settings.update(overrides)
+    return create_app(settings)
+  return make
+
+
+@pytest.fixture
+def app(make_app):
+  app = make_app()
+  with app.app_context():
+    db.create_all()
+    yield app
+    db.session.remove()
+    db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+  return app.test_client()
+
+
+@pytest.fixture
+def create_venue(client):
+  def create(name='The Musical Hop', city='San Francisco', state='CA', genres=('Jazz',), **fields):
+    data = dict(
+      name=name, city=city, state=state, address='1015 Folsom Street', phone='123-123-1234',
+      genres=list(genres), website='https://www.themusicalhop.com', image_link='', facebook_link='',
+      seeking_description='',
+    )
+    data.update(fields)
+    response = client.post('/venues/create', data=data)
+    assert response.status_code in (200, 302)
+  return create
+
+
+@pytest.fixture
+def create_artist(client):
+  def create(name='Guns N Petals', city='San Francisco', state='CA', genres=('Rock n Roll',), **fields):
+    data = dict(
+      name=name, city=city, state=state, phone='326-123-5000', genres=list(genres),
+      website='https://www.gunsnpetalsband.com', image_link='', facebook_link='', seeking_description='',
+    )
+    data.update(fields)
+    response = client.post('/artists/create', data=data)
+    assert response.status_code in (200, 302)
+  return create
+
+
+@pytest.fixture
+def create_show(client):
+  def create(artist_id, venue_id, start_time):
+    response = client.post('/shows/create', data=dict(artist_id=artist_id, venue_id=venue_id, start_time=start_time))
+    assert response.status_code in (200, 302)
+  return create
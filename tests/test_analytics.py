@@ -0,0 +1,58 @@
+from datetime import datetime
+
+from extensions import db
+from models import ShowCountByCity, ShowCountByGenre, ShowCountByMonth
+import analytics
+import partitions
+
+
+def rollups():
+  return [analytics.rollup_counts(model, *key) for model, key in (
+    (ShowCountByCity, ('city', 'state')), (ShowCountByGenre, ('genre',)), (ShowCountByMonth, ('month',)))]
+
+
+def rebuilt_rollups():
+  with db.engine.begin() as conn:
+    analytics.rebuild_rollups(conn)
+  return rollups()
+
+
+def test_rollups_follow_venue_and_artist_edits(client, create_venue, create_artist, create_show):
+  create_venue(city='San Francisco', state='CA')
+  create_artist(genres=('Jazz', 'Blues'))
+  create_show(1, 1, '2010-05-21 21:30:00')
+  with db.engine.begin() as conn:
+    partitions.archive_before(conn, datetime(2020, 1, 1))
+  create_show(1, 1, '2035-04-01 20:00:00')
+  assert rollups()[0] == {('San Francisco', 'CA'): 2}
+
+  client.post('/venues/1/edit', data=dict(
+    version=1, name='The Musical Hop', city='Los Angeles', state='CA', address='1015 Folsom Street',
+    phone='123-123-1234', genres=['Jazz'], website='', image_link='', facebook_link='', seeking_description='',
+  ))
+  client.patch('/artists/1', data=dict(version=1, genres=['Blues', 'Rock n Roll']))
+
+  by_city, by_genre, by_month = rollups()
+  assert by_city == {('Los Angeles', 'CA'): 2}
+  assert by_genre == {('Blues',): 2, ('Rock n Roll',): 2}
+  assert rollups() == rebuilt_rollups()
+
+
+def test_new_rollup_rows_are_upserted(app):
+  statements = []
+  def record(conn, cursor, statement, parameters, context, executemany):
+    statements.append(statement)
+  db.event.listen(db.engine, 'before_cursor_execute', record)
+  try:
+    with db.engine.begin() as conn:
+      # a row created by a concurrent show between an UPDATE and an INSERT
+      # is simply added to
+      conn.execute(ShowCountByGenre.__table__.insert().values(genre='Jazz', count=1))
+      del statements[:]
+      analytics.bump_rollup(conn, ShowCountByGenre, 1, genre='Jazz')
+      analytics.bump_rollup(conn, ShowCountByGenre, 2, genre='Blues')
+  finally:
+    db.event.remove(db.engine, 'before_cursor_execute', record)
+
+  assert len(statements) == 2 and all('ON CONFLICT' in statement for statement in statements)
+  assert analytics.rollup_counts(ShowCountByGenre, 'genre') == {('Jazz',): 2, ('Blues',): 2}
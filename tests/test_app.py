@@ -0,0 +1,90 @@
+import os
+import subprocess
+import sys
+
+from flask import url_for
+
+from extensions import db
+from models import Venue, Artist
+from matching import match_data
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_blueprints_are_registered(app):
+  assert set(app.blueprints) >= {'main', 'venues', 'artists', 'shows'}
+  with app.test_request_context():
+    assert url_for('main.index') == '/'
+    assert url_for('venues.venues') == '/venues'
+    assert url_for('artists.show_artist', artist_id=1) == '/artists/1'
+    assert url_for('shows.shows') == '/shows'
+
+
+def test_apps_are_independent(make_app):
+  first, second = make_app(), make_app()
+  for app in (first, second):
+    with app.app_context():
+      db.create_all()
+  with first.app_context():
+    db.session.add(Venue(name='Only Here', city='San Francisco', state='CA', address='', phone='', genres='Jazz'))
+    db.session.commit()
+  with second.app_context():
+    assert Venue.query.count() == 0
+
+
+def test_apps_have_their_own_match_index(make_app):
+  first, second = make_app(), make_app()
+  for app in (first, second):
+    with app.app_context():
+      db.create_all()
+  with first.app_context():
+    db.session.add(Venue(name='Hop', city='San Francisco', state='CA', address='', phone='', genres='Jazz', seeking_talent=True))
+    db.session.add(Artist(name='Petals', city='San Francisco', state='CA', phone='', genres='Jazz', seeking_venue=True))
+    db.session.commit()
+    assert [match['name'] for match in match_data('venue', 1)] == ['Petals']
+  with second.app_context():
+    assert match_data('venue', 1) == []
+
+
+def test_apps_have_their_own_calendar_feeds(make_app):
+  first, second = make_app(), make_app()
+  for app in (first, second):
+    with app.app_context():
+      db.create_all()
+  with first.app_context():
+    db.session.add(Venue(name='Hop', city='San Francisco', state='CA', address='', phone='', genres='Jazz'))
+    db.session.commit()
+    client = first.test_client()
+    # the first request also reports the insert, which drops the feed it built
+    for _ in range(2):
+      assert client.get('/venues/1/calendar.ics').status_code == 200
+  with second.app_context():
+    assert second.test_client().get('/venues/1/calendar.ics').status_code == 404
+
+
+def test_pages_render(client, create_venue, create_artist, create_show):
+  create_venue()
+  create_artist()
+  create_show(artist_id=1, venue_id=1, start_time='2035-04-01 20:00')
+
+  for path in ('/', '/venues', '/venues/1', '/artists', '/artists/1', '/shows', '/venues/create', '/analytics'):
+    response = client.get(path)
+    assert response.status_code == 200, path
+  assert b'The Musical Hop' in client.get('/venues').data
+  assert b'Guns N Petals' in client.get('/shows').data
+
+
+def test_unknown_pages_use_the_404_template(client):
+  response = client.get('/no/such/page')
+  assert response.status_code == 404
+  assert b'nothing here' in response.data
+
+
+def test_heavy_modules_are_not_imported_by_the_factory(tmp_path):
+  # numpy/scipy and the partition helpers load with the commands that use them
+  script = (
+    "import sys; sys.path.insert(0, %r); import app; app.create_app('test'); " % ROOT +
+    "print(' '.join(sorted({'numpy', 'scipy', 'partitions'} & set(sys.modules))))"
+  )
+  result = subprocess.run([sys.executable, '-c', script], cwd=tmp_path, env=dict(os.environ, LOG_DIR=str(tmp_path)), capture_output=True, text=True, check=True)
+  assert result.stdout.strip() == ''
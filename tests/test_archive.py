@@ -0,0 +1,61 @@
+from datetime import datetime
+
+from extensions import db
+from models import ShowArchive
+import partitions
+
+from test_analytics import rollups, rebuilt_rollups
+
+
+def archive_past_shows():
+  with db.engine.begin() as conn:
+    return partitions.archive_before(conn, datetime(2020, 1, 1))
+
+
+def test_deleting_a_venue_deletes_its_archived_shows(client, create_venue, create_artist, create_show):
+  create_venue(name='Old Hall')
+  create_venue(name='New Hall', city='New York', state='NY')
+  create_artist()
+  create_show(1, 1, '2010-05-21 21:30:00')
+  create_show(1, 2, '2011-05-21 21:30:00')
+  assert archive_past_shows() == 2
+
+  client.delete('/venues/1')
+
+  assert [show.venue_id for show in ShowArchive.query] == [2]
+  assert client.get('/artists/1').status_code == 200
+  assert rollups() == rebuilt_rollups()
+
+
+def test_deleting_an_artist_deletes_its_archived_shows(client, create_venue, create_artist, create_show):
+  create_venue()
+  create_artist(name='Gone')
+  create_artist(name='Staying', genres=('Jazz',))
+  create_show(1, 1, '2010-05-21 21:30:00')
+  create_show(2, 1, '2011-05-21 21:30:00')
+  assert archive_past_shows() == 2
+
+  client.delete('/artists/1')
+
+  assert [show.artist_id for show in ShowArchive.query] == [2]
+  assert client.get('/venues/1').status_code == 200
+  assert rollups() == rebuilt_rollups()
+
+
+def test_detail_pages_skip_shows_of_missing_venues_and_artists(client, create_venue, create_artist, create_show):
+  create_venue()
+  create_artist()
+  create_show(1, 1, '2010-05-21 21:30:00')
+  archive_past_shows()
+  # archive rows left behind before deletes cleaned them up
+  db.session.add(ShowArchive(id=99, start_time=datetime(2012, 1, 1), artist_id=1, venue_id=42))
+  db.session.add(ShowArchive(id=98, start_time=datetime(2012, 1, 1), artist_id=42, venue_id=1))
+  db.session.commit()
+
+  assert client.get('/artists/1').status_code == 200
+  assert client.get('/venues/1').status_code == 200
+
+
+def test_deleting_a_missing_venue_or_artist_is_a_404(client):
+  assert client.delete('/venues/99').status_code == 404
+  assert client.delete('/artists/99').status_code == 404
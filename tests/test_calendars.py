@@ -0,0 +1,28 @@
+import calendars
+
+
+def test_a_rebuilt_feed_keeps_its_etag(client, create_venue, create_artist, create_show, monkeypatch):
+  create_venue()
+  create_artist()
+  create_show(1, 1, '2035-04-01 20:00:00')
+  first = client.get('/venues/1/calendar.ics')
+  assert first.status_code == 200
+  assert b'SUMMARY:Guns N Petals at The Musical Hop' in first.data
+
+  # rebuilt a moment later, with a new DTSTAMP
+  calendars.feed_cache.clear()
+  monkeypatch.setattr(calendars, 'render_calendar', lambda name, events, render=calendars.render_calendar:
+    render(name, events).replace('DTSTAMP:', 'DTSTAMP:1'))
+  response = client.get('/venues/1/calendar.ics', headers={'If-None-Match': first.headers['ETag']})
+  assert response.status_code == 304
+
+
+def test_a_new_show_changes_the_etag(client, create_venue, create_artist, create_show):
+  create_venue()
+  create_artist()
+  create_show(1, 1, '2035-04-01 20:00:00')
+  etag = client.get('/venues/1/calendar.ics').headers['ETag']
+  create_show(1, 1, '2035-05-01 20:00:00')
+  response = client.get('/venues/1/calendar.ics', headers={'If-None-Match': etag})
+  assert response.status_code == 200
+  assert response.headers['ETag'] != etag
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+from extensions import db
+from models import Venue, ChangeLog
+
+
+def feed(client, **args):
+  response = client.get('/api/changes', query_string=args)
+  assert response.status_code == 200
+  return response.get_json()
+
+
+def entries(page):
+  return [(change['entity'], change['id'], change['action']) for change in page['changes']]
+
+
+def test_writes_are_logged_in_order(client, create_venue, create_artist):
+  create_venue()
+  create_artist()
+  assert client.patch('/venues/1', data={'version': 1, 'name': 'Renamed'}).status_code == 200
+  assert client.delete('/artists/1').status_code == 200
+
+  assert entries(feed(client)) == [
+    ('Venue', 1, 'created'), ('Artist', 1, 'created'), ('Venue', 1, 'updated'), ('Artist', 1, 'deleted'),
+  ]
+
+
+def test_pages_resume_from_the_cursor(client, create_venue):
+  for name in ('One', 'Two', 'Three'):
+    create_venue(name=name)
+
+  first = feed(client, limit=2)
+  assert entries(first) == [('Venue', 1, 'created'), ('Venue', 2, 'created')]
+  assert first['has_more']
+
+  second = feed(client, since=first['next'], limit=2)
+  assert entries(second) == [('Venue', 3, 'created')]
+  assert not second['has_more']
+
+  # nothing new: the same cursor comes back
+  assert feed(client, since=second['next'])['next'] == second['next']
+  create_venue(name='Four')
+  assert entries(feed(client, since=second['next'])) == [('Venue', 4, 'created')]
+
+
+def test_rolled_back_writes_are_not_logged(app):
+  db.session.add(Venue(name='Never', city='San Francisco', state='CA', address='', phone='', genres='Jazz'))
+  db.session.flush()
+  assert ChangeLog.query.count() == 1
+  db.session.rollback()
+  assert ChangeLog.query.count() == 0
+
+
+def test_bad_requests(client):
+  assert client.get('/api/changes?since=nonsense').status_code == 400
+  assert client.get('/api/changes?limit=0').status_code == 400
+
+
+def test_prune_keeps_recent_changes(app, create_venue):
+  create_venue(name='Old')
+  create_venue(name='New')
+  ChangeLog.query.filter_by(entity_id=1).update({'changed_at': datetime.utcnow() - timedelta(days=31)})
+  db.session.commit()
+
+  result = app.test_cli_runner().invoke(args=['changes', 'prune', '--days', '30'])
+  assert '1 changes pruned' in result.output
+  assert [row.entity_id for row in ChangeLog.query] == [2]
@@ -0,0 +1,53 @@
+import pytest
+from flask import Flask
+
+import config
+from app import create_app, load_config
+
+
+@pytest.fixture(autouse=True)
+def log_dir(monkeypatch, tmp_path):
+  # keep the logs of the apps built here out of the working tree
+  monkeypatch.chdir(tmp_path)
+  monkeypatch.setattr(config.Config, 'LOG_DIR', str(tmp_path), raising=False)
+
+
+def loaded(config):
+  app = Flask(__name__)
+  load_config(app, config)
+  return app.config
+
+
+def test_profiles_are_selected_by_name():
+  assert loaded('dev')['DEBUG']
+  assert not loaded('prod')['DEBUG']
+  app = create_app('test')
+  assert app.testing and not app.debug
+  assert not app.config['WTF_CSRF_ENABLED']
+
+
+def test_overrides_apply_on_top_of_the_fyyur_config_profile(monkeypatch):
+  monkeypatch.setenv('FYYUR_CONFIG', 'test')
+  app = create_app({'SQLALCHEMY_ECHO': True})
+  assert app.testing and app.config['SQLALCHEMY_ECHO']
+
+  monkeypatch.delenv('FYYUR_CONFIG')
+  assert loaded({'SQLALCHEMY_ECHO': True})['DEBUG']
+
+
+def test_prod_requires_a_secret_key(monkeypatch):
+  monkeypatch.setattr(config.ProductionConfig, 'SECRET_KEY', None)
+  with pytest.raises(RuntimeError):
+    create_app('prod')
+
+
+def test_prod_pools_connections_per_worker(monkeypatch, tmp_path):
+  monkeypatch.setenv('FYYUR_CONFIG', 'prod')
+  monkeypatch.setattr(config.ProductionConfig, 'SECRET_KEY', 'shared')
+  app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///%s' % (tmp_path / 'prod.db')})
+  assert not app.debug
+  options = app.config['SQLALCHEMY_ENGINE_OPTIONS']
+  assert options['pool_pre_ping'] and options['pool_size'] == 5
+  with app.app_context():
+    from extensions import db
+    assert db.engine.pool.size() == 5
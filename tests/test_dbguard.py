@@ -0,0 +1,47 @@
+import threading
+import time
+
+from sqlalchemy import text
+
+import dbguard as dbguard_module
+from extensions import db, dbguard
+
+
+def test_rejected_requests_leave_the_probe_alone(app):
+  # a probe request that waits until the others were turned away
+  probing = threading.Event()
+  finish = threading.Event()
+
+  @app.route('/test/probe')
+  def probe():
+    probing.set()
+    finish.wait(5)
+    db.session.execute(text('SELECT 1'))
+    return 'ok'
+
+  breaker = dbguard.breaker
+  breaker.state = dbguard_module.OPEN
+  breaker.opened_at = time.monotonic() - breaker.reset_seconds
+
+  responses = []
+  def get(path):
+    responses.append(app.test_client().get(path).status_code)
+
+  probe_thread = threading.Thread(target=get, args=('/test/probe',))
+  probe_thread.start()
+  assert probing.wait(5)
+
+  threads = [threading.Thread(target=get, args=('/artists',)) for _ in range(8)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  assert responses == [503] * 8
+  assert breaker.state == dbguard_module.HALF_OPEN
+  assert breaker.probing
+
+  finish.set()
+  probe_thread.join()
+  assert responses[-1] == 200
+  assert breaker.state == dbguard_module.CLOSED
+  assert not breaker.probing
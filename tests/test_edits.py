@@ -0,0 +1,54 @@
+from models import Venue, Artist
+
+VENUE_FORM = dict(
+  name='The Musical Hop', city='San Francisco', state='CA', address='1015 Folsom Street', phone='123-123-1234',
+  genres=['Jazz'], website='', image_link='', facebook_link='', seeking_description='',
+)
+ARTIST_FORM = dict(
+  name='Guns N Petals', city='San Francisco', state='CA', phone='326-123-5000', genres=['Rock n Roll'],
+  website='', image_link='', facebook_link='', seeking_description='',
+)
+
+
+def test_editing_a_venue(client, create_venue):
+  create_venue()
+  response = client.post('/venues/1/edit', data=dict(VENUE_FORM, name='The Jazz Hop', version=1))
+  assert response.status_code == 302
+  assert Venue.query.get(1).name == 'The Jazz Hop'
+
+
+def test_editing_a_deleted_venue(client, create_venue):
+  create_venue()
+  client.delete('/venues/1')
+  assert client.post('/venues/1/edit', data=dict(VENUE_FORM, version=1)).status_code == 404
+
+
+def test_editing_a_deleted_artist(client, create_artist):
+  create_artist()
+  client.delete('/artists/1')
+  assert client.post('/artists/1/edit', data=dict(ARTIST_FORM, version=1)).status_code == 404
+  assert Artist.query.get(1) is None
+
+
+def test_editing_a_changed_venue_is_a_conflict(client, create_venue):
+  create_venue()
+  client.post('/venues/1/edit', data=dict(VENUE_FORM, name='The Jazz Hop', version=1))
+  response = client.post('/venues/1/edit', data=dict(VENUE_FORM, name='The Blues Hop', version=1))
+  assert response.status_code == 302
+  assert response.headers['Location'].endswith('/venues/1/edit')
+  assert Venue.query.get(1).name == 'The Jazz Hop'
+
+
+def test_patching_a_venue(client, create_venue):
+  create_venue()
+  response = client.patch('/venues/1', data=dict(name='The Jazz Hop', version=1))
+  assert response.get_json() == {'id': 1, 'version': 2, 'changed': ['name']}
+  response = client.patch('/venues/1', data=dict(name='The Blues Hop', version=1))
+  assert response.status_code == 409
+  assert response.get_json() == {'error': 'conflict', 'version': 2}
+
+
+def test_patching_a_deleted_artist(client, create_artist):
+  create_artist()
+  client.delete('/artists/1')
+  assert client.patch('/artists/1', data=dict(name='Guns N Roses', version=1)).status_code == 404
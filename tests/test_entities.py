@@ -0,0 +1,79 @@
+from entities import EntityCache, entity_cache
+from extensions import db
+from models import Venue, Artist
+
+
+def counts():
+  metrics = entity_cache.metrics()
+  return metrics['fyyur_entity_cache_hits_total'], metrics['fyyur_entity_cache_misses_total']
+
+
+def test_misses_are_loaded_and_then_served_from_the_cache(app, create_venue):
+  create_venue(name='First')
+  create_venue(name='Second')
+  entity_cache.clear()
+
+  hits, misses = counts()
+  venues = entity_cache.get_many(Venue, [1, 2, 99])
+  assert sorted(venue['name'] for venue in venues.values()) == ['First', 'Second']
+  assert counts() == (hits, misses + 3)
+
+  assert entity_cache.get(Venue, 1)['name'] == 'First'
+  assert counts() == (hits + 1, misses + 3)
+
+
+def test_committed_edits_and_deletes_are_written_through(client, create_venue):
+  create_venue(name='Before')
+  assert entity_cache.get(Venue, 1)['name'] == 'Before'
+
+  response = client.patch('/venues/1', data={'version': 1, 'name': 'After'})
+  assert response.status_code == 200
+  hits, misses = counts()
+  assert entity_cache.get(Venue, 1)['name'] == 'After'
+  assert counts() == (hits + 1, misses)
+
+  assert client.delete('/venues/1').status_code == 200
+  assert entity_cache.get(Venue, 1) is None
+
+
+def test_a_load_racing_a_write_is_not_cached(app, create_artist):
+  create_artist()
+  cache = EntityCache()
+  generation = cache.generation
+  cache.evict(Artist, 1)
+  cache.load(Artist, [1], generation)
+  assert cache.entries == {}
+
+  cache.load(Artist, [1], cache.generation)
+  assert list(cache.entries) == [('Artist', 1)]
+
+
+def test_least_recently_used_entries_are_evicted(app, create_venue):
+  for name in ('One', 'Two', 'Three'):
+    create_venue(name=name)
+  cache = EntityCache(max_entries=2)
+  cache.get_many(Venue, [1, 2])
+  cache.get(Venue, 1)
+  cache.get(Venue, 3)
+  assert sorted(cache.entries) == [('Venue', 1), ('Venue', 3)]
+  assert cache.metrics()['fyyur_entity_cache_evictions_total'] == 1
+
+
+def test_expired_entries_are_reloaded(app, create_venue):
+  create_venue(name='Before')
+  cache = EntityCache(ttl=60)
+  cache.get(Venue, 1)
+  # a write by another worker, which this process is not told about
+  Venue.query.filter_by(id=1).update({'name': 'Elsewhere'})
+  db.session.commit()
+  assert cache.get(Venue, 1)['name'] == 'Before'
+
+  key = ('Venue', 1)
+  loaded_at, values = cache.entries[key]
+  cache.entries[key] = (loaded_at - 61, values)
+  assert cache.get(Venue, 1)['name'] == 'Elsewhere'
+
+
+def test_unknown_ids_are_not_found(client):
+  assert client.get('/venues/1').status_code == 404
+  assert client.get('/artists/1/edit').status_code == 404
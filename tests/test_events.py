@@ -0,0 +1,105 @@
+import json
+import os
+
+import pytest
+
+from changes import latest_cursor
+from events import cursor_key
+from extensions import db, event_stream
+from models import Show
+
+
+@pytest.fixture
+def app(make_app, monkeypatch):
+  # short streams, and no poller thread: tests call event_stream.poll()
+  app = make_app(EVENTS_HEARTBEAT=0.05, EVENTS_MAX_STREAM_SECONDS=0.5, EVENTS_BUFFER_SIZE=3)
+  with app.app_context():
+    db.create_all()
+    for name, value in (('pid', os.getpid()), ('cursor', None), ('events', []), ('floor', cursor_key(None)), ('streams', 0)):
+      monkeypatch.setattr(event_stream, name, value)
+    yield app
+    db.session.remove()
+    db.drop_all()
+
+
+@pytest.fixture
+def shows(create_venue, create_artist, create_show):
+  # venue 1 and 2, artist 1 and 2; show n is at venue and by artist 2 - n % 2
+  create_venue(name='The Musical Hop')
+  create_venue(name='The Dueling Pianos Bar')
+  create_artist(name='Guns N Petals')
+  create_artist(name='Matt Quevedo')
+  def create(count):
+    for number in range(1, count + 1):
+      create_show(artist_id=2 - number % 2, venue_id=2 - number % 2, start_time='2035-04-%02d 20:00' % number)
+    event_stream.poll()
+  return create
+
+
+def parse(body):
+  # [(id, event name, data)] of a stream body
+  events = []
+  for block in body.split('\n\n'):
+    fields = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+    if 'event' in fields:
+      events.append((fields['id'], fields['event'], fields['data']))
+  return events
+
+
+def read(client, path, **kwargs):
+  response = client.get(path, **kwargs)
+  assert response.status_code == 200
+  assert response.mimetype == 'text/event-stream'
+  return parse(response.get_data(as_text=True))
+
+
+def test_new_shows_are_pushed_to_open_streams(client, shows, create_show):
+  shows(1)
+  response = client.get('/api/shows/events', buffered=False)
+  body = iter(response.response)
+  assert next(body) == b'retry: 1000\n\n'
+
+  create_show(artist_id=1, venue_id=1, start_time='2035-05-01 20:00')
+  event_stream.poll()
+  [(id, name, data)] = parse(next(body).decode())
+  assert id == latest_cursor()
+  assert name == 'created'
+  event = json.loads(data)
+  assert (event['venue_name'], event['artist_name'], event['start_time']) == ('The Musical Hop', 'Guns N Petals', '2035-05-01 20:00:00')
+  response.close()
+
+
+def test_streams_resume_from_the_last_event_id(client, shows):
+  shows(3)
+  first, second, third = [id for id, name, data in read(client, '/api/shows/events?since=0-0')]
+
+  assert [id for id, name, data in read(client, '/api/shows/events', headers={'Last-Event-ID': first})] == [second, third]
+  assert [id for id, name, data in read(client, '/api/shows/events?since=%s' % second)] == [third]
+  # without a cursor only what happens from now on
+  assert read(client, '/api/shows/events') == []
+
+
+def test_streams_behind_the_buffer_catch_up_from_the_change_log(client, shows):
+  shows(5)
+  assert len(event_stream.events) == 3
+  assert len(read(client, '/api/shows/events?since=0-0')) == 5
+
+
+def test_streams_filter_by_venue_and_artist(app, client, shows):
+  shows(4)
+  db.session.delete(Show.query.get(2))
+  db.session.commit()
+  event_stream.poll()
+
+  by_venue = read(client, '/api/shows/events?since=0-0&venue_id=2')
+  assert [(name, json.loads(data)['id']) for id, name, data in by_venue] == [('created', 2), ('created', 4), ('deleted', 2)]
+  assert len(read(client, '/api/shows/events?since=0-0&artist_id=1')) == 2
+  assert len(read(client, '/api/shows/events?since=0-0&venue_id=1&artist_id=2')) == 5
+
+
+def test_bad_cursors_and_full_workers_are_refused(client, monkeypatch):
+  assert client.get('/api/shows/events?since=nonsense').status_code == 400
+  monkeypatch.setattr(event_stream, 'max_streams', 0)
+  response = client.get('/api/shows/events')
+  assert response.status_code == 503
+  assert response.headers['Retry-After']
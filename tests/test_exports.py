@@ -0,0 +1,77 @@
+import csv
+import io
+import json
+
+from exports import export_chunks
+from extensions import db
+
+
+def test_venues_export_as_csv(client, create_venue):
+  create_venue(name='The Musical Hop')
+  create_venue(name='The Dueling Pianos Bar', city='New York', state='NY')
+
+  response = client.get('/export/venues')
+  assert response.status_code == 200
+  assert response.mimetype == 'text/csv'
+  assert response.headers['Content-Disposition'] == 'attachment; filename=venues.csv'
+  rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+  assert [(row['id'], row['name'], row['city']) for row in rows] == [
+    ('1', 'The Musical Hop', 'San Francisco'), ('2', 'The Dueling Pianos Bar', 'New York'),
+  ]
+
+
+def test_shows_export_as_ndjson_with_names(client, create_venue, create_artist, create_show):
+  create_venue()
+  create_artist()
+  create_show(artist_id=1, venue_id=1, start_time='2035-04-01 20:00')
+
+  response = client.get('/export/shows?format=ndjson')
+  assert response.mimetype == 'application/x-ndjson'
+  assert [json.loads(line) for line in response.get_data(as_text=True).splitlines()] == [{
+    'id': 1, 'start_time': '2035-04-01T20:00:00', 'venue_id': 1, 'venue_name': 'The Musical Hop',
+    'artist_id': 1, 'artist_name': 'Guns N Petals', 'archived': False,
+  }]
+
+
+def test_rows_are_written_one_batch_at_a_time(app, create_artist):
+  for number in range(5):
+    create_artist(name='Artist %d' % number)
+
+  chunks = list(export_chunks('artists', 'csv', batch_size=2))
+  assert [chunk.count('\n') for chunk in chunks] == [3, 2, 1]
+  assert chunks[0].startswith('id,name,')
+
+  # only the header for an empty table
+  assert list(export_chunks('venues', 'csv')) == [
+    'id,name,city,state,address,phone,genres,website,image_link,facebook_link,seeking_talent,seeking_description\r\n'
+  ]
+
+
+def test_unknown_exports_are_not_found(client):
+  assert client.get('/export/users').status_code == 404
+  assert client.get('/export/venues?format=xml').status_code == 404
+
+
+def test_a_streamed_export_holds_its_slot_until_closed(make_app):
+  app = make_app(RATELIMIT_ENABLED=True, RATELIMITS={
+    'export': {'rate': 10.0, 'burst': 10, 'max_active': 1, 'max_waiting': 0, 'wait_timeout': 0},
+  })
+  with app.app_context():
+    db.create_all()
+    client = app.test_client()
+
+    first = client.get('/export/venues', buffered=False)
+    assert first.status_code == 200
+    assert client.get('/export/venues').status_code == 503
+    first.close()
+    assert client.get('/export/venues').status_code == 200
+    db.session.remove()
+    db.drop_all()
+
+
+def test_export_command_writes_a_file(app, create_venue, tmp_path):
+  create_venue()
+  output = tmp_path / 'venues.ndjson'
+  result = app.test_cli_runner().invoke(args=['export', 'venues', '--format', 'ndjson', '--output', str(output)])
+  assert result.exit_code == 0, result.output
+  assert json.loads(output.read_text())['name'] == 'The Musical Hop'
@@ -0,0 +1,39 @@
+import uuid
+
+from extensions import db, bus
+from entities import entity_cache
+from models import Venue
+
+VENUE_FORM = dict(
+  city='San Francisco', state='CA', address='1015 Folsom Street', phone='123-123-1234', genres=['Jazz'],
+  website='', image_link='', facebook_link='', seeking_description='',
+)
+
+
+def test_writes_through_one_app_evict_the_cache_of_another(make_app, tmp_path):
+  # two workers on one database, sharing changes over the memory bus
+  settings = dict(
+    SQLALCHEMY_DATABASE_URI='sqlite:///%s' % (tmp_path / 'fyyur.db'),
+    INVALIDATION_BUS='memory',
+    INVALIDATION_CHANNEL='test-%s' % uuid.uuid4().hex,
+  )
+  a = make_app(**settings)
+  b = make_app(**settings)
+  with a.app_context():
+    db.create_all()
+  client_a = a.test_client()
+  client_b = b.test_client()
+
+  client_a.post('/venues/create', data=dict(VENUE_FORM, name='The Musical Hop'))
+  assert b'The Musical Hop' in client_b.get('/venues/1').data
+  with b.app_context():
+    assert entity_cache.get(Venue, 1)['name'] == 'The Musical Hop'
+
+  client_a.post('/venues/1/edit', data=dict(VENUE_FORM, name='The Jazz Hop', version=1))
+
+  assert b'The Jazz Hop' in client_b.get('/venues/1').data
+  with a.app_context():
+    assert bus.metrics()['fyyur_invalidation_received_total'] == 0
+  with b.app_context():
+    # the edit; b subscribed after the venue was created
+    assert bus.metrics()['fyyur_invalidation_received_total'] == 1
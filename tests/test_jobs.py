@@ -0,0 +1,177 @@
+import os
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+
+from jobs import JobQueue
+
+# the queue only needs a Flask app, a Flask-SQLAlchemy db and a Job model
+db = SQLAlchemy()
+queue = JobQueue()
+
+
+class Job(db.Model):
+  __tablename__ = 'Job'
+
+  id = db.Column(db.Integer, primary_key=True)
+  name = db.Column(db.String(120), nullable=False)
+  payload = db.Column(db.Text)
+  status = db.Column(db.String(20), nullable=False, default='queued')
+  attempts = db.Column(db.Integer, nullable=False, default=0)
+  run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+  locked_at = db.Column(db.DateTime)
+  last_error = db.Column(db.Text)
+  created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+ran = []
+failures = []
+
+@queue.handler('note')
+def note(value):
+  ran.append(value)
+
+@queue.handler('flaky')
+def flaky(value):
+  if failures:
+    failures.pop()
+    raise RuntimeError('try again')
+  ran.append(value)
+
+
+@pytest.fixture
+def app(tmp_path):
+  # a database file, so other connections only see committed jobs
+  app = Flask(__name__)
+  app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('TEST_DATABASE_URL') or 'sqlite:///%s' % (tmp_path / 'jobs.db')
+  app.config['JOBS_BACKOFF_SECONDS'] = 10
+  app.config['JOBS_MAX_ATTEMPTS'] = 3
+  db.init_app(app)
+  queue.init_app(app, db, Job)
+  with app.app_context():
+    db.create_all()
+    del ran[:]
+    del failures[:]
+    yield app
+    db.session.remove()
+    db.drop_all()
+
+
+def committed_jobs():
+  with db.engine.connect() as conn:
+    return conn.execute(db.select(Job.name, Job.status)).all()
+
+
+def test_jobs_are_visible_once_the_write_commits(app):
+  queue.enqueue('note', value=1)
+  assert committed_jobs() == []
+  db.session.commit()
+  assert committed_jobs() == [('note', 'queued')]
+
+  assert queue.run_pending() == 1
+  assert ran == [1]
+  assert committed_jobs() == []
+
+
+def test_rolled_back_jobs_are_discarded(app):
+  queue.enqueue('note', value=1)
+  db.session.rollback()
+  assert queue.run_pending() == 0
+  assert ran == []
+  assert committed_jobs() == []
+
+
+def test_jobs_without_handlers_are_not_stored(app):
+  assert queue.enqueue('nobody_listens', value=1) is None
+
+
+def test_claimed_jobs_are_not_claimed_again(app):
+  for value in range(3):
+    queue.enqueue('note', value=value)
+  db.session.commit()
+
+  first = queue.claim(2)
+  second = queue.claim(2)
+  assert len(first) == 2 and len(second) == 1
+  assert not set(first) & set(second)
+  assert queue.claim(2) == []
+  assert committed_jobs() == [('note', 'running')] * 3
+
+
+@pytest.mark.skipif(not os.environ.get('TEST_DATABASE_URL', '').startswith('postgresql'),
+  reason='SKIP LOCKED needs PostgreSQL')
+def test_concurrent_claims_skip_locked_rows(app):
+  for value in range(20):
+    queue.enqueue('note', value=value)
+  db.session.commit()
+
+  claimed = []
+  start = threading.Barrier(4)
+  def claim():
+    with app.app_context():
+      start.wait()
+      claimed.append(queue.claim(5))
+  threads = [threading.Thread(target=claim) for _ in range(4)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+
+  ids = [id for batch in claimed for id in batch]
+  assert len(ids) == len(set(ids)) == 20
+
+
+def test_stale_claims_are_requeued(app):
+  queue.enqueue('note', value=1)
+  db.session.commit()
+  queue.claim(1)
+  assert queue.requeue_stale() == 0
+
+  Job.query.update({'locked_at': datetime.utcnow() - timedelta(seconds=app.config['JOBS_VISIBILITY_TIMEOUT'] + 1)})
+  db.session.commit()
+  assert queue.requeue_stale() == 1
+  assert queue.run_pending() == 1
+  assert ran == [1]
+
+
+def test_failed_jobs_are_retried_with_backoff(app):
+  failures.extend(['once', 'twice'])
+  queue.enqueue('flaky', value=1)
+  db.session.commit()
+
+  for attempts, backoff in ((1, 10), (2, 20)):
+    before = datetime.utcnow()
+    assert queue.run_pending() == 1
+    job = Job.query.one()
+    assert (job.status, job.attempts) == ('queued', attempts)
+    assert job.last_error == 'RuntimeError: try again'
+    assert before + timedelta(seconds=backoff) <= job.run_at <= datetime.utcnow() + timedelta(seconds=backoff)
+    # not due yet
+    assert queue.run_pending() == 0
+    job.run_at = datetime.utcnow()
+    db.session.commit()
+
+  assert queue.run_pending() == 1
+  assert ran == [1]
+  assert committed_jobs() == []
+
+
+def test_jobs_fail_after_the_last_attempt(app):
+  failures.extend(['again'] * 3)
+  queue.enqueue('flaky', value=1)
+  db.session.commit()
+
+  for _ in range(3):
+    Job.query.update({'run_at': datetime.utcnow()})
+    db.session.commit()
+    queue.run_pending()
+
+  job = Job.query.one()
+  assert (job.status, job.attempts) == ('failed', 3)
+  Job.query.update({'run_at': datetime.utcnow()})
+  db.session.commit()
+  assert queue.run_pending() == 0
+  assert ran == []
@@ -0,0 +1,130 @@
+import asyncio
+import threading
+
+import pytest
+from aiohttp import web
+
+import links
+from extensions import db
+from models import LinkCheck
+
+
+class LinkServer(object):
+  # an aiohttp server on its own loop and thread; check_links runs its own
+  # loop in the test's thread
+
+  def __init__(self):
+    self.in_flight = 0
+    self.most_in_flight = 0
+    self.loop = asyncio.new_event_loop()
+    self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+  async def ok(self, request):
+    return web.Response(text='ok')
+
+  async def gone(self, request):
+    return web.Response(status=404)
+
+  async def moved(self, request):
+    raise web.HTTPMovedPermanently('/ok')
+
+  async def slow(self, request):
+    await asyncio.sleep(1.5)
+    return web.Response(text='late')
+
+  async def busy(self, request):
+    self.in_flight += 1
+    self.most_in_flight = max(self.most_in_flight, self.in_flight)
+    try:
+      await asyncio.sleep(0.05)
+    finally:
+      self.in_flight -= 1
+    return web.Response(text='busy')
+
+  async def serve(self):
+    app = web.Application()
+    app.add_routes([
+      web.get('/ok', self.ok), web.get('/gone', self.gone), web.get('/moved', self.moved),
+      web.get('/slow', self.slow), web.get('/busy/{n}', self.busy),
+    ])
+    self.runner = web.AppRunner(app)
+    await self.runner.setup()
+    site = web.TCPSite(self.runner, '127.0.0.1', 0)
+    await site.start()
+    return site._server.sockets[0].getsockname()[1]
+
+  def start(self):
+    self.thread.start()
+    port = asyncio.run_coroutine_threadsafe(self.serve(), self.loop).result(5)
+    self.url = 'http://127.0.0.1:%d' % port
+
+  def stop(self):
+    asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result(5)
+    self.loop.call_soon_threadsafe(self.loop.stop)
+    self.thread.join(5)
+
+
+@pytest.fixture
+def server():
+  server = LinkServer()
+  server.start()
+  yield server
+  server.stop()
+
+
+def link_checks():
+  db.session.rollback()
+  return dict((check.url.split('/', 3)[-1], check) for check in LinkCheck.query)
+
+
+def test_dead_links_redirects_and_timeouts(app, server, create_venue):
+  create_venue(name='Up', website=server.url + '/ok', facebook_link=server.url + '/moved')
+  create_venue(name='Down', website=server.url + '/gone', facebook_link=server.url + '/slow',
+    image_link='ftp://example.com/logo.png')
+
+  checked, dead = links.check_links(timeout=0.5)
+
+  assert (checked, dead) == (5, 3)
+  checks = link_checks()
+  assert checks['ok'].status == 200
+  # followed to /ok
+  assert checks['moved'].status == 200
+  assert checks['gone'].status == 404
+  assert checks['slow'].status is None and checks['slow'].error == 'timeout'
+  assert checks['logo.png'].error == 'not an http(s) URL'
+  assert sorted(check.url for check in links.dead_links()) == sorted(
+    ['ftp://example.com/logo.png', server.url + '/gone', server.url + '/slow'])
+
+  # fresh checks are not repeated
+  assert links.check_links(timeout=0.5) == (0, 0)
+
+
+def test_per_host_limit(app, server, create_venue):
+  for n in range(4):
+    create_venue(name='Venue %d' % n, website=server.url + '/busy/w%d' % n,
+      facebook_link=server.url + '/busy/f%d' % n, image_link=server.url + '/busy/i%d' % n)
+
+  assert links.check_links(concurrency=10, per_host=2) == (12, 0)
+  assert server.most_in_flight == 2
+
+
+def test_results_are_committed_as_fetches_complete(app, server, create_venue, monkeypatch):
+  create_venue(name='Quick', website=server.url + '/ok', facebook_link=server.url + '/gone')
+  create_venue(name='Stuck', website=server.url + '/slow')
+  monkeypatch.setattr(links, 'WRITE_BATCH_SIZE', 1)
+  fetch_status = links.fetch_status
+
+  async def interrupted(session, url, validators, timeout):
+    if url.endswith('/slow'):
+      # the run is stopped while this fetch is still waiting
+      await asyncio.sleep(0.5)
+      raise KeyboardInterrupt()
+    return await fetch_status(session, url, validators, timeout)
+  monkeypatch.setattr(links, 'fetch_status', interrupted)
+
+  with pytest.raises(KeyboardInterrupt):
+    links.check_links()
+
+  checks = link_checks()
+  assert sorted(checks) == ['gone', 'ok']
+  assert checks['gone'].status == 404
@@ -0,0 +1,74 @@
+from contextlib import contextmanager
+
+from extensions import db
+from models import Venue, Artist, list_rows
+
+
+@contextmanager
+def counted_queries():
+  statements = []
+  def count(conn, cursor, statement, parameters, context, executemany):
+    statements.append(statement)
+  db.event.listen(db.engine, 'before_cursor_execute', count)
+  try:
+    yield statements
+  finally:
+    db.event.remove(db.engine, 'before_cursor_execute', count)
+
+
+def test_list_rows_count_only_upcoming_shows(app, create_venue, create_artist, create_show):
+  create_venue(name='Busy Hall')
+  create_venue(name='Quiet Hall')
+  create_artist()
+  create_show(artist_id=1, venue_id=1, start_time='2035-04-01 20:00')
+  create_show(artist_id=1, venue_id=1, start_time='2035-05-01 20:00')
+  create_show(artist_id=1, venue_id=1, start_time='2019-05-01 20:00')
+
+  rows = list_rows(Venue, count_upcoming=True).all()
+  assert [(row.id, row.name, row.num_upcoming_shows) for row in rows] == [(1, 'Busy Hall', 2), (2, 'Quiet Hall', 0)]
+  assert [tuple(row) for row in list_rows(Artist, count_upcoming=True)] == [(1, 'Guns N Petals', 2)]
+
+
+def test_list_rows_search_by_name(app, create_venue):
+  create_venue(name='The Musical Hop')
+  create_venue(name='Park Square Live Music & Coffee')
+  create_venue(name='The Dueling Pianos Bar')
+
+  assert [row.name for row in list_rows(Venue, search_term='music')] == ['The Musical Hop', 'Park Square Live Music & Coffee']
+  assert list_rows(Venue, search_term='hop').one().name == 'The Musical Hop'
+
+
+def test_venue_list_query_count_does_not_grow_with_venues(client, create_venue):
+  create_venue(name='One', city='San Francisco')
+  create_venue(name='Two', city='New York', state='NY')
+  with counted_queries() as few:
+    assert client.get('/venues').status_code == 200
+
+  for number in range(6):
+    create_venue(name='More %d' % number, city='City %d' % number)
+  with counted_queries() as many:
+    response = client.get('/venues')
+  assert b'More 5' in response.data and b'New York' in response.data
+  assert len(many) == len(few)
+
+
+def test_searches_list_the_matching_names(client, create_venue, create_artist):
+  create_venue()
+  create_venue(name='Elsewhere')
+  create_artist()
+
+  for path, search_term, name in (('/venues/search', 'musical', b'The Musical Hop'), ('/artists/search', 'petals', b'Guns N Petals')):
+    response = client.post(path, data={'search_term': search_term})
+    assert response.status_code == 200
+    assert name in response.data
+    assert b'"%s": 1' % search_term.encode() in response.data
+
+
+def test_show_list_names_venues_and_artists(client, create_venue, create_artist, create_show):
+  create_venue()
+  create_artist()
+  create_show(artist_id=1, venue_id=1, start_time='2035-04-01 20:00')
+
+  response = client.get('/shows')
+  assert b'The Musical Hop' in response.data and b'Guns N Petals' in response.data
+  assert b'April, 1, 2035' in response.data
@@ -0,0 +1,36 @@
+import logging
+import os
+
+from extensions import logs
+from logs import ACCESS_LOGGER, BoundedQueueHandler
+
+
+def queue_handlers(logger):
+  return [handler for handler in logger.handlers if isinstance(handler, BoundedQueueHandler)]
+
+
+def test_creating_apps_again_does_not_duplicate_handlers(make_app):
+  for _ in range(3):
+    app = make_app(ACCESS_LOG='access.log')
+  assert len(queue_handlers(app.logger)) == 1
+  assert len(queue_handlers(logging.getLogger(ACCESS_LOGGER))) == 1
+
+
+def test_log_files_are_reopened_after_external_rotation(make_app, tmp_path):
+  app = make_app(ACCESS_LOG='access.log')
+  client = app.test_client()
+  client.get('/nowhere').close()
+  app.logger.error('before rotation')
+  logs.stop()
+  os.rename(tmp_path / 'error.log', tmp_path / 'error.log.1')
+  os.rename(tmp_path / 'access.log', tmp_path / 'access.log.1')
+
+  client.get('/somewhere').close()
+  app.logger.error('after rotation')
+  logs.stop()
+
+  assert 'before rotation' in (tmp_path / 'error.log.1').read_text()
+  assert 'after rotation' in (tmp_path / 'error.log').read_text()
+  assert 'before rotation' not in (tmp_path / 'error.log').read_text()
+  assert '/nowhere' in (tmp_path / 'access.log.1').read_text()
+  assert (tmp_path / 'access.log').read_text().count('"path"') == 1
@@ -0,0 +1,84 @@
+import pytest
+import sqlalchemy as sa
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+
+import online_migrations
+from online_migrations import ONLINE_MARKER, backfill, check_statements, create_index_concurrently, split_statements
+
+
+@pytest.fixture
+def revision(tmp_path):
+  # run(helper, ...) calls a helper on a scratch database as a revision would
+  engine = sa.create_engine('sqlite:///%s' % (tmp_path / 'migrate.db'))
+  with engine.connect() as conn:
+    conn.execute(sa.text('CREATE TABLE "Venue" (id INTEGER PRIMARY KEY, city VARCHAR, city_slug VARCHAR)'))
+    conn.execute(sa.text('INSERT INTO "Venue" (id, city) VALUES (1, \'San Francisco\'), (2, \'New York\'), (3, \'Austin\')'))
+    conn.commit()
+    context = MigrationContext.configure(conn, opts={'transaction_per_migration': True})
+    with Operations.context(context):
+      def run(helper, *args, **kwargs):
+        with context.begin_transaction(_per_migration=True):
+          return helper(*args, **kwargs)
+      yield run, conn
+  engine.dispose()
+
+
+def flagged(sql):
+  return [statement for statement, reason in check_statements(split_statements(sql), set())]
+
+
+def test_preflight_flags_long_locks_on_existing_tables():
+  sql = '''
+-- Running upgrade a -> b
+
+CREATE INDEX "ix_Show_start_time" ON "Show" (start_time);
+
+ALTER TABLE "Venue" ADD COLUMN rating INTEGER NOT NULL;
+
+ALTER TABLE "Venue" ADD COLUMN stars INTEGER DEFAULT '0' NOT NULL;
+
+UPDATE "Venue" SET city = lower(city);
+
+COMMIT;
+'''
+  assert flagged(sql) == [
+    'CREATE INDEX "ix_Show_start_time" ON "Show" (start_time)',
+    'ALTER TABLE "Venue" ADD COLUMN rating INTEGER NOT NULL',
+    'UPDATE "Venue" SET city = lower(city)',
+  ]
+
+
+def test_preflight_skips_new_tables_and_online_helpers():
+  sql = '''
+CREATE TABLE "Rating" (id SERIAL NOT NULL, PRIMARY KEY (id));
+
+CREATE INDEX "ix_Rating_id" ON "Rating" (id);
+
+%sCREATE INDEX CONCURRENTLY IF NOT EXISTS "ix_Show_venue_id" ON "Show" ("venue_id");
+
+%sUPDATE "Venue" SET "city_slug" = lower(city) WHERE 1 = 1;
+
+UPDATE alembic_version SET version_num='b' WHERE alembic_version.version_num = 'a';
+''' % (ONLINE_MARKER, ONLINE_MARKER)
+  assert flagged(sql) == []
+
+
+def test_backfill_updates_in_batches(revision, monkeypatch):
+  run, conn = revision
+  batches = []
+  monkeypatch.setattr(online_migrations.time, 'sleep', lambda seconds: batches.append(seconds))
+
+  assert run(backfill, 'Venue', {'city_slug': 'lower(city)'}, where='city_slug IS NULL', batch_size=2, pause=0.5) == 3
+  assert batches == [0.5, 0.5]
+  rows = conn.execute(sa.text('SELECT id, city_slug FROM "Venue" ORDER BY id')).all()
+  assert rows == [(1, 'san francisco'), (2, 'new york'), (3, 'austin')]
+
+  # rerunning skips the rows already done
+  assert run(backfill, 'Venue', {'city_slug': 'lower(city)'}, where='city_slug IS NULL', pause=0) == 0
+
+
+def test_indexes_fall_back_to_plain_ddl(revision):
+  run, conn = revision
+  run(create_index_concurrently, 'ix_Venue_city', 'Venue', ['city'])
+  assert [index['name'] for index in sa.inspect(conn).get_indexes('Venue')] == ['ix_Venue_city']
@@ -0,0 +1,109 @@
+import pytest
+
+from extensions import db, static_pages
+
+
+@pytest.fixture
+def pages(make_app, tmp_path):
+  # an app pre-rendering its pages into tmp_path/pages
+  app = make_app(STATIC_PAGES_DIR=str(tmp_path / 'pages'))
+  with app.app_context():
+    db.create_all()
+    yield app, tmp_path / 'pages'
+    db.session.remove()
+    db.drop_all()
+
+
+def page(app, path):
+  # a GET without the session cookie the form posts leave behind
+  response = app.test_client().get(path)
+  body = response.get_data(as_text=True)
+  response.close()
+  return response, body
+
+
+def add_venue(app, name='The Musical Hop'):
+  response = app.test_client().post('/venues/create', data=dict(
+    name=name, city='San Francisco', state='CA', address='1015 Folsom Street', phone='123-123-1234',
+    genres=['Jazz'], website='', image_link='', facebook_link='', seeking_description='',
+  ))
+  assert response.status_code in (200, 302)
+
+
+def test_rendered_pages_are_stored_and_served(pages):
+  app, directory = pages
+  add_venue(app)
+
+  response, body = page(app, '/venues/1')
+  assert 'X-Fyyur-Prerendered' not in response.headers
+  assert (directory / 'venues' / '1' / 'index.html').read_text() == body
+
+  response, cached = page(app, '/venues/1')
+  assert response.headers['X-Fyyur-Prerendered'] == '1'
+  assert cached == body
+
+
+def test_streamed_lists_are_stored_once_sent(pages):
+  app, directory = pages
+  add_venue(app)
+  response, body = page(app, '/shows')
+  assert (directory / 'shows' / 'index.html').read_text() == body
+
+
+def test_writes_delete_the_affected_pages(pages):
+  app, directory = pages
+  add_venue(app)
+  for path in ('/venues', '/venues/1', '/artists'):
+    page(app, path)
+
+  response = app.test_client().patch('/venues/1', data={'version': 1, 'name': 'Renamed'})
+  assert response.status_code == 200
+  assert not (directory / 'venues' / '1' / 'index.html').exists()
+  assert not (directory / 'venues' / 'index.html').exists()
+  assert (directory / 'artists' / 'index.html').exists()
+
+  response, body = page(app, '/venues/1')
+  assert 'X-Fyyur-Prerendered' not in response.headers and 'Renamed' in body
+
+
+def test_some_requests_are_always_rendered(pages):
+  app, directory = pages
+  add_venue(app)
+  page(app, '/venues/1')
+
+  client = app.test_client()
+  assert 'X-Fyyur-Prerendered' not in client.get('/venues/1?fresh=1').headers
+  client.set_cookie(app.config['SESSION_COOKIE_NAME'], 'flashes')
+  assert 'X-Fyyur-Prerendered' not in client.get('/venues/1').headers
+
+
+def test_expired_pages_are_rendered_again(pages):
+  app, directory = pages
+  add_venue(app)
+  page(app, '/venues/1')
+  static_pages.max_age = 0
+  response, body = page(app, '/venues/1')
+  assert 'X-Fyyur-Prerendered' not in response.headers
+
+
+def test_a_render_racing_a_write_is_not_stored(pages):
+  app, directory = pages
+  path = static_pages.file_path('/venues/1')
+  generation = static_pages.generation
+  static_pages.invalidate(['/venues/1'])
+  assert not static_pages.store(path, b'stale', generation)
+  assert not (directory / 'venues' / '1' / 'index.html').exists()
+
+
+def test_build_renders_every_page(pages):
+  app, directory = pages
+  add_venue(app)
+  add_venue(app, name='Second Stage')
+
+  result = app.test_cli_runner().invoke(args=['pages', 'build'])
+  assert '5 pages rendered' in result.output
+  assert sorted(path.parent.relative_to(directory).as_posix() for path in directory.rglob('index.html')) == [
+    'artists', 'shows', 'venues', 'venues/1', 'venues/2',
+  ]
+  result = app.test_cli_runner().invoke(args=['pages', 'build', '--stale'])
+  assert '0 pages rendered' in result.output
@@ -0,0 +1,88 @@
+import pytest
+
+from extensions import db, profiler
+from profiling import DirectoryStore, flame_frames
+
+TOKEN = 'let-me-profile'
+
+
+@pytest.fixture
+def profiled(make_app):
+  app = make_app(PROFILE_TOKEN=TOKEN, PROFILE_SAMPLE_INTERVAL=0.001)
+  with app.app_context():
+    db.create_all()
+    yield app
+    db.session.remove()
+    db.drop_all()
+
+
+def get(client, path, **kwargs):
+  # the profile is stored when the server closes the response
+  response = client.get(path, **kwargs)
+  response.close()
+  return response
+
+
+def test_profiles_need_the_token(profiled):
+  client = profiled.test_client()
+  assert 'X-Fyyur-Profile-Id' not in get(client, '/venues', headers={'X-Fyyur-Profile': 'guess'}).headers
+  assert profiler.store.recent() == []
+
+  response = get(client, '/admin/profiles')
+  assert response.status_code == 401
+  assert response.headers['WWW-Authenticate'] == 'Basic realm="Fyyur profiles"'
+  assert get(client, '/admin/profiles', auth=('admin', 'guess')).status_code == 401
+  assert get(client, '/admin/profiles', auth=('admin', TOKEN)).status_code == 200
+
+
+def test_profile_pages_are_off_without_a_token(client):
+  assert get(client, '/venues', headers={'X-Fyyur-Profile': 'anything'}).status_code == 200
+  assert client.get('/admin/profiles').status_code == 404
+
+
+def test_requests_with_the_token_are_profiled(profiled):
+  client = profiled.test_client()
+  response = get(client, '/venues', headers={'X-Fyyur-Profile': TOKEN})
+  id = response.headers['X-Fyyur-Profile-Id']
+
+  profile = client.get('/admin/profiles/%s.json' % id, auth=('admin', TOKEN)).get_json()
+  assert (profile['trigger'], profile['method'], profile['path'], profile['status']) == ('header', 'GET', '/venues', 200)
+  assert profile['query_count'] == len(profile['queries']) >= 1
+  assert any('FROM "Venue"' in query['statement'] for query in profile['queries'])
+  assert profile['functions'] and profile['duration'] > 0
+
+  for sort in ('cumulative', 'total', 'calls'):
+    page = client.get('/admin/profiles/%s?sort=%s' % (id, sort), auth=('admin', TOKEN))
+    assert page.status_code == 200
+  listing = client.get('/admin/profiles', auth=('admin', TOKEN))
+  assert id.encode() in listing.data
+  assert client.get('/admin/profiles/nope', auth=('admin', TOKEN)).status_code == 404
+
+
+def test_a_fraction_of_requests_is_sampled(make_app):
+  app = make_app(PROFILE_SAMPLE_RATE=1.0)
+  with app.app_context():
+    db.create_all()
+    response = get(app.test_client(), '/venues')
+    assert 'X-Fyyur-Profile-Id' not in response.headers
+    assert [profile['trigger'] for profile in profiler.store.recent()] == ['sample']
+    db.session.remove()
+    db.drop_all()
+
+
+def test_directory_store_is_shared_and_bounded(profiled, tmp_path):
+  profiled.config.update(PROFILE_DIR=str(tmp_path / 'profiles'), PROFILE_BUFFER_SIZE=2)
+  first, second = DirectoryStore(profiled), DirectoryStore(profiled)
+  for number in range(3):
+    first.add({'id': 'p%d' % number, 'started': 1000.0 + number})
+
+  assert [profile['id'] for profile in second.recent()] == ['p2', 'p1']
+  assert second.get('p1')['started'] == 1001.0
+  assert second.get('p0') is None
+
+
+def test_flame_frames_nest_the_sampled_stacks():
+  frames = flame_frames({'main;view;query': 3, 'main;view': 1})
+  assert [(frame['depth'], frame['label'], frame['x'], frame['width']) for frame in frames] == [
+    (0, 'main', 0.0, 1.0), (1, 'view', 0.0, 1.0), (2, 'query', 0.0, 0.75),
+  ]
@@ -0,0 +1,30 @@
+import pytest
+
+from extensions import db
+
+SEARCH_ONCE = {'search': {'rate': 0.001, 'burst': 1}}
+
+
+@pytest.fixture
+def search(make_app):
+  app = make_app(RATELIMIT_ENABLED=True, RATELIMITS=SEARCH_ONCE, PROXY_HOPS=1)
+  with app.app_context():
+    db.create_all()
+    client = app.test_client()
+    def search(forwarded_for):
+      return client.post('/venues/search', data={'search_term': 'Hop'},
+        headers={'X-Forwarded-For': forwarded_for}).status_code
+    yield search
+    db.session.remove()
+    db.drop_all()
+
+
+def test_clients_are_told_apart_by_the_address_our_proxy_saw(search):
+  assert search('10.0.0.1') == 200
+  assert search('10.0.0.1') == 429
+  assert search('10.0.0.2') == 200
+
+
+def test_addresses_the_client_forwarded_are_not_trusted(search):
+  assert search('1.1.1.1, 10.0.0.1') == 200
+  assert search('2.2.2.2, 10.0.0.1') == 429
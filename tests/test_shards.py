@@ -0,0 +1,79 @@
+import pytest
+import sqlalchemy as sa
+
+import shards
+from extensions import db
+
+
+@pytest.fixture
+def app(make_app, tmp_path, monkeypatch):
+  # the main database and two region shards, each in its own file
+  app = make_app(
+    SQLALCHEMY_DATABASE_URI='sqlite:///%s' % (tmp_path / 'main.db'),
+    SHARDS={
+      'west': 'sqlite:///%s' % (tmp_path / 'west.db'),
+      'east': 'sqlite:///%s' % (tmp_path / 'east.db'),
+    },
+    SHARD_REGIONS={'CA': 'west', 'WA': 'west', 'NY': 'east'},
+    DEFAULT_SHARD='east',
+  )
+  # venue ids start over in every test's databases
+  monkeypatch.setattr(shards, 'venue_shards', dict())
+  with app.app_context():
+    db.create_all()
+    shards.init_shards()
+    yield app
+    db.session.remove()
+    # db registers a metadata per bind, which later apps without the shards
+    # would try to create
+    for name in shards.names():
+      db.metadatas.pop(shards.bind_key(name), None)
+
+
+def stored(database, table, *columns):
+  engine = db.engine if database == 'main' else db.engines[shards.bind_key(database)]
+  with engine.connect() as conn:
+    return sorted(conn.execute(sa.text('SELECT %s FROM "%s"' % (', '.join(columns), table))).all())
+
+
+def test_rows_land_on_the_shard_of_their_region(app, client, create_venue, create_artist, create_show):
+  create_venue(name='The Musical Hop', city='San Francisco', state='CA')
+  create_venue(name='Park Square', city='New York', state='NY')
+  # no region: DEFAULT_SHARD
+  create_venue(name='Lakeside', city='Austin', state='TX')
+  create_artist()
+  create_show(1, 1, '2035-04-01 20:00:00')
+  create_show(1, 2, '2035-04-02 20:00:00')
+
+  assert stored('west', 'Venue', 'id', 'name') == [(1, 'The Musical Hop')]
+  assert stored('east', 'Venue', 'id', 'name') == [(2, 'Park Square'), (3, 'Lakeside')]
+  assert stored('main', 'Venue', 'id') == []
+  assert stored('west', 'Show', 'venue_id') == [(1,)]
+  assert stored('east', 'Show', 'venue_id') == [(2,)]
+  assert stored('main', 'Show', 'id') == []
+  assert stored('main', 'Artist', 'id') == [(1,)]
+  assert stored('main', 'ShardDirectory', 'id', 'entity', 'shard') == [
+    (1, 'Venue', 'west'), (2, 'Venue', 'east'), (3, 'Venue', 'east'), (4, 'Show', 'west'), (5, 'Show', 'east'),
+  ]
+  assert stored('west', 'ShowCountByCity', 'city', 'count') == [('San Francisco', 1)]
+  assert stored('east', 'ShowCountByCity', 'city', 'count') == [('New York', 1)]
+
+
+def test_pages_merge_every_shard(app, client, create_venue, create_artist, create_show):
+  create_venue(name='The Musical Hop', city='San Francisco', state='CA')
+  create_venue(name='Park Square', city='New York', state='NY')
+  create_artist()
+  create_show(1, 1, '2035-04-01 20:00:00')
+  create_show(1, 2, '2035-04-02 20:00:00')
+
+  page = client.get('/venues').get_data(as_text=True)
+  assert 'The Musical Hop' in page and 'Park Square' in page
+  assert page.index('San Francisco') < page.index('New York')
+
+  page = client.get('/shows').get_data(as_text=True)
+  assert 'The Musical Hop' in page and 'Park Square' in page
+
+  page = client.get('/artists/1').get_data(as_text=True)
+  assert 'The Musical Hop' in page and 'Park Square' in page
+
+  assert client.get('/venues/2').status_code == 200
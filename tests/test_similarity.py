@@ -0,0 +1,62 @@
+import pytest
+
+import similarity
+from extensions import jobs
+from models import Job
+
+
+def scores(vectors):
+  return dict((artist_id, dict(similar)) for artist_id, similar in vectors.top_k(k=10))
+
+
+def test_refresh_reloads_only_the_changed_artists(app, client, create_venue, create_artist, create_show, monkeypatch):
+  create_venue(name='Hop')
+  create_venue(name='Park Square', city='New York', state='NY')
+  create_artist(name='A', genres=('Jazz', 'Blues'))
+  create_artist(name='B', genres=('Jazz',))
+  create_artist(name='C', genres=('Rock n Roll',))
+  create_show(1, 1, '2035-01-01 20:00:00')
+  create_show(2, 1, '2035-01-02 20:00:00')
+  jobs.run_pending()
+
+  loads = []
+  load_artist_vectors = similarity.load_artist_vectors
+  monkeypatch.setattr(similarity, 'load_artist_vectors', lambda: loads.append(1) or load_artist_vectors())
+
+  # changes that bring in new rows, genres and venues
+  create_artist(name='D', genres=('Folk', 'Jazz'))
+  create_show(3, 2, '2035-01-03 20:00:00')
+  create_show(4, 2, '2035-01-04 20:00:00')
+  client.patch('/artists/2', data=dict(version=1, genres=['Blues', 'Rock n Roll']))
+  client.delete('/artists/1')
+  assert jobs.run_pending() == 5
+  assert Job.query.count() == 0
+
+  assert loads == []
+  cached = similarity.vector_cache().vectors
+  fresh = load_artist_vectors()
+  for artist_id, similar in scores(fresh).items():
+    assert scores(cached)[artist_id] == pytest.approx(similar)
+  # the deleted artist scores zero against everyone
+  assert scores(cached)[1] == {}
+  assert all(1 not in similar for similar in scores(cached).values())
+
+
+def test_deleting_a_venue_refreshes_its_artists(app, client, create_venue, create_artist, create_show):
+  create_venue(name='Hop')
+  create_venue(name='Park Square', city='New York', state='NY')
+  create_artist(name='A')
+  create_artist(name='B')
+  create_show(1, 1, '2035-01-01 20:00:00')
+  create_show(2, 1, '2035-01-02 20:00:00')
+  create_show(1, 2, '2035-01-03 20:00:00')
+  jobs.run_pending()
+  assert scores(similarity.vector_cache().vectors)[1]
+
+  client.delete('/venues/1')
+  assert jobs.run_pending() == 2
+
+  cached = similarity.vector_cache().vectors
+  fresh = similarity.load_artist_vectors()
+  for artist_id, similar in scores(fresh).items():
+    assert scores(cached)[artist_id] == pytest.approx(similar)
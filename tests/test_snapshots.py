@@ -0,0 +1,68 @@
+import sqlite3
+
+import pytest
+
+
+@pytest.fixture
+def snapshot_path(app, client, create_venue, create_artist, create_show, tmp_path):
+  # a snapshot of one venue, artist and show, exported from the main database
+  create_venue()
+  create_artist()
+  create_show(artist_id=1, venue_id=1, start_time='2035-04-01 20:00')
+  path = tmp_path / 'snapshot.db'
+  result = app.test_cli_runner().invoke(args=['snapshot', 'export', str(path)])
+  assert result.exit_code == 0, result.output
+  return path
+
+
+def mirror(make_app, path, **overrides):
+  return make_app(SNAPSHOT_PATH=str(path), **overrides).test_client()
+
+
+def test_export_writes_a_complete_file(snapshot_path):
+  assert not snapshot_path.with_name('snapshot.db.building').exists()
+  connection = sqlite3.connect(str(snapshot_path))
+  try:
+    assert connection.execute('SELECT name FROM "Venue"').fetchall() == [('The Musical Hop',)]
+    assert connection.execute('SELECT count(*) FROM "Show"').fetchone() == (1,)
+    assert connection.execute('PRAGMA user_version').fetchone()[0] > 0
+  finally:
+    connection.close()
+
+
+def test_mirror_serves_pages_from_the_snapshot(make_app, snapshot_path, create_venue):
+  # written to the main database after the export
+  create_venue(name='Too New')
+  client = mirror(make_app, snapshot_path)
+
+  response = client.get('/venues')
+  assert b'The Musical Hop' in response.data and b'Too New' not in response.data
+  assert b'Guns N Petals' in client.get('/shows').data
+  assert b'The Musical Hop' in client.post('/venues/search', data={'search_term': 'hop'}).data
+
+
+def test_mirror_redirects_writes_to_the_origin(make_app, snapshot_path):
+  client = mirror(make_app, snapshot_path, SNAPSHOT_ORIGIN='https://fyyur.example.com/')
+
+  for method, path in (('POST', '/venues/create'), ('DELETE', '/venues/1'), ('GET', '/artists/1/edit'), ('GET', '/api/changes?since=0-1')):
+    response = client.open(path, method=method)
+    assert response.status_code == 307, path
+    assert response.headers['Location'] == 'https://fyyur.example.com' + path
+
+
+def test_mirror_without_origin_refuses_writes(make_app, snapshot_path):
+  client = mirror(make_app, snapshot_path)
+  assert client.post('/venues/create').status_code == 503
+  assert client.get('/venues/1').status_code == 200
+
+
+def test_mirror_switches_to_a_replaced_snapshot(app, make_app, snapshot_path, create_venue):
+  client = mirror(make_app, snapshot_path, SNAPSHOT_CHECK_INTERVAL=0)
+  assert b'Second Stage' not in client.get('/venues').data
+
+  create_venue(name='Second Stage')
+  result = app.test_cli_runner().invoke(args=['snapshot', 'export', str(snapshot_path)])
+  assert result.exit_code == 0, result.output
+
+  assert b'Second Stage' in client.get('/venues').data
+  assert b'fyyur_snapshot_swaps_total 1' in client.get('/metrics').data
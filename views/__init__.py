@@ -0,0 +1 @@
+# Blueprints registered by create_app() in app.py.
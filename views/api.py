@@ -0,0 +1,55 @@
+from flask import Blueprint, request, jsonify, abort
+
+from changes import read_changes
+from extensions import dbguard, event_stream
+
+bp = Blueprint('api', __name__, url_prefix='/api')
+
+MAX_PAGE_SIZE = 1000
+
+#  Change feed
+#  ----------------------------------------------------------------
+
+@bp.route('/changes')
+def changes():
+  # created/updated/deleted venues, artists and shows after cursor `since`,
+  # oldest first. Pass `next` back as `since` to resume; an empty page
+  # returns the same cursor.
+  since = request.args.get('since')
+  limit = min(request.args.get('limit', 500, type=int), MAX_PAGE_SIZE)
+  if limit < 1:
+    abort(400)
+  try:
+    rows, cursor = read_changes(since, limit)
+  except ValueError:
+    abort(400)
+
+  return jsonify({
+    'changes': [
+      {
+        'entity': row.entity,
+        'id': row.entity_id,
+        'action': row.action,
+        'changed_at': row.changed_at.isoformat() + 'Z',
+      }
+      for row in rows
+    ],
+    'next': cursor,
+    'has_more': len(rows) == limit,
+  })
+
+#  Show events
+#  ----------------------------------------------------------------
+
+@bp.route('/shows/events')
+@dbguard.exempt
+def show_events():
+  # server-sent events of created, updated and deleted shows, see events.py;
+  # ?venue_id= and ?artist_id= filter, Last-Event-ID or ?since= resumes
+  since = request.headers.get('Last-Event-ID') or request.args.get('since')
+  venue_ids = request.args.getlist('venue_id', type=int)
+  artist_ids = request.args.getlist('artist_id', type=int)
+  try:
+    return event_stream.stream(since, venue_ids, artist_ids)
+  except ValueError:
+    abort(400)
@@ -0,0 +1,280 @@
+import sys
+
+from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, abort, current_app
+from werkzeug.exceptions import HTTPException
+from sqlalchemy.orm.attributes import set_committed_value
+
+from extensions import db, jobs, limiter, dbguard
+from forms import ArtistForm
+from models import Venue, Artist, Show, upcoming_shows, past_shows, list_rows, upcoming_counts
+from helpers import ARTIST_FIELDS, EditConflict, submitted_values, patch_record, form_version, stream_page, STREAM_BATCH_SIZE
+from similarity import similar_artists
+from matching import match_data
+from entities import entity_cache
+from calendars import calendar_response
+from analytics import delete_archived_shows
+import shards
+
+bp = Blueprint('artists', __name__)
+
+#  Artists
+#  ----------------------------------------------------------------
+@bp.route('/artists')
+def artists():
+  # streamed: rows are rendered as the query yields them
+  def data():
+    for artist in list_rows(Artist).yield_per(STREAM_BATCH_SIZE):
+      artist_dict = dict()
+      artist_dict['id'] = artist.id
+      artist_dict['name'] = artist.name
+      yield artist_dict
+
+  return stream_page('pages/artists.html', artists=data())
+
+@bp.route('/artists/search', methods=['POST'])
+@limiter.limit('search')
+@dbguard.timeout('search')
+def search_artists():
+  # search on artists with partial string search, case-insensitive.
+  # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
+  # search for "band" should return "The Wild Sax Band".
+  search_term=request.form.get('search_term', '')
+
+  response = dict()
+  response['count'] = 0
+  response['data'] = []
+
+  # shows may live on other databases than artists, so they are counted
+  # separately rather than joined in
+  artists = list_rows(Artist, search_term=search_term).all()
+  counts = upcoming_counts('artist_id', [artist.id for artist in artists])
+  for artist in artists:
+    response['count'] += 1
+    res_dict = dict()
+    res_dict['id'] = artist.id
+    res_dict['name'] = artist.name
+    res_dict['num_upcoming_shows'] = counts.get(artist.id, 0)
+
+    response['data'].append(res_dict)
+
+  return render_template('pages/search_artists.html', results=response, search_term=search_term)
+
+@bp.route('/artists/<int:artist_id>')
+def show_artist(artist_id):
+  # shows the artist page with the given artist_id
+  artist = entity_cache.get(Artist, artist_id)
+  if artist is None:
+    abort(404)
+
+  data = dict()
+  data['id'] = artist['id']
+  data['name'] = artist['name']
+  data['genres'] = artist['genres'].split(', ')
+  data['city'] = artist['city']
+  data['state'] = artist['state']
+  data['phone'] = artist['phone']
+  data['website'] = artist['website']
+  data['facebook_link'] = artist['facebook_link']
+  data['seeking_venue'] = artist['seeking_venue']
+  data['seeking_description'] = artist['seeking_description']
+  data['image_link'] = artist['image_link']
+
+  data['past_shows'] = []
+  data['upcoming_shows'] = []
+
+  upcoming = sorted(shards.gather(lambda: upcoming_shows(artist_id=artist_id).all()), key=lambda show: show.start_time)
+  past = sorted(shards.gather(lambda: past_shows(artist_id=artist_id)), key=lambda show: show.start_time, reverse=True)
+  venues = entity_cache.get_many(Venue, [show.venue_id for show in upcoming + past])
+  for shows, key in ((upcoming, 'upcoming_shows'), (past, 'past_shows')):
+    for show in shows:
+      venue = venues.get(show.venue_id)
+      if venue is None:
+        # the venue has been deleted
+        continue
+      show_dict = dict()
+      show_dict['venue_id'] = show.venue_id
+
+      show_dict['venue_name'] = venue['name']
+      show_dict['venue_image_link'] = venue['image_link']
+      show_dict['start_time'] = str(show.start_time)
+
+      data[key].append(show_dict)
+
+  data['upcoming_shows_count'] = len(data['upcoming_shows'])
+  data['past_shows_count'] = len(data['past_shows'])
+
+  data['similar_artists'] = similar_artists(artist_id)
+  data['matches'] = match_data('artist', artist_id) if artist['seeking_venue'] else []
+
+  return render_template('pages/show_artist.html', artist=data)
+
+@bp.route('/artists/<int:artist_id>/matches')
+def artist_matches(artist_id):
+  # venues seeking talent that best fit this artist
+  return jsonify({'artist_id': artist_id, 'matches': match_data('artist', artist_id)})
+
+@bp.route('/artists/<int:artist_id>/calendar.ics')
+def artist_calendar(artist_id):
+  # upcoming shows of this artist as an iCalendar feed
+  return calendar_response(Artist, artist_id)
+
+#  Create Artist
+#  ----------------------------------------------------------------
+
+@bp.route('/artists/create', methods=['GET'])
+def create_artist_form():
+  form = ArtistForm()
+  return render_template('forms/new_artist.html', form=form)
+
+@bp.route('/artists/create', methods=['POST'])
+def create_artist_submission():
+  error = False
+  try:
+    name = request.form['name']
+    city = request.form['city']
+    state = request.form['state']
+    phone = request.form['phone']
+    genres = ', '.join(request.form.getlist('genres'))
+    website = request.form['website']
+    image_link = request.form['image_link']
+    facebook_link = request.form['facebook_link']
+    seeking_venue = 'seeking_venue' in [field for (field, _) in request.form.items()]
+    seeking_description = request.form['seeking_description']
+
+    artist = Artist(
+      name=name,
+      city=city,
+      state=state,
+      phone=phone,
+      genres=genres,
+      website=website,
+      image_link=image_link,
+      facebook_link=facebook_link,
+      seeking_venue=seeking_venue,
+      seeking_description=seeking_description
+    )
+
+    db.session.add(artist)
+    db.session.flush()
+    jobs.enqueue('artist_changed', artist_id=artist.id, action='created')
+    db.session.commit()
+  except:
+    e = str(sys.exc_info()[0]) + ': ' + str(sys.exc_info()[1])
+    error = True
+    db.session.rollback()
+  finally:
+    db.session.close()
+  if error:
+    flash('An error occurred. Artist ' + request.form['name'] + ' could not be listed. ' + e)
+  else:
+    flash('Artist ' + request.form['name'] + ' was successfully listed!')
+  return render_template('pages/home.html')
+
+#  Update Artist
+#  ----------------------------------------------------------------
+
+@bp.route('/artists/<int:artist_id>/edit', methods=['GET'])
+def edit_artist(artist_id):
+  form = ArtistForm()
+
+  artist = entity_cache.get(Artist, artist_id)
+  if artist is None:
+    abort(404)
+  artist['genres'] = artist['genres'].split(', ')
+
+  form.genres.default = artist['genres']
+  form.state.default = artist['state']
+  form.seeking_venue.default = artist['seeking_venue']
+  form.process()
+
+  return render_template('forms/edit_artist.html', form=form, artist=artist)
+
+@bp.route('/artists/<int:artist_id>/edit', methods=['POST'])
+def edit_artist_submission(artist_id):
+  # take values from the form submitted, and update existing
+  # artist record with ID <artist_id> using the new attributes
+  version = form_version()
+  error = False
+  conflict = False
+  try:
+    record, changed = patch_record(Artist, artist_id, version, submitted_values(ARTIST_FIELDS))
+    if changed:
+      jobs.enqueue('artist_changed', artist_id=artist_id, action='updated')
+    db.session.commit()
+  except EditConflict:
+    conflict = True
+    db.session.rollback()
+  except HTTPException:
+    # e.g. the 404 of a record deleted meanwhile
+    db.session.rollback()
+    raise
+  except:
+    e = str(sys.exc_info()[0]) + ': ' + str(sys.exc_info()[1])
+    error = True
+    db.session.rollback()
+  finally:
+    db.session.close()
+  if conflict:
+    flash('Artist ' + request.form['name'] + ' was changed by someone else while you were editing. Review the current details and try again.')
+    return redirect(url_for('artists.edit_artist', artist_id=artist_id))
+  if error:
+    flash('An error occurred. Artist ' + request.form['name'] + ' could not be updated. ' + e)
+  else:
+    flash('Artist ' + request.form['name'] + ' was successfully updated!')
+
+  return redirect(url_for('artists.show_artist', artist_id=artist_id))
+
+@bp.route('/artists/<int:artist_id>', methods=['PATCH'])
+def patch_artist(artist_id):
+  # apply a partial update: only the submitted fields are compared and written
+  version = form_version()
+  try:
+    record, changed = patch_record(Artist, artist_id, version, submitted_values(ARTIST_FIELDS, partial=True))
+    if changed:
+      jobs.enqueue('artist_changed', artist_id=artist_id, action='updated')
+    version = record.version
+    db.session.commit()
+  except EditConflict as conflict:
+    db.session.rollback()
+    return jsonify({'error': 'conflict', 'version': conflict.version}), 409
+  finally:
+    db.session.close()
+
+  return jsonify({'id': artist_id, 'version': version, 'changed': changed})
+
+#  Delete Artist
+#  ----------------------------------------------------------------
+
+@bp.route('/artists/<artist_id>', methods=['DELETE'])
+def delete_artist(artist_id):
+  # Take an artist_id and delete that venue
+  error = False
+  artist = Artist.query.get(artist_id)
+  if artist is None:
+    abort(404)
+  artist_name = artist.name
+  try:
+    if shards.enabled():
+      # the shows are on the shards: delete them there, then tell the ORM
+      # there is nothing left to cascade to
+      def delete_shows():
+        for show in Show.query.filter_by(artist_id=artist.id):
+          db.session.delete(show)
+        db.session.flush()
+      shards.fan_out(delete_shows)
+      set_committed_value(artist, 'shows', [])
+    shards.fan_out(lambda: delete_archived_shows(artist_id=artist.id))
+    db.session.delete(artist)
+    jobs.enqueue('artist_changed', artist_id=artist.id, action='deleted')
+    db.session.commit()
+  except:
+    current_app.logger.exception('deleting artist %s failed', artist_id)
+    error = True
+    db.session.rollback()
+  finally:
+    db.session.close()
+  if error:
+    flash('An error occurred. Artist ' + artist_name + ' could not be deleted.')
+  else:
+    flash('Artist ' + artist_name + ' was successfully deleted!')
+  return render_template('pages/home.html')
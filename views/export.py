@@ -0,0 +1,22 @@
+from flask import Blueprint, Response, request, abort, stream_with_context
+
+from extensions import limiter, dbguard
+from exports import EXPORTS, FORMATS, export_chunks
+
+bp = Blueprint('export', __name__, url_prefix='/export')
+
+#  Export
+#  ----------------------------------------------------------------
+
+@bp.route('/<name>')
+@limiter.limit('export')
+@dbguard.timeout('export')
+def export(name):
+  # /export/venues, /export/artists or /export/shows, ?format=csv (default)
+  # or ?format=ndjson, streamed as the rows are read
+  format = request.args.get('format', 'csv')
+  if name not in EXPORTS or format not in FORMATS:
+    abort(404)
+  response = Response(stream_with_context(export_chunks(name, format)), mimetype=FORMATS[format])
+  response.headers['Content-Disposition'] = 'attachment; filename=%s.%s' % (name, format)
+  return response
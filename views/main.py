@@ -0,0 +1,36 @@
+from flask import Blueprint, render_template, jsonify, Response
+
+from analytics import analytics_data
+from extensions import limiter, dbguard, snapshot, bus, static_pages, profiler, event_stream
+from entities import entity_cache
+from calendars import feed_cache
+
+bp = Blueprint('main', __name__)
+
+@bp.route('/')
+def index():
+  return render_template('pages/home.html')
+
+#  Analytics
+#  ----------------------------------------------------------------
+
+@bp.route('/analytics')
+def analytics():
+  return render_template('pages/analytics.html', analytics=analytics_data())
+
+@bp.route('/analytics.json')
+def analytics_json():
+  return jsonify(analytics_data())
+
+#  Metrics
+#  ----------------------------------------------------------------
+
+@bp.route('/metrics')
+@dbguard.exempt
+def metrics():
+  # Prometheus text format; values are for this worker process
+  data = dict()
+  for source in (dbguard, limiter, entity_cache, feed_cache, snapshot, bus, static_pages, profiler, event_stream):
+    data.update(source.metrics())
+  lines = ['%s %s' % (name, value) for name, value in sorted(data.items())]
+  return Response('\n'.join(lines) + '\n', mimetype='text/plain')
@@ -0,0 +1,61 @@
+from datetime import datetime
+from functools import wraps
+
+from flask import Blueprint, render_template, request, jsonify, abort, Response
+
+from extensions import profiler, dbguard
+from profiling import flame_frames
+
+bp = Blueprint('profiles', __name__, url_prefix='/admin/profiles')
+
+SORT_KEYS = ('cumulative', 'total', 'calls')
+
+@bp.app_template_filter('timestamp')
+def format_timestamp(value):
+  return datetime.utcfromtimestamp(value).strftime('%Y-%m-%d %H:%M:%S UTC')
+
+def token_required(view):
+  # PROFILE_TOKEN as the basic auth password (or the X-Fyyur-Profile header)
+  @wraps(view)
+  def protected(*args, **kwargs):
+    if not profiler.token:
+      abort(404)
+    if not profiler.authorized():
+      return Response('Profiles need the profiling token.\n', status=401, mimetype='text/plain',
+        headers={'WWW-Authenticate': 'Basic realm="Fyyur profiles"'})
+    return view(*args, **kwargs)
+  return protected
+
+#  Profiles
+#  ----------------------------------------------------------------
+
+@bp.route('')
+@dbguard.exempt
+@token_required
+def profiles():
+  return render_template('pages/profiles.html', profiles=profiler.store.recent())
+
+@bp.route('/<id>')
+@dbguard.exempt
+@token_required
+def profile(id):
+  # ?sort=cumulative (default), total or calls orders the function table
+  profile = profiler.store.get(id)
+  if profile is None:
+    abort(404)
+  sort = request.args.get('sort', 'cumulative')
+  if sort not in SORT_KEYS:
+    sort = 'cumulative'
+  functions = sorted(profile['functions'], key=lambda row: row[sort], reverse=True)
+  queries = sorted(profile['queries'], key=lambda query: query['duration'], reverse=True)
+  return render_template('pages/profile.html', profile=profile, functions=functions, queries=queries,
+    frames=flame_frames(profile['stacks']), sort=sort, sort_keys=SORT_KEYS)
+
+@bp.route('/<id>.json')
+@dbguard.exempt
+@token_required
+def profile_json(id):
+  profile = profiler.store.get(id)
+  if profile is None:
+    abort(404)
+  return jsonify(profile)
@@ -0,0 +1,96 @@
+from itertools import islice
+
+from flask import Blueprint, render_template, request, flash
+
+from extensions import db, jobs
+from forms import ShowForm
+from models import Venue, Artist, Show
+from helpers import stream_page, STREAM_BATCH_SIZE
+from entities import entity_cache
+import shards
+
+bp = Blueprint('shows', __name__)
+
+def parse_datetime(value):
+  # dateutil is only needed when a show is submitted
+  import dateutil.parser
+  return dateutil.parser.parse(value)
+
+#  Shows
+#  ----------------------------------------------------------------
+
+@bp.route('/shows')
+def shows():
+  # displays list of shows at /shows, streamed as the query yields rows
+  def data():
+    # only the three columns the page needs, names come from the entity cache;
+    # with shards, their streams are merged by start time
+    rows = shards.merge_streams(
+      lambda: db.session.query(Show.venue_id, Show.artist_id, Show.start_time)
+        .order_by(Show.start_time)
+        .yield_per(STREAM_BATCH_SIZE),
+      key=lambda show: show.start_time
+    )
+    while True:
+      batch = list(islice(rows, STREAM_BATCH_SIZE))
+      if not batch:
+        return
+      venues = entity_cache.get_many(Venue, [show.venue_id for show in batch])
+      artists = entity_cache.get_many(Artist, [show.artist_id for show in batch])
+      for show in batch:
+        show_dict = dict()
+        show_dict['venue_id'] = show.venue_id
+
+        venue = venues[show.venue_id]
+        show_dict['venue_name'] = venue['name']
+
+        show_dict['artist_id'] = show.artist_id
+
+        artist = artists[show.artist_id]
+        show_dict['artist_name'] = artist['name']
+        show_dict['artist_image_link'] = artist['image_link']
+
+        show_dict['start_time'] = str(show.start_time)
+
+        yield show_dict
+
+  return stream_page('pages/shows.html', shows=data())
+
+#  Create Show
+#  ----------------------------------------------------------------
+
+@bp.route('/shows/create')
+def create_shows():
+  # renders form. do not touch.
+  form = ShowForm()
+  return render_template('forms/new_show.html', form=form)
+
+@bp.route('/shows/create', methods=['POST'])
+def create_show_submission():
+  error = False
+  try:
+    artist_id = request.form['artist_id']
+    venue_id = request.form['venue_id']
+    start_time = parse_datetime(request.form['start_time'])
+
+    with shards.for_venue(venue_id):
+      show = Show(
+        id=shards.new_id('Show'),
+        artist_id=artist_id,
+        venue_id=venue_id,
+        start_time=start_time
+      )
+      db.session.add(show)
+      db.session.flush()
+      jobs.enqueue('show_changed', show_id=show.id, venue_id=int(venue_id), artist_id=int(artist_id), action='created')
+      db.session.commit()
+  except:
+    error = True
+    db.session.rollback()
+  finally:
+    db.session.close()
+  if error:
+    flash('An error occurred. Show could not be listed.')
+  else:
+    flash('Show was successfully listed!')
+  return render_template('pages/home.html')
@@ -0,0 +1,284 @@
+import sys
+
+from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, abort, current_app
+from werkzeug.exceptions import HTTPException
+
+from extensions import db, jobs, limiter, dbguard
+from forms import VenueForm
+from models import Venue, Artist, ShowArchive, upcoming_shows, past_shows, list_rows
+from helpers import VENUE_FIELDS, EditConflict, submitted_values, patch_record, form_version
+from matching import match_data
+from entities import entity_cache
+from calendars import calendar_response
+from analytics import delete_archived_shows
+import shards
+
+bp = Blueprint('venues', __name__)
+
+#  Venues
+#  ----------------------------------------------------------------
+
+@bp.route('/venues')
+def venues():
+  data = []
+  areas = dict()
+  rows = shards.gather(lambda: list_rows(Venue, ('id', 'name', 'city', 'state'), count_upcoming=True).all())
+  for venue in sorted(rows, key=lambda venue: venue.id):
+    city_state = areas.get((venue.city, venue.state))
+    if city_state is None:
+      city_state = dict()
+      city_state['city'] = venue.city
+      city_state['state'] = venue.state
+      city_state['venues'] = []
+      areas[(venue.city, venue.state)] = city_state
+      data.append(city_state)
+
+    venue_dict = dict()
+    venue_dict['id'] = venue.id
+    venue_dict['name'] = venue.name
+    venue_dict['num_upcoming_shows'] = venue.num_upcoming_shows
+
+    city_state['venues'].append(venue_dict)
+
+  return render_template('pages/venues.html', areas=data);
+
+@bp.route('/venues/search', methods=['POST'])
+@limiter.limit('search')
+@dbguard.timeout('search')
+def search_venues():
+  # search on artists with partial string search, case-insensitive.
+  # seach for Hop should return "The Musical Hop".
+  # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
+
+  search_term=request.form.get('search_term', '')
+
+  response = dict()
+  response['count'] = 0
+  response['data'] = []
+
+  rows = shards.gather(lambda: list_rows(Venue, search_term=search_term, count_upcoming=True).all())
+  for venue in sorted(rows, key=lambda venue: venue.id):
+    response['count'] += 1
+    res_dict = dict()
+    res_dict['id'] = venue.id
+    res_dict['name'] = venue.name
+    res_dict['num_upcoming_shows'] = venue.num_upcoming_shows
+
+    response['data'].append(res_dict)
+
+  return render_template('pages/search_venues.html', results=response, search_term=search_term)
+
+@bp.route('/venues/<int:venue_id>')
+def show_venue(venue_id):
+  # shows the venue page with the given venue_id
+  venue = entity_cache.get(Venue, venue_id)
+  if venue is None:
+    abort(404)
+
+  data = dict()
+  data['id'] = venue['id']
+  data['name'] = venue['name']
+  data['genres'] = venue['genres'].split(', ')
+  data['address'] = venue['address']
+  data['city'] = venue['city']
+  data['state'] = venue['state']
+  data['phone'] = venue['phone']
+  data['website'] = venue['website']
+  data['facebook_link'] = venue['facebook_link']
+  data['seeking_talent'] = venue['seeking_talent']
+  data['seeking_description'] = venue['seeking_description']
+  data['image_link'] = venue['image_link']
+
+  data['past_shows'] = []
+  data['upcoming_shows'] = []
+
+  with shards.for_venue(venue_id):
+    upcoming = upcoming_shows(venue_id=venue_id).all()
+    past = past_shows(venue_id=venue_id)
+  artists = entity_cache.get_many(Artist, [show.artist_id for show in upcoming + past])
+  for shows, key in ((upcoming, 'upcoming_shows'), (past, 'past_shows')):
+    for show in shows:
+      artist = artists.get(show.artist_id)
+      if artist is None:
+        # the artist has been deleted
+        continue
+      show_dict = dict()
+      show_dict['artist_id'] = show.artist_id
+
+      show_dict['artist_name'] = artist['name']
+      show_dict['artist_image_link'] = artist['image_link']
+      show_dict['start_time'] = str(show.start_time)
+
+      data[key].append(show_dict)
+
+  data['upcoming_shows_count'] = len(data['upcoming_shows'])
+  data['past_shows_count'] = len(data['past_shows'])
+
+  data['matches'] = match_data('venue', venue_id) if venue['seeking_talent'] else []
+
+  return render_template('pages/show_venue.html', venue=data)
+
+@bp.route('/venues/<int:venue_id>/matches')
+def venue_matches(venue_id):
+  # artists seeking a venue that best fit this venue
+  return jsonify({'venue_id': venue_id, 'matches': match_data('venue', venue_id)})
+
+@bp.route('/venues/<int:venue_id>/calendar.ics')
+def venue_calendar(venue_id):
+  # upcoming shows at this venue as an iCalendar feed
+  return calendar_response(Venue, venue_id)
+
+#  Create Venue
+#  ----------------------------------------------------------------
+
+@bp.route('/venues/create', methods=['GET'])
+def create_venue_form():
+  form = VenueForm()
+  return render_template('forms/new_venue.html', form=form)
+
+@bp.route('/venues/create', methods=['POST'])
+def create_venue_submission():
+  error = False
+  try:
+    name = request.form['name']
+    city = request.form['city']
+    state = request.form['state']
+    address = request.form['address']
+    phone = request.form['phone']
+    genres = ', '.join(request.form.getlist('genres'))
+    website = request.form['website']
+    image_link = request.form['image_link']
+    facebook_link = request.form['facebook_link']
+    seeking_talent = 'seeking_talent' in [field for (field, _) in request.form.items()]
+    seeking_description = request.form['seeking_description']
+
+    with shards.for_state(state):
+      venue = Venue(
+        id=shards.new_id('Venue'),
+        name=name,
+        city=city,
+        state=state,
+        address=address,
+        phone=phone,
+        genres=genres,
+        website=website,
+        image_link=image_link,
+        facebook_link=facebook_link,
+        seeking_talent=seeking_talent,
+        seeking_description=seeking_description
+      )
+      db.session.add(venue)
+      db.session.commit()
+  except:
+    e = str(sys.exc_info()[0]) + ': ' + str(sys.exc_info()[1])
+    error = True
+    db.session.rollback()
+  finally:
+    db.session.close()
+  if error:
+    flash('An error occurred. Venue ' + request.form['name'] + ' could not be listed. ' + e)
+  else:
+    flash('Venue ' + request.form['name']+ ' was successfully listed!')
+  return render_template('pages/home.html')
+
+#  Update Venue
+#  ----------------------------------------------------------------
+
+@bp.route('/venues/<int:venue_id>/edit', methods=['GET'])
+def edit_venue(venue_id):
+  form = VenueForm()
+
+  venue = entity_cache.get(Venue, venue_id)
+  if venue is None:
+    abort(404)
+  venue['genres'] = venue['genres'].split(', ')
+
+  form.genres.default = venue['genres']
+  form.state.default = venue['state']
+  form.seeking_talent.default = venue['seeking_talent']
+  form.process()
+
+  return render_template('forms/edit_venue.html', form=form, venue=venue)
+
+@bp.route('/venues/<int:venue_id>/edit', methods=['POST'])
+def edit_venue_submission(venue_id):
+  # take values from the form submitted, and update existing
+  # venue record with ID <venue_id> using the new attributes
+  version = form_version()
+  error = False
+  conflict = False
+  try:
+    with shards.for_venue(venue_id):
+      patch_record(Venue, venue_id, version, submitted_values(VENUE_FIELDS))
+      db.session.commit()
+  except EditConflict:
+    conflict = True
+    db.session.rollback()
+  except HTTPException:
+    # e.g. the 404 of a record deleted meanwhile
+    db.session.rollback()
+    raise
+  except:
+    e = str(sys.exc_info()[0]) + ': ' + str(sys.exc_info()[1])
+    error = True
+    db.session.rollback()
+  finally:
+    db.session.close()
+  if conflict:
+    flash('Venue ' + request.form['name'] + ' was changed by someone else while you were editing. Review the current details and try again.')
+    return redirect(url_for('venues.edit_venue', venue_id=venue_id))
+  if error:
+    flash('An error occurred. Venue ' + request.form['name'] + ' could not be updated. ' + e)
+  else:
+    flash('Venue ' + request.form['name']+ ' was successfully updated!')
+
+  return redirect(url_for('venues.show_venue', venue_id=venue_id))
+
+@bp.route('/venues/<int:venue_id>', methods=['PATCH'])
+def patch_venue(venue_id):
+  # apply a partial update: only the submitted fields are compared and written
+  version = form_version()
+  with shards.for_venue(venue_id):
+    try:
+      record, changed = patch_record(Venue, venue_id, version, submitted_values(VENUE_FIELDS, partial=True))
+      version = record.version
+      db.session.commit()
+    except EditConflict as conflict:
+      db.session.rollback()
+      return jsonify({'error': 'conflict', 'version': conflict.version}), 409
+    finally:
+      db.session.close()
+
+  return jsonify({'id': venue_id, 'version': version, 'changed': changed})
+
+#  Delete Venue
+#  ----------------------------------------------------------------
+
+@bp.route('/venues/<venue_id>', methods=['DELETE'])
+def delete_venue(venue_id):
+  # Take a venue_id and delete that venue, together with its shows
+  error = False
+  with shards.for_venue(venue_id):
+    venue = Venue.query.get(venue_id)
+    if venue is None:
+      abort(404)
+    venue_name = venue.name
+    try:
+      # the shows go too, and with them an appearance of each artist
+      for show in venue.shows + ShowArchive.query.filter_by(venue_id=venue.id).all():
+        if show.artist_id is not None:
+          jobs.enqueue('show_changed', show_id=show.id, venue_id=venue.id, artist_id=show.artist_id, action='deleted')
+      delete_archived_shows(venue_id=venue.id)
+      db.session.delete(venue)
+      db.session.commit()
+    except:
+      current_app.logger.exception('deleting venue %s failed', venue_id)
+      error = True
+      db.session.rollback()
+    finally:
+      db.session.close()
+  if error:
+    flash('An error occurred. Venue ' + venue_name + ' could not be deleted.')
+  else:
+    flash('Venue ' + venue_name + ' was successfully deleted!')
+  return render_template('pages/home.html')
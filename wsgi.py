@@ -0,0 +1,15 @@
+# Production entry point: gunicorn -c gunicorn.conf.py wsgi:application
+#
+# The app is built once in the gunicorn master (preload_app) so workers
+# inherit the imported code copy-on-write; database connections are only
+# opened in the workers, see post_fork in gunicorn.conf.py.
+
+import os
+
+from app import create_app
+
+application = create_app(os.environ.get('FYYUR_CONFIG', 'prod'))
+
+if application.config.get('PRELOAD_TEMPLATES'):
+  for name in application.jinja_env.list_templates(extensions=['html']):
+    application.jinja_env.get_template(name)